@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import sklearn
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from metrics import METRICS
+from model import DiseasePredictor
+from nlp_processor import SymptomExtractor
+from typos import misspell
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+MODEL_BUNDLE_PATH = os.path.join(ROOT, "models", "disease_predictor.joblib")
+
+TEMPLATES = [
+    "I have {symptoms}",
+    "I've had {symptoms} for {days} days",
+    "Since yesterday I am suffering from {symptoms}.",
+    "my doctor asked me to describe it: {symptoms}, and it gets worse at night",
+    "{symptoms}",
+    "Hi, I'm not feeling well. There is {symptoms} and I can't sleep",
+]
+FILLER = ["really bad", "a little", "constant", "on and off", "mild", "severe"]
+
+# A baseline is only comparable when it was run with the same options, and
+# its timings only mean much on the same kind of machine and libraries
+COMPARED_CONFIG = ("offline", "iterations", "warmup", "instrumented")
+COMPARED_ENVIRONMENT = ("cpus", "sklearn", "numpy")
+
+# Peak RSS of the probe process itself. ru_maxrss survives exec on Linux, so
+# a child forked from this (already large) process would report our peak.
+PEAK_MB = """
+def peak_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+"""
+
+# Runs in a fresh interpreter so imports, bundle loading and NLTK loading all
+# count. Mirrors app.load_models, which needs Streamlit to import.
+COLD_START_PROBE = """
+import json, resource, sys, time
+{peak_mb}
+start = time.perf_counter()
+sys.path.insert(0, {src!r})
+from model import DiseasePredictor
+from nlp_processor import SymptomExtractor
+from suggestions import SymptomSuggester
+predictor = DiseasePredictor.load_or_train({bundle!r}, {data!r})
+extractor = SymptomExtractor(offline={offline!r})
+extractor.get_matcher(predictor.symptom_index)
+suggester = SymptomSuggester.from_predictor(predictor)
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "peak_mb": peak_mb()}}))
+"""
+
+TRAIN_PROBE = """
+import json, resource, sys, time
+{peak_mb}
+sys.path.insert(0, {src!r})
+from model import DiseasePredictor
+start = time.perf_counter()
+DiseasePredictor().train({data!r}, n_jobs={n_jobs!r})
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "peak_mb": peak_mb()}}))
+"""
+
+
+def synthetic_utterances(symptom_columns, n, seed=0, typo_rate=0.1):
+    # Chat messages naming 1-4 symptoms in free text, some of them misspelled
+    rng = random.Random(seed)
+    phrases = [column.replace("_", " ").strip() for column in symptom_columns]
+    utterances = []
+    for _ in range(n):
+        named = []
+        for phrase in rng.sample(phrases, rng.randint(1, 4)):
+            words = [misspell(w, rng, 1) if len(w) > 3 and rng.random() < typo_rate else w for w in phrase.split()]
+            if rng.random() < 0.3:
+                words.insert(0, rng.choice(FILLER))
+            named.append(" ".join(words))
+        symptoms = ", ".join(named[:-1]) + " and " + named[-1] if len(named) > 1 else named[0]
+        utterances.append(rng.choice(TEMPLATES).format(symptoms=symptoms, days=rng.randint(1, 14)))
+    return utterances
+
+
+def random_cases(symptoms, n, seed=0):
+    # Symptom lists as the app passes them to predict(), 3-6 symptoms each
+    rng = np.random.default_rng(seed)
+    return [list(rng.choice(symptoms, size=size, replace=False)) for size in rng.integers(3, 7, size=n)]
+
+
+def summarize(seconds, peak_mb):
+    ms = np.asarray(seconds) * 1000
+    return {
+        'n': len(ms),
+        'mean_ms': float(ms.mean()),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'throughput_per_s': float(len(ms) / (ms.sum() / 1000)),
+        'peak_mb': peak_mb
+    }
+
+
+def time_calls(fn, inputs, warmup):
+    for item in inputs[:warmup]:
+        fn(item)
+    seconds = []
+    for item in inputs:
+        start = time.perf_counter()
+        fn(item)
+        seconds.append(time.perf_counter() - start)
+
+    # Peak Python/NumPy allocation of one call, measured separately so the
+    # tracing overhead stays out of the timings
+    peak = 0
+    for item in inputs[:min(len(inputs), 50)]:
+        tracemalloc.start()
+        fn(item)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return summarize(seconds, peak / 2**20)
+
+
+def time_probe(code, runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return summarize([r['seconds'] for r in results], max(r['peak_mb'] for r in results))
+
+
+def run(args):
+    predictor = DiseasePredictor.load_or_train(MODEL_BUNDLE_PATH, TRAINING_DATA_PATH)
+    # Time the models themselves, not the cache or the precomputed table
+    predictor.cache = None
+    predictor.posterior_table = None
+    extractor = SymptomExtractor(offline=args.offline)
+    symptom_index = predictor.symptom_index
+    extractor.get_matcher(symptom_index)
+
+    utterances = synthetic_utterances(predictor.symptom_columns, args.iterations, args.seed, args.typo_rate)
+    cases = random_cases(list(symptom_index), args.iterations, args.seed)
+    rows = [predictor.symptom_matrix([case]) for case in cases]
+    models = predictor.snapshot()
+
+    stages = {}
+    stages['preprocess_text'] = time_calls(extractor.preprocess_text, utterances, args.warmup)
+    stages['extract_symptoms'] = time_calls(lambda text: extractor.extract_symptoms(text, symptom_index), utterances, args.warmup)
+    stages['predict'] = time_calls(predictor.predict, cases, args.warmup)
+    for name in ('svm', 'nb', 'rf', 'gb'):
+        stages[f'predict_proba.{name}'] = time_calls(models[name].predict_proba, rows, args.warmup)
+
+    if args.cold_start_runs:
+        code = COLD_START_PROBE.format(
+            peak_mb=PEAK_MB, src=os.path.join(ROOT, "src"), bundle=MODEL_BUNDLE_PATH,
+            data=TRAINING_DATA_PATH, offline=args.offline
+        )
+        stages['load_models'] = time_probe(code, args.cold_start_runs)
+    if args.train_runs:
+        code = TRAIN_PROBE.format(peak_mb=PEAK_MB, src=os.path.join(ROOT, "src"), data=TRAINING_DATA_PATH, n_jobs=args.n_jobs)
+        stages['train'] = time_probe(code, args.train_runs)
+
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'config': {
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'seed': args.seed,
+            'typo_rate': args.typo_rate,
+            'offline': args.offline,
+            'instrumented': args.instrumented,
+            'model_version': predictor.version
+        },
+        'stages': stages
+    }
+
+
+def differences(results, baseline, section, keys):
+    return [
+        f"{key}: {results[section].get(key)!r} vs baseline {baseline[section].get(key)!r}"
+        for key in keys if results[section].get(key) != baseline.get(section, {}).get(key)
+    ]
+
+
+def compare(results, baseline, metrics, tolerance):
+    # Stages that got slower (or bigger) than the baseline by more than the
+    # tolerance; stages missing from either side are skipped. Runs with other
+    # options time different work, so they aren't compared at all.
+    mismatched = differences(results, baseline, 'config', COMPARED_CONFIG)
+    if mismatched:
+        raise ValueError("the baseline was run with other options: " + "; ".join(mismatched))
+    regressions = []
+    for stage, current in results['stages'].items():
+        previous = baseline['stages'].get(stage)
+        if previous is None:
+            continue
+        for metric in metrics:
+            if previous.get(metric) and current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f"{stage} {metric}: {current[metric]:.3f} vs baseline {previous[metric]:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency, throughput and memory benchmark of the chat pipeline")
+    parser.add_argument("--iterations", type=int, default=500, help="calls timed per in-process stage")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--cold-start-runs", type=int, default=3, help="0 skips the load_models cold start")
+    parser.add_argument("--train-runs", type=int, default=1, help="0 skips training")
+    parser.add_argument("--n-jobs", type=int, default=1, help="cores for the training stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--typo-rate", type=float, default=0.1, help="share of symptom words misspelled")
+    parser.add_argument("--offline", action="store_true", help="use the offline NLP resources")
+    parser.add_argument("--instrumented", action="store_true", help="run with METRICS enabled, to measure its overhead")
+    parser.add_argument("--output", help="write the results JSON here as well as to stdout")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--save-baseline", help="write the results JSON here as the new baseline")
+    parser.add_argument("--metrics", nargs="+", default=["p50_ms", "p95_ms"], help="metrics compared to the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    args = parser.parse_args()
+
+    METRICS.enabled = args.instrumented
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    print(text)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for difference in differences(results, baseline, 'environment', COMPARED_ENVIRONMENT):
+            print(f"Warning: environment differs from {args.baseline}, {difference}", file=sys.stderr)
+        try:
+            regressions = compare(results, baseline, args.metrics, args.tolerance)
+        except ValueError as e:
+            print(f"Not comparing with {args.baseline}: {e}", file=sys.stderr)
+            sys.exit(2)
+        if regressions:
+            print(f"{len(regressions)} regressions beyond {args.tolerance:.0%} of {args.baseline}:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} of {args.baseline}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from model import DiseasePredictor
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+MODEL_BUNDLE_PATH = os.path.join(ROOT, "models", "disease_predictor.joblib")
+
+
+def random_cases(symptoms, n, rng):
+    # Intake-style records with 3-6 distinct symptoms each
+    sizes = rng.integers(3, 7, size=n)
+    return [list(rng.choice(symptoms, size=size, replace=False)) for size in sizes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DiseasePredictor.predict_batch throughput")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000, 10000, 100000])
+    parser.add_argument("--parity-rows", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    predictor = DiseasePredictor.load_or_train(MODEL_BUNDLE_PATH, TRAINING_DATA_PATH)
+    symptoms = list(predictor.symptom_index)
+    rng = np.random.default_rng(args.seed)
+
+    # Batch results must be identical to scoring each case on its own
+    cases = random_cases(symptoms, args.parity_rows, rng)
+    start = time.perf_counter()
+    single = [predictor.predict(case) for case in cases]
+    single_rate = len(cases) / (time.perf_counter() - start)
+    if predictor.predict_batch(cases) != single:
+        sys.exit("predict_batch does not match predict()")
+    print(f"Parity OK on {len(cases)} cases; predict() loop: {single_rate:,.0f} rows/sec")
+
+    print(f"{'batch size':>12} {'seconds':>10} {'rows/sec':>12}")
+    for size in args.sizes:
+        cases = random_cases(symptoms, size, rng)
+        start = time.perf_counter()
+        predictor.predict_batch(cases)
+        elapsed = time.perf_counter() - start
+        print(f"{size:>12} {elapsed:>10.4f} {size / elapsed:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from benchmark import synthetic_utterances
+from chat_session import ChatSession
+from model import DiseasePredictor
+from nlp_processor import SymptomExtractor
+from prediction_cache import PredictionCache
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+MODEL_BUNDLE_PATH = os.path.join(ROOT, "models", "disease_predictor.joblib")
+
+# Server-side work of one chat turn in app.py, without Streamlit: drawing the
+# history (each message serialised as Streamlit sends a markdown element,
+# stood in for by json.dumps), extracting symptoms, updating the session
+# state and predicting. "full" is the app before ChatSession, which redrew
+# every message and kept a set of symptoms and a list of message dicts;
+# "paged" draws one page of a ChatSession.
+
+
+def draw(messages):
+    for role, content in messages:
+        json.dumps({"role": role, "markdown": content})
+    return len(messages)
+
+
+def response(symptoms):
+    return "I identified the following symptoms:\n" + "\n".join(f"- {s}" for s in symptoms)
+
+
+def prediction_text(diseases, confidences):
+    return "\nTop 3 Predictions:" + "".join(
+        f"\n{i}. {d} (Confidence: {c:.1f}%)" for i, (d, c) in enumerate(zip(diseases, confidences), 1)
+    )
+
+
+def full_turn(state, prompt, extractor, predictor):
+    drawn = draw([(m["role"], m["content"]) for m in state["messages"]])
+    state["messages"].append({"role": "user", "content": prompt})
+    symptoms = extractor.extract_symptoms(prompt, predictor.symptom_index)
+    if symptoms:
+        state["confirmed"].update(symptoms)
+        state["messages"].append({"role": "assistant", "content": response(symptoms)})
+        if len(state["confirmed"]) >= 3:
+            result = prediction_text(*predictor.predict(list(state["confirmed"])))
+            state["messages"].append({"role": "assistant", "content": result})
+    return drawn
+
+
+def paged_turn(chat, prompt, extractor, predictor, page_size):
+    drawn = draw(chat.recent(page_size))
+    chat.add("user", prompt)
+    symptoms = extractor.extract_symptoms(prompt, predictor.symptom_index)
+    if symptoms:
+        chat.confirm(symptoms, predictor.symptom_index)
+        chat.add("assistant", response(symptoms))
+        if chat.symptom_count >= 3:
+            chat.add("assistant", prediction_text(*chat.predict(predictor)))
+    return drawn
+
+
+def deep_size(obj, seen=None):
+    # Bytes held by obj and everything it refers to, counting shared
+    # objects once
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, deque)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+def run(mode, turns, utterances, extractor, predictor, page_size, measured):
+    # Mean time of the last `measured` turns of a conversation of `turns`
+    # turns, messages drawn on the last turn, and the final state's size
+    predictor.cache = PredictionCache(max_entries=100000)
+    state = {"confirmed": set(), "messages": []} if mode == "full" else ChatSession()
+    seconds = []
+    for i in range(turns):
+        prompt = utterances[i % len(utterances)]
+        start = time.perf_counter()
+        if mode == "full":
+            drawn = full_turn(state, prompt, extractor, predictor)
+        else:
+            drawn = paged_turn(state, prompt, extractor, predictor, page_size)
+        seconds.append(time.perf_counter() - start)
+    tail = seconds[-measured:]
+    return sum(tail) / len(tail) * 1000, drawn, deep_size(state) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-turn server time and session size as chat conversations grow")
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--page-size", type=int, default=20, help="messages per history page, like HISTORY_PAGE_SIZE")
+    parser.add_argument("--measured", type=int, default=10, help="last turns of each conversation timed")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    predictor = DiseasePredictor.load_or_train(MODEL_BUNDLE_PATH, TRAINING_DATA_PATH)
+    extractor = SymptomExtractor(offline=True)
+    extractor.get_matcher(predictor.symptom_index)
+    utterances = synthetic_utterances(predictor.symptom_columns, max(args.turns), args.seed)
+
+    print(f"{'turns':>6} {'mode':<6} {'ms/turn':>8} {'drawn':>6} {'session KB':>11}")
+    for turns in args.turns:
+        for mode in ("full", "paged"):
+            ms, drawn, kb = run(mode, turns, utterances, extractor, predictor, args.page_size, min(args.measured, turns))
+            print(f"{turns:>6} {mode:<6} {ms:>8.2f} {drawn:>6} {kb:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
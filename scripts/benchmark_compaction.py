@@ -0,0 +1,76 @@
+import argparse
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from evaluation import score_matrix
+from features import compact_rows, load_training_data
+from model import DiseasePredictor
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+TESTING_DATA_PATH = os.path.join(ROOT, "data", "Testing.csv")
+
+# Trains the ensemble on every row and on the compacted rows of the same
+# file, and compares fit times and Testing.csv predictions. Training.csv has
+# no repeated rows, so by default the archive is Training.csv cases drawn
+# with replacement, repeated as often as in a case archive where common
+# presentations recur.
+
+
+def write_archive(path, n_rows, seed):
+    frame = pd.read_csv(TRAINING_DATA_PATH)
+    rng = np.random.default_rng(seed)
+    frame.iloc[rng.choice(len(frame), n_rows)].to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit time and prediction parity of training on compacted rows")
+    parser.add_argument("--data", help="training CSV or Parquet file; default is a resampled Training.csv")
+    parser.add_argument("--rows", type=int, default=10000, help="rows of the resampled archive")
+    parser.add_argument("--n-jobs", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    X, labels, _ = load_training_data(TRAINING_DATA_PATH)
+    unique = len(compact_rows(X, np.unique(labels, return_inverse=True)[1])[1])
+    print(f"Training.csv: {len(labels)} rows, {unique} unique")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.data
+        if path is None:
+            path = os.path.join(directory, "archive.csv")
+            write_archive(path, args.rows, args.seed)
+
+        predictors = {}
+        for compact in (False, True):
+            predictor = DiseasePredictor()
+            predictor.train(path, n_jobs=args.n_jobs, compact=compact)
+            predictors[compact] = predictor
+
+    report = predictors[True].training_report
+    compaction = report['compaction']
+    print(f"Archive: {compaction['rows']} rows, {compaction['unique_rows']} unique "
+          f"({compaction['rows'] / compaction['unique_rows']:.1f}x), compacted in {compaction['seconds'] * 1000:.0f} ms")
+
+    X_test, test_labels, _ = load_training_data(TESTING_DATA_PATH, predictors[True].symptom_columns)
+    y_test = predictors[True].encoder.transform(test_labels)
+    full_pred = score_matrix(predictors[False], X_test)
+    compact_pred = score_matrix(predictors[True], X_test)
+
+    print(f"\n{'model':<9} {'full s':>7} {'compact s':>10} {'full acc':>9} {'compact acc':>12} {'agree':>6}")
+    for name in ("svm", "nb", "rf", "gb", "ensemble"):
+        if name == "ensemble":
+            full_s, compact_s = predictors[False].training_report['total_seconds'], report['total_seconds']
+        else:
+            full_s, compact_s = predictors[False].training_report[name]['seconds'], report[name]['seconds']
+        print(f"{name:<9} {full_s:>7.2f} {compact_s:>10.2f} {(full_pred[name] == y_test).mean():>9.3f} "
+              f"{(compact_pred[name] == y_test).mean():>12.3f} {(full_pred[name] == compact_pred[name]).mean():>6.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from model import DiseasePredictor
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+MODEL_BUNDLE_PATH = os.path.join(ROOT, "models", "disease_predictor.joblib")
+PARITY_TOLERANCE = 1e-9
+LATENCY_TARGET_MS = 1.0
+
+
+def random_cases(symptoms, n, rng, min_size=1, max_size=8):
+    sizes = rng.integers(min_size, max_size + 1, size=n)
+    return [list(rng.choice(symptoms, size=size, replace=False)) for size in sizes]
+
+
+def weighted(predictor, probas):
+    return sum(probas[name] * weight for name, weight in predictor.weights.items())
+
+
+def max_difference(predictor, expected, actual):
+    differences = {name: np.abs(expected[name] - actual[name]).max() for name in expected}
+    differences['weighted'] = np.abs(weighted(predictor, expected) - weighted(predictor, actual)).max()
+    return differences
+
+
+def latencies(predictor, cases):
+    timings = []
+    for case in cases:
+        start = time.perf_counter()
+        predictor.predict(case)
+        timings.append(time.perf_counter() - start)
+    return np.percentile(timings, [50, 99]) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and time the compiled ensemble against sklearn")
+    parser.add_argument("--parity-rows", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    predictor = DiseasePredictor.load_or_train(MODEL_BUNDLE_PATH, TRAINING_DATA_PATH)
+    symptoms = list(predictor.symptom_index)
+    rng = np.random.default_rng(args.seed)
+
+    start = time.perf_counter()
+    compiled = predictor.compile()
+    print(f"Compiled ensemble in {time.perf_counter() - start:.2f}s")
+    predictor.compiled = None
+
+    # Parity, both for whole batches and for the single-row fast paths
+    X = predictor.symptom_matrix(random_cases(symptoms, args.parity_rows, rng, min_size=0))
+    expected = predictor.predict_proba_matrix(X)
+    worst = max_difference(predictor, expected, compiled.predict_proba_matrix(X))
+    for i in range(min(len(X), 200)):
+        row = {name: proba[i:i + 1] for name, proba in expected.items()}
+        for name, difference in max_difference(predictor, row, compiled.predict_proba_matrix(X[i:i + 1])).items():
+            worst[name] = max(worst[name], difference)
+    for name, difference in worst.items():
+        print(f"  max |sklearn - compiled| {name:>8}: {difference:.3e}")
+    if max(worst.values()) > PARITY_TOLERANCE:
+        sys.exit(f"Compiled ensemble differs from sklearn by more than {PARITY_TOLERANCE}")
+
+    # Single-request latency with 3-6 symptoms per request
+    cases = random_cases(symptoms, args.requests, rng, min_size=3, max_size=6)
+    sklearn_p50, sklearn_p99 = latencies(predictor, cases)
+    predictor.compiled = compiled
+    latencies(predictor, cases[:100])
+    compiled_p50, compiled_p99 = latencies(predictor, cases)
+
+    print(f"{'mode':>10} {'p50 ms':>10} {'p99 ms':>10}")
+    print(f"{'sklearn':>10} {sklearn_p50:>10.3f} {sklearn_p99:>10.3f}")
+    print(f"{'compiled':>10} {compiled_p50:>10.3f} {compiled_p99:>10.3f}")
+    met = compiled_p50 < LATENCY_TARGET_MS and compiled_p99 < LATENCY_TARGET_MS
+    print(f"Latency target (< {LATENCY_TARGET_MS} ms p50/p99): {'met' if met else 'missed'}")
+
+
+if __name__ == "__main__":
+    main()
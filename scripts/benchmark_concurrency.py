@@ -0,0 +1,89 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from benchmark_batch import random_cases
+from micro_batcher import MicroBatcher
+from model import DiseasePredictor
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+MODEL_BUNDLE_PATH = os.path.join(ROOT, "models", "disease_predictor.joblib")
+
+
+def run_clients(predict, cases, clients, seconds):
+    # Closed loop: each client sends its next turn as soon as the last one
+    # is answered
+    latencies = [[] for _ in range(clients)]
+    stop = time.perf_counter() + seconds
+
+    def client(i):
+        n = 0
+        while time.perf_counter() < stop:
+            case = cases[(i * 7919 + n) % len(cases)]
+            start = time.perf_counter()
+            predict(case)
+            latencies[i].append(time.perf_counter() - start)
+            n += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    all_latencies = np.concatenate([np.asarray(l) for l in latencies]) * 1000
+    return len(all_latencies) / elapsed, np.percentile(all_latencies, 50), np.percentile(all_latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and latency of concurrent chat turns, with and without micro-batching")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--threads", type=int, default=2, help="scoring threads without micro-batching, like SCORING_THREADS")
+    parser.add_argument("--max-wait-ms", type=float, default=2)
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--compiled", action="store_true", help="score with the compiled ensemble")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    predictor = DiseasePredictor.load_or_train(MODEL_BUNDLE_PATH, TRAINING_DATA_PATH)
+    # Measure scoring, not cache hits
+    predictor.cache = None
+    predictor.posterior_table = None
+    if args.compiled:
+        predictor.compile()
+    cases = random_cases(list(predictor.symptom_index), 1000, np.random.default_rng(args.seed))
+
+    # Results must not depend on what else is in the batch
+    batcher = MicroBatcher(predictor, max_wait=args.max_wait_ms / 1000, max_batch=args.max_batch)
+    futures = [batcher.submit(case) for case in cases[:200]]
+    if [f.result() for f in futures] != [predictor.predict(case) for case in cases[:200]]:
+        sys.exit("MicroBatcher results differ from predict()")
+    print(f"Parity OK on 200 cases (scored in {batcher.batches} batches)")
+
+    pool = ThreadPoolExecutor(max_workers=args.threads)
+    modes = {
+        f"pool of {args.threads}": lambda case: pool.submit(predictor.predict, case).result(),
+        "micro-batched": batcher.predict,
+    }
+    print(f"{'clients':>8} {'mode':<16} {'turns/sec':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for clients in args.clients:
+        for mode, predict in modes.items():
+            throughput, p50, p99 = run_clients(predict, cases, clients, args.seconds)
+            print(f"{clients:>8} {mode:<16} {throughput:>10,.0f} {p50:>9.1f} {p99:>9.1f}")
+    stats = batcher.stats()
+    print(f"Micro-batches: {stats['batches']}, mean {stats['mean_batch']:.1f} turns, largest {stats['largest_batch']}")
+    batcher.close()
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from features import load_training_data, nbytes, pack_rows, read_symptom_columns, to_csr
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+TARGET_ROWS = 10_000_000
+
+
+def synthetic_cases(n_rows, seed):
+    # Random cases with the same per-symptom frequencies as Training.csv
+    X, labels, columns = load_training_data(TRAINING_DATA_PATH)
+    rng = np.random.default_rng(seed)
+    frequency = X.mean(axis=0)
+    X = (rng.random((n_rows, len(columns)), dtype=np.float32) < frequency).astype(np.uint8)
+    return X, rng.choice(np.unique(labels), n_rows), columns
+
+
+def traced(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = fn(*args)
+        return result, time.perf_counter() - start, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the memory of symptom feature representations")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    X, labels, columns = synthetic_cases(args.rows, args.seed)
+    scale = TARGET_ROWS / args.rows
+    print(f"{args.rows} synthetic cases, {X.mean() * 100:.1f}% of symptoms present; "
+          f"sizes extrapolated to {TARGET_ROWS:,} rows")
+
+    representations = {
+        "int64 DataFrame": pd.DataFrame(X.astype(np.int64), columns=columns),
+        "float64 matrix": X.astype(np.float64),
+        "uint8 matrix": X,
+        "bit-packed": pack_rows(X),
+        "CSR float32": to_csr(X),
+    }
+    baseline = nbytes(representations["int64 DataFrame"])
+    for name, value in representations.items():
+        size = nbytes(value)
+        print(f"  {name:<16} {size * scale / 2**30:8.2f} GiB  ({baseline / size:5.1f}x smaller)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "cases.csv")
+        data = pd.DataFrame(X, columns=columns)
+        data["prognosis"] = labels
+        data.to_csv(path, index=False)
+
+        _, seconds, peak = traced(pd.read_csv, path)
+        print(f"pd.read_csv:        {seconds:6.2f}s, peak {peak / 2**20:8.1f} MiB")
+        _, seconds, peak = traced(load_training_data, path)
+        print(f"load_training_data: {seconds:6.2f}s, peak {peak / 2**20:8.1f} MiB")
+        _, seconds, peak = traced(read_symptom_columns, path)
+        print(f"read_symptom_columns: {seconds * 1000:.1f} ms, peak {peak / 2**20:.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import os
+import random
+import sys
+import time
+from difflib import get_close_matches
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from symptom_matcher import FuzzyIndex
+from typos import LETTERS, misspell
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+
+
+def typo_tokens(names, n, rng):
+    # Chat tokens: misspelled symptom names and words from them, plus noise words
+    words = sorted({word for name in names for word in name.split()})
+    tokens = []
+    for _ in range(n):
+        source = rng.random()
+        if source < 0.4:
+            tokens.append(misspell(rng.choice(names), rng, rng.randint(1, 3)))
+        elif source < 0.8:
+            tokens.append(misspell(rng.choice(words), rng, rng.randint(0, 2)))
+        else:
+            tokens.append("".join(rng.choice(LETTERS) for _ in range(rng.randint(2, 12))))
+    return tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FuzzyIndex with difflib.get_close_matches")
+    parser.add_argument("--tokens", type=int, default=5000)
+    parser.add_argument("--cutoff", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    columns = pd.read_csv(TRAINING_DATA_PATH, nrows=0).columns[:-1]
+    names = [" ".join(word.capitalize() for word in column.split("_")).lower() for column in columns]
+    tokens = typo_tokens(names, args.tokens, random.Random(args.seed))
+
+    start = time.perf_counter()
+    index = FuzzyIndex(names)
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = [get_close_matches(token, names, n=1, cutoff=args.cutoff) for token in tokens]
+    difflib_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = [[name for name, _ in index.lookup(token, n=1, cutoff=args.cutoff)] for token in tokens]
+    index_time = time.perf_counter() - start
+
+    mismatches = sum(a != e for a, e in zip(actual, expected))
+    hits = sum(bool(e) for e in expected)
+    print(f"{len(tokens)} typo-heavy tokens over {len(names)} symptoms, {hits} with a match")
+    print(f"FuzzyIndex build: {build_time * 1000:.1f} ms")
+    print(f"difflib:    {difflib_time / len(tokens) * 1e6:8.1f} us/token")
+    print(f"FuzzyIndex: {index_time / len(tokens) * 1e6:8.1f} us/token ({difflib_time / index_time:.1f}x)")
+    if mismatches:
+        sys.exit(f"{mismatches} tokens matched differently from difflib")
+    print("Results identical to difflib")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from benchmark import random_cases
+from model import DiseasePredictor
+from model_registry import ModelRegistry
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+MODEL_BUNDLE_PATH = os.path.join(ROOT, "models", "disease_predictor.joblib")
+STUDENT_MODEL_PATH = os.path.join(ROOT, "models", "student.npz")
+
+# Serves chat-paced requests from a ModelRegistry holding versions of the
+# saved bundle with its own and with other weights, and reports what the user
+# would see: per-request latency without and with shadow scoring, errors
+# and latency while the default switches under load, and LRU eviction
+# under a small memory budget. Predictions aren't cached, so every request
+# is scored.
+
+
+def write_config(path, default, shadow=None, fraction=0.0, student=False):
+    versions = {
+        "current": {"bundle": MODEL_BUNDLE_PATH},
+        "reweighted": {"bundle": MODEL_BUNDLE_PATH, "weights": {"svm": 0.1, "nb": 0.4, "rf": 0.25, "gb": 0.25}},
+        "no-svm": {"bundle": MODEL_BUNDLE_PATH, "weights": {"svm": 0.0, "nb": 0.3, "rf": 0.35, "gb": 0.35}}
+    }
+    if student:
+        versions["student"] = {"student": STUDENT_MODEL_PATH}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"default": default, "shadow": shadow, "shadow_fraction": fraction, "versions": versions}, f)
+
+
+def serve(registry, cases, gap):
+    # Milliseconds per request, one request every gap seconds like chat turns
+    ms = []
+    for symptoms in cases:
+        start = time.perf_counter()
+        registry.predict(symptoms)
+        ms.append((time.perf_counter() - start) * 1000)
+        time.sleep(gap)
+    return np.array(ms)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency, shadow agreement, switching and eviction of ModelRegistry")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--gap-ms", type=float, default=20, help="pause between requests")
+    parser.add_argument("--fractions", type=float, nargs="+", default=[0.1, 1.0], help="shadow fractions to time")
+    parser.add_argument("--threads", type=int, default=4, help="request threads while switching the default")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    DiseasePredictor.load_or_train(MODEL_BUNDLE_PATH, TRAINING_DATA_PATH)
+    student = os.path.exists(STUDENT_MODEL_PATH)
+    gap = args.gap_ms / 1000
+
+    with tempfile.TemporaryDirectory() as directory:
+        config = os.path.join(directory, "registry.json")
+        write_config(config, "current", student=student)
+        start = time.perf_counter()
+        registry = ModelRegistry.from_config(config, TRAINING_DATA_PATH, seed=args.seed)
+        print(f"Loaded the default version in {time.perf_counter() - start:.2f}s "
+              f"({registry.stats()['loaded_mb']:.0f} MB)")
+        cases = random_cases(list(registry.symptom_index), args.requests, args.seed)
+
+        print(f"\n{'shadow':>8} {'p50 ms':>7} {'p95 ms':>7} {'max ms':>7} {'shadowed':>9} {'agreement':>10}")
+        runs = [0.0] + args.fractions
+        for fraction in runs:
+            write_config(config, "current", "reweighted" if fraction else None, fraction, student)
+            registry.apply_config(config, TRAINING_DATA_PATH)
+            before = dict(registry.stats()['versions']['reweighted'])
+            ms = serve(registry, cases, gap)
+            registry.wait_for_shadow()
+            after = registry.stats()['versions']['reweighted']
+            rows = after['shadow_rows'] - before['shadow_rows']
+            agreed = after['shadow_agreed'] - before['shadow_agreed']
+            agreement = f"{agreed / rows:.3f}" if rows else "-"
+            print(f"{fraction:>8.2f} {np.percentile(ms, 50):>7.2f} {np.percentile(ms, 95):>7.2f} {ms.max():>7.2f} "
+                  f"{rows:>9} {agreement:>10}")
+
+        # Switch the default while request threads keep scoring
+        write_config(config, "current", student=student)
+        registry.apply_config(config, TRAINING_DATA_PATH)
+        registry.loaded.pop("reweighted", None)
+        errors = []
+        requests = []
+        stop = threading.Event()
+
+        def client(seed):
+            rng = np.random.default_rng(seed)
+            while not stop.is_set():
+                symptoms = cases[rng.integers(len(cases))]
+                start = time.perf_counter()
+                try:
+                    version = registry.default
+                    registry.predict(symptoms, version_id=version)
+                except Exception as e:
+                    errors.append(e)
+                requests.append((start, (time.perf_counter() - start) * 1000, version))
+                time.sleep(gap)
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        time.sleep(2)
+        write_config(config, "reweighted", student=student)
+        switch_start = time.perf_counter()
+        registry.apply_config(config, TRAINING_DATA_PATH)
+        switch_end = time.perf_counter()
+        time.sleep(2)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        print(f"\nSwitching the default to 'reweighted' under {args.threads} request threads "
+              f"(loading it took {switch_end - switch_start:.2f}s): {len(errors)} errors")
+        print(f"{'window':<8} {'requests':>9} {'p50 ms':>7} {'p95 ms':>7} {'served by'}")
+        windows = {
+            'before': [r for r in requests if r[0] < switch_start],
+            'during': [r for r in requests if switch_start <= r[0] < switch_end],
+            'after': [r for r in requests if r[0] >= switch_end]
+        }
+        for window, rows in windows.items():
+            if rows:
+                ms = [r[1] for r in rows]
+                served = sorted({r[2] for r in rows})
+                print(f"{window:<8} {len(rows):>9} {np.percentile(ms, 50):>7.1f} {np.percentile(ms, 95):>7.1f} "
+                      f"{', '.join(served)}")
+
+    # A budget that holds about two ensembles: using a third version evicts
+    # the least recently used one that isn't the default
+    with tempfile.TemporaryDirectory() as directory:
+        config = os.path.join(directory, "registry.json")
+        write_config(config, "current", student=student)
+        registry = ModelRegistry.from_config(config, TRAINING_DATA_PATH)
+        registry.budget = 2.5 * registry.stats()['loaded_mb'] * 2**20
+        used = ["reweighted", "no-svm", "reweighted", "current"]
+        for version_id in used:
+            registry.predict(cases[0], version_id=version_id)
+        stats = registry.stats()
+        print(f"\nBudget {stats['budget_mb']:.0f} MB, default 'current', after using {', '.join(used)}:")
+        for version_id, version in stats['versions'].items():
+            print(f"  {version_id:<10} loaded={version['loaded']!s:<5} {version['mb']:6.1f} MB  "
+                  f"loads={version['loads']} evictions={version['evictions']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+MESSAGES = [
+    "I have a high fever, chills and my feet are swollen",
+    "headaches and nausea since yesterday, also some joint pain",
+]
+
+# Runs in a fresh interpreter so imports and NLTK loading count as cold start
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {src!r})
+from nlp_processor import SymptomExtractor
+import pandas as pd
+columns = pd.read_csv({data!r}, nrows=0).columns[:-1]
+symptom_index = {{" ".join(w.capitalize() for w in c.split("_")): i for i, c in enumerate(columns)}}
+extractor = SymptomExtractor(**{options!r})
+startup = time.perf_counter() - start
+latencies = []
+for message in {messages!r}:
+    start = time.perf_counter()
+    extractor.extract_symptoms(message, symptom_index)
+    latencies.append(time.perf_counter() - start)
+print(json.dumps({{"startup": startup, "first": latencies[0], "second": latencies[1]}}))
+"""
+
+MODES = {
+    "default": {},
+    "offline": {"offline": True},
+    "offline, lazy WordNet": {"offline": True, "preload": False},
+    "bundled": {"bundled": True},
+}
+
+
+def probe(options):
+    code = PROBE.format(
+        src=os.path.join(ROOT, "src"),
+        data=os.path.join(ROOT, "data", "Training.csv"),
+        options=options,
+        messages=MESSAGES,
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure SymptomExtractor cold start and first-message latency")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    args = parser.parse_args()
+
+    print(f"{'mode':<24}{'startup ms':>12}{'first msg ms':>14}{'next msg ms':>13}")
+    for mode in args.modes:
+        runs = [probe(MODES[mode]) for _ in range(args.runs)]
+        best = {key: min(run[key] for run in runs) * 1000 for key in runs[0]}
+        print(f"{mode:<24}{best['startup']:>12.1f}{best['first']:>14.1f}{best['second']:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
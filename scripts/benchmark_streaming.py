@@ -0,0 +1,67 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from features import load_training_data
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+
+# Runs in a fresh interpreter so its peak RSS belongs to one training run
+PROBE = """
+import json, resource, sys
+sys.path.insert(0, {src!r})
+from model import DiseasePredictor
+predictor = DiseasePredictor()
+predictor.train_streaming({path!r}, block_rows={block_rows}, sample_rows={sample_rows})
+report = predictor.training_report
+print(json.dumps({{"seconds": report["total_seconds"], "rows": report["rows"],
+                  "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+"""
+
+
+def write_cases(path, n_rows, seed, block_rows=100000):
+    # Random cases with Training.csv's symptom frequencies, written a block
+    # at a time so generating a large file needs little memory
+    X, labels, columns = load_training_data(TRAINING_DATA_PATH)
+    frequency = X.mean(axis=0)
+    classes = np.unique(labels)
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_rows, block_rows):
+        n = min(block_rows, n_rows - start)
+        block = pd.DataFrame((rng.random((n, len(columns))) < frequency).astype(np.uint8), columns=columns)
+        block["prognosis"] = rng.choice(classes, n)
+        block.to_csv(path, mode="a" if start else "w", header=not start, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show that streaming training memory does not grow with the input")
+    parser.add_argument("--rows", type=int, nargs="+", default=[50000, 200000, 800000])
+    parser.add_argument("--block-rows", type=int, default=50000)
+    parser.add_argument("--sample-rows", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"block_rows={args.block_rows}, sample_rows={args.sample_rows}")
+    print(f"{'rows':>10}{'file MB':>10}{'seconds':>10}{'peak RSS MB':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in args.rows:
+            path = os.path.join(tmp, f"cases_{n_rows}.csv")
+            write_cases(path, n_rows, args.seed)
+            code = PROBE.format(src=os.path.join(ROOT, "src"), path=path,
+                                block_rows=args.block_rows, sample_rows=args.sample_rows)
+            result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+            run = json.loads(result.stdout.strip().splitlines()[-1])
+            print(f"{run['rows']:>10}{os.path.getsize(path) / 2**20:>10.0f}{run['seconds']:>10.1f}{run['peak_rss_mb']:>13.0f}")
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import sys
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from nltk.corpus import stopwords, wordnet
+from nlp_processor import NLP_RESOURCES_PATH, simple_word_tokenize, wordnet_lemmatize
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+
+
+def inflections(word):
+    # Regular noun plurals; verb forms are left to the exact tier
+    forms = {word, word + "s", word + "es"}
+    if word.endswith("y"):
+        forms.add(word[:-1] + "ies")
+    return forms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the bundled stopwords and lemma table from local NLTK data")
+    parser.add_argument("--data", default=TRAINING_DATA_PATH)
+    parser.add_argument("--output", default=NLP_RESOURCES_PATH)
+    args = parser.parse_args()
+
+    columns = pd.read_csv(args.data, nrows=0).columns[:-1]
+    names = [" ".join(word.capitalize() for word in column.split("_")).lower() for column in columns]
+    words = {token for name in names for token in simple_word_tokenize(name)}
+
+    # The vocabulary words plus every regular and irregular (WordNet
+    # exception list) form of their lemmas
+    lemmas = {wordnet_lemmatize(word) for word in words}
+    forms = set(words)
+    for lemma in lemmas:
+        forms.update(inflections(lemma))
+    for form, bases in wordnet._exception_map[wordnet.NOUN].items():
+        if lemmas.intersection(bases):
+            forms.add(form)
+
+    table = {form: wordnet_lemmatize(form) for form in sorted(forms)}
+    table = {form: lemma for form, lemma in table.items() if form != lemma}
+
+    resources = {"stopwords": sorted(stopwords.words("english")), "lemmas": table}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(resources, f, indent=1, sort_keys=True)
+        f.write("\n")
+    print(f"{len(names)} symptoms, {len(words)} words, {len(table)} lemma entries, "
+          f"{len(resources['stopwords'])} stopwords -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
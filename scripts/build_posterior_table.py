@@ -0,0 +1,128 @@
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from features import load_training_data
+from model import DiseasePredictor
+from posterior_table import PosteriorTable
+
+MODEL_BUNDLE_PATH = os.path.join(ROOT, "models", "disease_predictor.joblib")
+TABLE_PATH = os.path.join(ROOT, "models", "posterior_table.npy")
+TESTING_DATA_PATH = os.path.join(ROOT, "data", "Testing.csv")
+
+
+def combinations(symptom_ids, min_size, max_size):
+    # Bitmasks of every subset of the given symptoms within the size range
+    for size in range(min_size, min(max_size, len(symptom_ids)) + 1):
+        for subset in itertools.combinations(symptom_ids, size):
+            yield sum(1 << i for i in subset)
+
+
+def row_symptom_ids(X):
+    return [row.nonzero()[0].tolist() for row in X]
+
+
+def read_query_log(path, symptom_index):
+    # One query per line: a JSON list of symptom names or comma-separated names
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            names = json.loads(line) if line.startswith("[") else [name.strip() for name in line.split(",")]
+            queries.append(sorted({symptom_index[name] for name in names if name in symptom_index}))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute ensemble results for observed symptom combinations")
+    parser.add_argument("--bundle", default=MODEL_BUNDLE_PATH)
+    parser.add_argument("--output", default=TABLE_PATH)
+    parser.add_argument("--min-size", type=int, default=3)
+    parser.add_argument("--max-size", type=int, default=5)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--query-log", action="append", default=[], help="File of past queries (repeatable)")
+    parser.add_argument("--holdout", default=TESTING_DATA_PATH, help="Cases to measure coverage on")
+    parser.add_argument("--compiled", action="store_true", help="Score with the compiled ensemble (faster; agrees with sklearn scoring to ~1e-13)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    predictor = DiseasePredictor.load(args.bundle)
+    if args.compiled:
+        predictor.compile()
+    symptoms = sorted(predictor.symptom_index, key=predictor.symptom_index.get)
+    top_k = min(args.top_k, len(predictor.encoder.classes_))
+
+    # Enumerate the combinations seen in the training rows and the query logs
+    masks = set()
+    for ids in row_symptom_ids(predictor.training_X):
+        masks.update(combinations(ids, args.min_size, args.max_size))
+    from_training = len(masks)
+    logged = [q for path in args.query_log for q in read_query_log(path, predictor.symptom_index)]
+    for ids in logged:
+        masks.update(combinations(ids, args.min_size, args.max_size))
+    masks = sorted(masks)
+    print(f"{len(masks)} symptom sets of size {args.min_size}-{args.max_size}: "
+          f"{from_training} from {len(predictor.training_y)} training rows, "
+          f"{len(masks) - from_training} more from {len(logged)} logged queries")
+
+    # Score them all with the live ensemble, agreement boost included
+    start = time.perf_counter()
+    symptom_lists = [[symptoms[i] for i in range(len(symptoms)) if mask >> i & 1] for mask in masks]
+    results = predictor.predict_batch(symptom_lists, top_k=top_k)
+    scoring_time = time.perf_counter() - start
+    print(f"Scored in {scoring_time:.1f}s ({len(masks) / scoring_time:,.0f} sets/s)")
+
+    start = time.perf_counter()
+    table = PosteriorTable.build(
+        masks, [r[0] for r in results], [r[1] for r in results],
+        predictor.encoder.classes_.tolist(), predictor.version, top_k
+    )
+    table.save(args.output)
+    stats = table.stats()
+    print(f"Table: {stats['entries']} entries in {stats['slots']} slots (load {stats['load_factor']:.2f}), "
+          f"{stats['bytes'] / 2**20:.1f} MiB, built in {time.perf_counter() - start:.1f}s -> {args.output}")
+
+    # The stored results must be exactly what live inference returns
+    table = PosteriorTable.load(args.output)
+    rng = random.Random(args.seed)
+    for row in rng.sample(range(len(masks)), min(1000, len(masks))):
+        if table.lookup(masks[row], top_k) != (list(results[row][0]), list(results[row][1])):
+            sys.exit(f"Stored result differs from live inference for {symptom_lists[row]}")
+    print("Stored results match live inference")
+
+    # Coverage: the share of a held-out case set's combinations in the table.
+    # Hit rate: the share of queries answered by it, for the logged queries or,
+    # without a log, for random 3-5 symptom subsets of the held-out cases.
+    X_holdout, _, _ = load_training_data(args.holdout, predictor.symptom_columns)
+    holdout_ids = row_symptom_ids(X_holdout)
+    holdout_masks = {m for ids in holdout_ids for m in combinations(ids, args.min_size, args.max_size)}
+    covered = sum(table.lookup(m) is not None for m in holdout_masks)
+    print(f"Coverage of {os.path.basename(args.holdout)} combinations: "
+          f"{covered}/{len(holdout_masks)} ({covered / max(len(holdout_masks), 1):.1%})")
+
+    if logged:
+        queries = [sum(1 << i for i in ids) for ids in logged]
+        source = "logged queries"
+    else:
+        queries = []
+        for ids in holdout_ids:
+            for _ in range(10):
+                size = rng.randint(3, 5)
+                if len(ids) >= size:
+                    queries.append(sum(1 << i for i in rng.sample(ids, size)))
+        source = "simulated held-out queries"
+    hits = sum(table.lookup(m) is not None for m in queries)
+    print(f"Hit rate on {len(queries)} {source}: {hits / max(len(queries), 1):.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from features import load_training_data
+from model import DiseasePredictor
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+TESTING_DATA_PATH = os.path.join(ROOT, "data", "Testing.csv")
+MODEL_BUNDLE_PATH = os.path.join(ROOT, "models", "disease_predictor.joblib")
+
+
+def ranked(predictor, cases):
+    # Top disease and its confidence per case
+    return [(diseases[0], confidences[0]) if diseases else (None, 0.0)
+            for diseases, confidences in predictor.predict_batch(cases, top_k=1)]
+
+
+def per_case_ms(predictor, cases, repeats):
+    # Single-turn latency, as the app scores one chat at a time; best of
+    # several passes to keep other load out of the comparison
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for case in cases:
+            predictor.predict(case)
+        best = min(best, time.perf_counter() - start)
+    return best / len(cases) * 1000
+
+
+def model_costs(predictor, X, repeats):
+    # Best-of mean single-row predict_proba time of each model, in ms
+    models = predictor.snapshot()
+    scorers = {
+        'svm': models['svm'].predict_proba,
+        'nb': models['nb'].predict_joint_log_proba,
+        'rf': models['rf'].predict_proba,
+        'gb': models['gb'].predict_proba,
+    }
+    costs = {}
+    for name, score in scorers.items():
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for i in range(len(X)):
+                score(X[i:i + 1])
+            best = min(best, time.perf_counter() - start)
+        costs[name] = best / len(X) * 1000
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy and compute of cascade mode against the full ensemble")
+    parser.add_argument("--data", default=TESTING_DATA_PATH)
+    parser.add_argument("--targets", type=float, nargs="+", default=[0.9, 0.95, 0.98, 0.99, 1.0],
+                        help="top-1 agreement with the full ensemble to calibrate for, on the training rows")
+    parser.add_argument("--max-gap", type=float, default=10.0,
+                        help="mean top-1 confidence gap, in points, allowed for early answers")
+    parser.add_argument("--timing-cases", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    predictor = DiseasePredictor.load_or_train(MODEL_BUNDLE_PATH, TRAINING_DATA_PATH)
+    predictor.cache = None
+    predictor.posterior_table = None
+
+    X, labels, _ = load_training_data(args.data, predictor.symptom_columns)
+    names = sorted(predictor.symptom_index, key=predictor.symptom_index.get)
+    cases = [[names[i] for i in np.flatnonzero(row)] for row in X]
+    timing_cases = cases[:args.timing_cases]
+
+    full = ranked(predictor, cases)
+    full_accuracy = np.mean([d == label for (d, _), label in zip(full, labels)])
+    print(f"Full ensemble on {len(cases)} cases: accuracy {full_accuracy:.3f}, "
+          f"mean top confidence {np.mean([c for _, c in full]):.1f}%")
+
+    costs = model_costs(predictor, X[:args.timing_cases], args.repeats)
+    full_cost = sum(costs.values())
+    print("Single-row model cost (ms): " + ", ".join(f"{name} {cost:.2f}" for name, cost in costs.items()))
+    print("Thresholds are calibrated on the training rows and evaluated on the cases above. Compute is the")
+    print("share of model time saved, from the costs above and the early-exit rate. Gap is the mean top-1")
+    print("confidence difference, in points, from the full ensemble on the early rows.")
+
+    print(f"{'target':>7} {'threshold':>10} {'early exit':>11} {'agreement':>10} {'accuracy':>9} "
+          f"{'acc gap':>8} {'conf gap':>9} {'compute':>9} {'full ms':>8} {'ms/case':>8}")
+    for target in args.targets:
+        threshold = predictor.calibrate_cascade(predictor.training_X, target, args.max_gap)
+        early = predictor.cascade_exits(X)[0]
+
+        cascaded = ranked(predictor, cases)
+        agreement = np.mean([a == b for (a, _), (b, _) in zip(cascaded, full)])
+        accuracy = np.mean([d == label for (d, _), label in zip(cascaded, labels)])
+        gaps = [abs(c - fc) for (_, c), (_, fc), e in zip(cascaded, full, early) if e]
+        conf_gap = f"{np.mean(gaps):.1f}" if gaps else "-"
+        ms = per_case_ms(predictor, timing_cases, args.repeats)
+        # The full ensemble timed right alongside, since load drifts
+        predictor.disable_cascade()
+        full_ms = per_case_ms(predictor, timing_cases, args.repeats)
+
+        # Model compute per case: Naive Bayes always runs, and escalated
+        # cases then run all four
+        cascade_cost = costs['nb'] + (1 - early.mean()) * full_cost
+        print(f"{target:>7.2f} {threshold:>10.4f} {early.mean():>10.1%} {agreement:>10.1%} {accuracy:>9.3f} "
+              f"{accuracy - full_accuracy:>+8.3f} {conf_gap:>9} {1 - cascade_cost / full_cost:>9.1%} "
+              f"{full_ms:>8.2f} {ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
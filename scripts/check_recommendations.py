@@ -0,0 +1,91 @@
+import argparse
+import os
+import sys
+import time
+from itertools import combinations
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from model import DiseasePredictor
+from recommendations import RECOMMENDATIONS_PATH, RecommendationCatalog
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+MODEL_BUNDLE_PATH = os.path.join(ROOT, "models", "disease_predictor.joblib")
+
+
+def common_by_dict(entries, diseases):
+    # How app.py found shared medicines before the catalog: an item -> diseases
+    # dict rebuilt for every prediction
+    all_items = {}
+    for disease in diseases:
+        for item in entries.get(disease, []):
+            if item not in all_items:
+                all_items[item] = []
+            all_items[item].append(disease)
+    return [item for item, found in all_items.items() if len(found) > 1]
+
+
+def synthetic_catalog(n_diseases, n_items, items_per_disease, seed=0):
+    # Items drawn with Zipf-like popularity, so common ones are shared by
+    # many diseases, like paracetamol or a blood count
+    rng = np.random.default_rng(seed)
+    popularity = 1 / np.arange(1, n_items + 1)
+    popularity /= popularity.sum()
+    entries = {}
+    for d in range(n_diseases):
+        items = rng.choice(n_items, size=rng.integers(1, 2 * items_per_disease), replace=False, p=popularity)
+        entries[f"disease_{d}"] = [f"item_{i}" for i in items]
+    return {'medications': entries}
+
+
+def time_queries(fn, queries):
+    start = time.perf_counter()
+    for diseases in queries:
+        fn(diseases)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate data/recommendations.json and time the shared-item query")
+    parser.add_argument("--catalog", default=RECOMMENDATIONS_PATH)
+    parser.add_argument("--diseases", type=int, default=20000, help="diseases in the synthetic catalog")
+    parser.add_argument("--items", type=int, default=50000, help="items in the synthetic catalog")
+    parser.add_argument("--items-per-disease", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    predictor = DiseasePredictor.load_or_train(MODEL_BUNDLE_PATH, TRAINING_DATA_PATH)
+    catalog = RecommendationCatalog.load(args.catalog)
+    try:
+        problems = catalog.check(predictor.encoder.classes_)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"{args.catalog}: {len(catalog.diseases)} diseases, all known to the model; "
+          + ", ".join(f"{kind} missing for {len(missing)}" for kind, missing in problems['missing'].items()))
+
+    # Same answers as the old lookup for every top-3 the model could give
+    for kind in catalog.kinds:
+        entries = {disease: list(items) for disease, items in catalog.disease_items[kind].items()}
+        for top in combinations(predictor.encoder.classes_, 3):
+            if catalog.common(kind, top) != common_by_dict(entries, top):
+                sys.exit(f"common({kind!r}, {top}) differs from the dict lookup")
+    print("common() matches the dict lookup on every top-3 combination")
+
+    large_entries = synthetic_catalog(args.diseases, args.items, args.items_per_disease)
+    start = time.perf_counter()
+    large = RecommendationCatalog(large_entries)
+    used = len({item for items in large.disease_items['medications'].values() for item in items})
+    print(f"\nSynthetic catalog: {args.diseases} diseases, {used} items used, built in {time.perf_counter() - start:.2f}s")
+    rng = np.random.default_rng(1)
+    print(f"{'top-k':>6} {'catalog us':>11} {'dict us':>9}")
+    for k in (3, 10):
+        queries = [[f"disease_{d}" for d in rng.choice(args.diseases, k, replace=False)] for _ in range(args.queries)]
+        catalog_us = time_queries(lambda diseases: large.common('medications', diseases), queries)
+        dict_us = time_queries(lambda diseases: common_by_dict(large_entries['medications'], diseases), queries)
+        print(f"{k:>6} {catalog_us:>11.1f} {dict_us:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from distillation import distill, fidelity, intake_rows
+from features import load_training_data
+from model import DiseasePredictor, top_k_indices
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+TESTING_DATA_PATH = os.path.join(ROOT, "data", "Testing.csv")
+MODEL_BUNDLE_PATH = os.path.join(ROOT, "models", "disease_predictor.joblib")
+STUDENT_MODEL_PATH = os.path.join(ROOT, "models", "student.npz")
+
+# Memory of a fresh process that loads one way of serving and answers a
+# prediction. Read from /proc because ru_maxrss survives exec on Linux, so a
+# child would report this (much larger) process's peak.
+RSS_PROBE = """
+import json, sys
+sys.path.insert(0, {src!r})
+from model import DiseasePredictor
+
+def memory_mb():
+    memory = {{}}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                memory[line.split(":")[0]] = int(line.split()[1]) / 1024
+    return memory
+
+before = memory_mb()["VmRSS"]
+if {student!r}:
+    predictor = DiseasePredictor.load_student({path!r})
+else:
+    predictor = DiseasePredictor.load({path!r})
+predictor.predict(list(predictor.symptom_index)[:3])
+memory = memory_mb()
+print(json.dumps({{"imports_mb": before, "rss_mb": memory["VmRSS"], "peak_mb": memory["VmHWM"]}}))
+"""
+
+
+def process_memory(path, student):
+    code = RSS_PROBE.format(src=os.path.join(ROOT, "src"), path=path, student=student)
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill the ensemble into a compact student model and report its fidelity")
+    parser.add_argument("--output", default=STUDENT_MODEL_PATH)
+    parser.add_argument("--hidden", type=int, default=32, help="hidden units; 0 fits softmax regression")
+    parser.add_argument("--synthetic-rows", type=int, default=20000, help="random intake-sized symptom sets added to the training rows")
+    parser.add_argument("--l2", type=float, default=1e-5)
+    parser.add_argument("--max-iter", type=int, default=3000)
+    parser.add_argument("--eval-rows", type=int, default=3000, help="fresh intake-sized symptom sets to check fidelity on")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    predictor = DiseasePredictor.load_or_train(MODEL_BUNDLE_PATH, TRAINING_DATA_PATH)
+
+    start = time.perf_counter()
+    student = distill(predictor, args.hidden, args.synthetic_rows, args.l2, args.max_iter, args.seed)
+    print(f"Distilled {student.metadata['transfer_rows']} rows into a "
+          f"{'softmax regression' if not args.hidden else f'{args.hidden}-unit'} student "
+          f"in {time.perf_counter() - start:.1f}s")
+    student.save(args.output, predictor.training_X, predictor.training_y)
+
+    # Fidelity on the held-out test rows and on new random symptom sets
+    X_test, labels, _ = load_training_data(TESTING_DATA_PATH, predictor.symptom_columns)
+    X_intake = intake_rows(args.eval_rows, len(predictor.symptom_columns), np.random.default_rng(args.seed + 1))
+    print(f"{'rows':<12} {'n':>6} {'top-1 agree':>12} {'top-3 overlap':>14} {'KL mean':>8} {'KL p95':>8} "
+          f"{'max diff':>9} {'acc ens':>8} {'acc student':>12}")
+    for name, X in (("Testing.csv", X_test), ("intake", X_intake)):
+        teacher = predictor._weighted(predictor.predict_proba_matrix(X))
+        distilled = student.predict_proba(X)
+        report = fidelity(teacher, distilled)
+        accuracy = ""
+        if name == "Testing.csv":
+            classes = predictor.encoder.classes_
+            accuracy = (f"{np.mean(classes[top_k_indices(teacher, 1)[:, 0]] == labels):>8.3f} "
+                        f"{np.mean(student.classes[top_k_indices(distilled, 1)[:, 0]] == labels):>12.3f}")
+        print(f"{name:<12} {report['rows']:>6} {report['top1_agreement']:>12.1%} {report['top3_overlap']:>14.1%} "
+              f"{report['kl_mean']:>8.4f} {report['kl_p95']:>8.4f} {report['max_abs_diff']:>9.3f} {accuracy}")
+
+    # Single-row scoring time of each, as the chat scores one turn at a time
+    rows = [X_intake[i:i + 1] for i in range(min(200, len(X_intake)))]
+    for name, score in (("ensemble", lambda X: predictor.predict_proba_matrix(X)), ("student", student.predict_proba)):
+        start = time.perf_counter()
+        for X in rows:
+            score(X)
+        print(f"{name} predict_proba: {(time.perf_counter() - start) / len(rows) * 1000:.3f} ms/row")
+
+    print(f"\nArtifact size: bundle {os.path.getsize(MODEL_BUNDLE_PATH) / 2**20:.2f} MB, "
+          f"student {os.path.getsize(args.output) / 2**20:.3f} MB ({args.output})")
+    print(f"{'process':<10} {'after imports':>14} {'RSS MB':>8} {'peak MB':>8}")
+    for name, path, is_student in (("ensemble", MODEL_BUNDLE_PATH, False), ("student", args.output, True)):
+        memory = process_memory(path, is_student)
+        print(f"{name:<10} {memory['imports_mb']:>14.1f} {memory['rss_mb']:>8.1f} {memory['peak_mb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -76,99 +76,146 @@
 # if __name__ == '__main__':
 #     main()
 
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import joblib
 import pandas as pd
-import numpy as np
-from sklearn.model_selection import train_test_split, GridSearchCV, cross_val_score
-from sklearn.preprocessing import LabelEncoder, StandardScaler
-from sklearn.feature_selection import SelectKBest, chi2
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier, VotingClassifier
-from sklearn.svm import SVC
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
-import matplotlib.pyplot as plt
-import seaborn as sns
 
-def main():
-    # Load the dataset
-    data = pd.read_csv("Training.csv")
-    X = data.iloc[:, 1:]  # Features (symptoms)
-    y = data.iloc[:, 0]   # Disease labels
-
-    # Encode target labels
-    label_encoder = LabelEncoder()
-    y_encoded = label_encoder.fit_transform(y)
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
 
-    # One-hot encode the features
-    X_encoded = pd.get_dummies(X)
+from evaluation import METRIC_NAMES, bootstrap, confusion_matrices, cross_validate, metrics_from_confusion, score_matrix, write_report
+from features import load_training_data
+from model import DiseasePredictor
 
-    # Feature selection
-    selector = SelectKBest(score_func=chi2, k=50)
-    X_selected = selector.fit_transform(X_encoded, y_encoded)
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+TESTING_DATA_PATH = os.path.join(ROOT, "data", "Testing.csv")
+MODEL_BUNDLE_PATH = os.path.join(ROOT, "models", "disease_predictor.joblib")
+OUTPUT_DIR = os.path.join(ROOT, "reports", "evaluation")
 
-    # Split into training and testing sets (80% training, 20% testing)
-    X_train, X_test, y_train, y_test = train_test_split(
-        X_selected, y_encoded, test_size=0.2, random_state=42
-    )
 
-    print(f"Training set shape: {X_train.shape}")
-    print(f"Test set shape: {X_test.shape}")
+def tune(args):
+    # Grid search over a soft-voting alternative to the served ensemble
+    from sklearn.model_selection import train_test_split, GridSearchCV, cross_val_score
+    from sklearn.preprocessing import LabelEncoder, StandardScaler
+    from sklearn.feature_selection import SelectKBest, chi2
+    from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier, VotingClassifier
+    from sklearn.pipeline import Pipeline
+    from sklearn.svm import SVC
+    from sklearn.metrics import accuracy_score
 
-    # Feature scaling
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
+    data = pd.read_csv(TRAINING_DATA_PATH)
+    X = data.drop(columns=["prognosis"])
+    y = LabelEncoder().fit_transform(data["prognosis"])
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-    # Initialize individual models
-    rf = RandomForestClassifier(random_state=42)
-    gb = GradientBoostingClassifier(random_state=42)
-    svm = SVC(probability=True, random_state=42)
-
-    # Create a voting ensemble
     ensemble = VotingClassifier(estimators=[
-        ('rf', rf), ('gb', gb), ('svm', svm)
+        ('rf', RandomForestClassifier(random_state=42)),
+        ('gb', GradientBoostingClassifier(random_state=42)),
+        ('svm', SVC(probability=True, random_state=42))
     ], voting='soft')
 
-    # Hyperparameter tuning
+    # Feature selection and scaling are fitted inside each fold. The grid
+    # only varies the ensemble, so with a memory the selector and scaler of a
+    # fold are fitted once and reused by every candidate and by the final
+    # cross-validation, which runs on the same folds.
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix="evaluate_model_")
+    pipeline = Pipeline([
+        ('select', SelectKBest(score_func=chi2, k=50)),
+        ('scale', StandardScaler()),
+        ('ensemble', ensemble)
+    ], memory=joblib.Memory(cache_dir, verbose=0))
     param_grid = {
-        'rf__n_estimators': [100, 200],
-        'gb__n_estimators': [100, 200],
-        'svm__C': [0.1, 1, 10]
+        'ensemble__rf__n_estimators': [100, 200],
+        'ensemble__gb__n_estimators': [100, 200],
+        'ensemble__svm__C': [0.1, 1, 10]
     }
 
-    grid_search = GridSearchCV(estimator=ensemble, param_grid=param_grid, cv=5)
-    grid_search.fit(X_train_scaled, y_train)
-
-    best_model = grid_search.best_estimator_
-
-    # Cross-validation scores
-    cv_scores = cross_val_score(best_model, X_train_scaled, y_train, cv=5)
-    print(f"Cross-validation accuracy: {cv_scores.mean():.2f}")
-
-    # Predictions
-    y_pred = best_model.predict(X_test_scaled)
-
-    # Evaluation metrics
-    accuracy = accuracy_score(y_test, y_pred)
-    precision = precision_score(y_test, y_pred, average='weighted', zero_division=0)
-    recall = recall_score(y_test, y_pred, average='weighted', zero_division=0)
-    f1 = f1_score(y_test, y_pred, average='weighted', zero_division=0)
-    cm = confusion_matrix(y_test, y_pred)
-
-    print("Accuracy:", accuracy)
-    print("Precision:", precision)
-    print("Recall:", recall)
-    print("F1 Score:", f1)
-    print("Confusion Matrix:")
-    print(cm)
-
-    # Visualize the confusion matrix
-    plt.figure(figsize=(10, 8))
-    sns.heatmap(cm, annot=True, fmt='d', cmap='Blues',
-                xticklabels=label_encoder.classes_, yticklabels=label_encoder.classes_)
-    plt.xlabel("Predicted Label")
-    plt.ylabel("True Label")
-    plt.title("Confusion Matrix")
-    plt.tight_layout()
-    plt.show()
+    try:
+        start = time.perf_counter()
+        grid_search = GridSearchCV(estimator=pipeline, param_grid=param_grid, cv=5, n_jobs=args.n_jobs)
+        grid_search.fit(X_train, y_train)
+        print(f"Grid search: {time.perf_counter() - start:.1f}s, best {grid_search.best_params_}")
+
+        best_model = grid_search.best_estimator_
+        start = time.perf_counter()
+        cv_scores = cross_val_score(best_model, X_train, y_train, cv=5, n_jobs=args.n_jobs)
+        print(f"Cross-validation accuracy: {cv_scores.mean():.2f} ({time.perf_counter() - start:.1f}s)")
+    finally:
+        if args.cache_dir is None:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+    print(f"Held-out accuracy: {accuracy_score(y_test, best_model.predict(X_test)):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the saved ensemble on the test set, with bootstrap intervals and k-fold cross-validation")
+    parser.add_argument("--data", default=TESTING_DATA_PATH, help="labelled cases in the Training.csv layout")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="where metrics.json and the confusion matrix are written")
+    parser.add_argument("--bootstrap", type=int, default=1000, help="resamples for the confidence intervals, 0 skips")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--folds", type=int, default=5, help="k-fold refits on the training data, 0 skips")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--n-jobs", type=int, default=-1, help="CPU budget, -1 for all cores")
+    parser.add_argument("--no-plot", action="store_true", help="skip confusion_matrix.png")
+    parser.add_argument("--tune", action="store_true", help="also grid-search the soft-voting pipeline")
+    parser.add_argument("--cache-dir", help="with --tune, keep fitted fold transforms here between runs (default: temporary)")
+    args = parser.parse_args()
+
+    # The bundle the app serves, not a fresh fit
+    predictor = DiseasePredictor.load_or_train(MODEL_BUNDLE_PATH, TRAINING_DATA_PATH)
+    class_names = predictor.encoder.classes_.tolist()
+    n_classes = len(class_names)
+    X, labels, _ = load_training_data(args.data, predictor.symptom_columns)
+    y = predictor.encoder.transform(labels)
+
+    start = time.perf_counter()
+    predictions = score_matrix(predictor, X)
+    print(f"Scored {len(X)} cases from {args.data} in {time.perf_counter() - start:.2f}s")
+
+    report = {'data': args.data, 'cases': len(X), 'model_version': predictor.version, 'models': {}}
+    print(f"{'model':<10} " + " ".join(f"{name:>9}" for name in METRIC_NAMES))
+    for name, pred in predictions.items():
+        report['models'][name] = metrics_from_confusion(confusion_matrices(y, pred, n_classes)[0])
+        print(f"{name:<10} " + " ".join(f"{report['models'][name][metric]:>9.3f}" for metric in METRIC_NAMES))
+
+    if args.bootstrap:
+        start = time.perf_counter()
+        report['bootstrap'] = bootstrap(
+            y, predictions['ensemble'], n_classes, args.bootstrap, args.confidence, args.seed, args.n_jobs
+        )
+        report['bootstrap']['resamples'] = args.bootstrap
+        report['bootstrap']['confidence'] = args.confidence
+        print(f"\nEnsemble {args.confidence:.0%} bootstrap intervals ({args.bootstrap} resamples, "
+              f"{time.perf_counter() - start:.1f}s)")
+        for metric in METRIC_NAMES:
+            interval = report['bootstrap'][metric]
+            print(f"  {metric:<9} {report['models']['ensemble'][metric]:.3f} "
+                  f"[{interval['low']:.3f}, {interval['high']:.3f}]")
+
+    if args.folds:
+        start = time.perf_counter()
+        report['cross_validation'] = cross_validate(
+            predictor, predictor.training_X, predictor.training_y, args.folds, args.seed, args.n_jobs
+        )
+        print(f"\n{args.folds}-fold cross-validation on the training rows ({time.perf_counter() - start:.1f}s)")
+        for name, summary in report['cross_validation']['summary'].items():
+            print(f"  {name:<10} accuracy {summary['accuracy']['mean']:.3f} +/- {summary['accuracy']['std']:.3f}, "
+                  f"F1 {summary['f1']['mean']:.3f} +/- {summary['f1']['std']:.3f}")
+
+    confusion = confusion_matrices(y, predictions['ensemble'], n_classes)[0]
+    print("\nConfusion matrix (rows true, columns predicted):")
+    print(confusion)
+    for path in write_report(args.output_dir, report, confusion, class_names, plot=not args.no_plot):
+        print(f"Wrote {path}")
+
+    if args.tune:
+        print()
+        tune(args)
+
 
 if __name__ == '__main__':
     main()
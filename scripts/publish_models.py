@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from benchmark_batch import random_cases
+from model import DiseasePredictor
+from model_host import ModelHost
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+MODEL_BUNDLE_PATH = os.path.join(ROOT, "models", "disease_predictor.joblib")
+MODEL_HOST_DIR = os.path.join(ROOT, "models", "host")
+
+# A worker that loads the models one way, builds the symptom suggester as the
+# API does, answers a few predictions, reports its memory and stays alive
+# until stdin closes, so every worker is running while the others measure.
+# PSS splits shared pages between the processes mapping them and USS counts
+# only the worker's own pages, so together they show what one more worker
+# costs; RSS counts shared pages in full.
+WORKER = """
+import json, sys
+sys.path.insert(0, {src!r})
+from model import DiseasePredictor
+from model_host import ModelHost
+from suggestions import SymptomSuggester
+if {mode!r} == "attached":
+    predictor = ModelHost({host!r}).attach()
+else:
+    predictor = DiseasePredictor.load({bundle!r})
+suggester = SymptomSuggester.from_predictor(predictor)
+for symptoms in {cases!r}:
+    predictor.predict(symptoms)
+memory = {{}}
+with open("/proc/self/smaps_rollup") as f:
+    for line in f:
+        key = line.split(":")[0]
+        if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+            memory[key] = int(line.split()[1]) / 1024
+print(json.dumps(memory), flush=True)
+sys.stdin.read()
+"""
+
+
+def worker_memory(mode, workers, host_dir, cases):
+    code = WORKER.format(src=os.path.join(ROOT, "src"), mode=mode, host=host_dir, bundle=MODEL_BUNDLE_PATH, cases=cases)
+    processes = [
+        subprocess.Popen([sys.executable, "-c", code], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL, text=True)
+        for _ in range(workers)
+    ]
+    # Each worker reports once it is loaded; the earlier ones are still alive
+    # and mapping the same pages when the later ones measure
+    reports = [json.loads(process.stdout.readline()) for process in processes]
+    for process in processes:
+        process.stdin.close()
+        process.wait()
+    return {
+        'rss_mb': np.mean([r['Rss'] for r in reports]),
+        'pss_mb': np.mean([r['Pss'] for r in reports]),
+        'uss_mb': np.mean([r['Private_Clean'] + r['Private_Dirty'] for r in reports])
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish the models for worker processes to map, and compare per-worker memory")
+    parser.add_argument("--host-dir", default=MODEL_HOST_DIR)
+    parser.add_argument("--workers", type=int, default=4, help="workers started per mode; 0 only publishes")
+    parser.add_argument("--parity-cases", type=int, default=500)
+    args = parser.parse_args()
+
+    predictor = DiseasePredictor.load_or_train(MODEL_BUNDLE_PATH, TRAINING_DATA_PATH)
+    host = ModelHost(args.host_dir)
+    manifest = host.publish(predictor)
+    data_path = os.path.join(args.host_dir, manifest['data_file'])
+    print(f"Published model version {manifest['version']} to {data_path} "
+          f"({os.path.getsize(data_path) / 2**20:.1f} MB, {len(manifest['arrays'])} arrays)")
+
+    # An attached worker scores with the compiled kernel, which follows the
+    # sklearn models to rounding error
+    cases = random_cases(list(predictor.symptom_index), args.parity_cases, np.random.default_rng(0))
+    attached = host.attach()
+    differ = sum(
+        a[0] != b[0] or not np.allclose(a[1], b[1], rtol=1e-9, atol=1e-9)
+        for a, b in zip(attached.predict_batch(cases), predictor.predict_batch(cases))
+    )
+    print(f"Attached predictor vs bundle on {len(cases)} cases: {differ} differ")
+    if differ:
+        sys.exit(1)
+
+    if args.workers:
+        print(f"\nPer-worker memory with {args.workers} workers running at once (MB)")
+        print(f"{'mode':<10} {'RSS':>8} {'PSS':>8} {'USS':>8}")
+        for mode in ("bundle", "attached"):
+            memory = worker_memory(mode, args.workers, args.host_dir, [[str(s) for s in case] for case in cases[:5]])
+            print(f"{mode:<10} {memory['rss_mb']:>8.1f} {memory['pss_mb']:>8.1f} {memory['uss_mb']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,76 @@
-import pandas as pd
-import numpy as np
-import pickle
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.naive_bayes import GaussianNB
-from sklearn.svm import SVC
+import argparse
+import os
+import sys
 from sklearn.metrics import accuracy_score
 
-# Load dataset
-data = pd.read_csv("Training.csv")
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
 
-# Separate features (X) and target (y)
-X = data.iloc[:, :-1]  # Symptoms
-y = data.iloc[:, -1]   # Disease labels
+from features import load_training_data
+from model import DiseasePredictor
 
-# Split dataset into training and testing sets (80% train, 20% test)
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+TESTING_DATA_PATH = os.path.join(ROOT, "data", "Testing.csv")
+MODEL_BUNDLE_PATH = os.path.join(ROOT, "models", "disease_predictor.joblib")
 
-# Initialize models
-rf_model = RandomForestClassifier(n_estimators=100, random_state=42)
-nb_model = GaussianNB()
-svm_model = SVC(kernel='linear', probability=True, random_state=42)
+parser = argparse.ArgumentParser(description="Train the ensemble and save the model bundle")
+parser.add_argument("--n-jobs", type=int, default=-1, help="CPU budget for training, -1 for all cores")
+parser.add_argument("--data", default=TRAINING_DATA_PATH, help="Training CSV or Parquet file")
+parser.add_argument("--streaming", action="store_true",
+                    help="Train in bounded memory from blocks of the file (linear SVM, sampled trees)")
+parser.add_argument("--no-compact", action="store_true",
+                    help="Fit every row instead of unique rows weighted by their counts")
+parser.add_argument("--block-rows", type=int, default=100000)
+parser.add_argument("--sample-rows", type=int, default=100000)
+parser.add_argument("--out", help="Bundle to write; by default the app's bundle for a full train on Training.csv, "
+                                  "else models/<data file name>[-streaming].joblib")
+args = parser.parse_args()
 
-# Train models
-rf_model.fit(X_train, y_train)
-nb_model.fit(X_train, y_train)
-svm_model.fit(X_train, y_train)
+# The app and API retrain their bundle when its training data isn't
+# Training.csv, so a bundle trained on another file or by streaming goes
+# to its own path and is served with MODEL_BUNDLE_PATH and TRAINING_DATA_PATH
+out_path = args.out
+if out_path is None:
+    if os.path.abspath(args.data) == os.path.abspath(TRAINING_DATA_PATH) and not args.streaming:
+        out_path = MODEL_BUNDLE_PATH
+    else:
+        stem = os.path.splitext(os.path.basename(args.data))[0]
+        out_path = os.path.join(ROOT, "models", f"{stem}{'-streaming' if args.streaming else ''}.joblib")
 
-# Evaluate models
-rf_acc = accuracy_score(y_test, rf_model.predict(X_test))
-nb_acc = accuracy_score(y_test, nb_model.predict(X_test))
-svm_acc = accuracy_score(y_test, svm_model.predict(X_test))
+# Train the full ensemble on the training set
+predictor = DiseasePredictor()
+if args.streaming:
+    predictor.train_streaming(args.data, block_rows=args.block_rows, sample_rows=args.sample_rows, trace_memory=True)
+else:
+    predictor.train(args.data, n_jobs=args.n_jobs, compact=not args.no_compact, trace_memory=True)
 
-print(f"Random Forest Accuracy: {rf_acc:.2f}")
-print(f"Naïve Bayes Accuracy: {nb_acc:.2f}")
-print(f"SVM Accuracy: {svm_acc:.2f}")
+report = predictor.training_report
+print(f"Trained in {report['total_seconds']:.1f}s")
+if "compaction" in report:
+    compaction = report['compaction']
+    print(f"  Fitted {compaction['unique_rows']} unique of {compaction['rows']} rows "
+          f"({compaction['rows'] / compaction['unique_rows']:.1f}x)")
+if "streaming_seconds" in report:
+    print(f"  Streamed {report['rows']} rows through NB and the linear SVM in {report['streaming_seconds']:.1f}s")
+for name in ("svm", "nb", "rf", "gb"):
+    if name in report:
+        print(f"  {name:>3}: {report[name]['seconds']:6.1f}s, peak {report[name]['peak_mb']:.1f} MB")
 
-# Save trained models
-with open("rf_model.pkl", "wb") as f:
-    pickle.dump(rf_model, f)
+# Evaluate each base model on the held-out test set
+X_test, test_labels, _ = load_training_data(TESTING_DATA_PATH, predictor.symptom_columns)
+y_test = predictor.encoder.transform(test_labels)
 
-with open("nb_model.pkl", "wb") as f:
-    pickle.dump(nb_model, f)
+models = {
+    "SVM": predictor.svm_model,
+    "Naïve Bayes": predictor.nb_model,
+    "Random Forest": predictor.rf_model,
+    "Gradient Boosting": predictor.gb_model
+}
+for name, model in models.items():
+    print(f"{name} Accuracy: {accuracy_score(y_test, model.predict(X_test)):.2f}")
 
-with open("svm_model.pkl", "wb") as f:
-    pickle.dump(svm_model, f)
-
-print("Models trained and saved successfully!")
+# Save the versioned model bundle
+predictor.save(out_path)
+print(f"Model bundle saved to {out_path}")
+if os.path.abspath(out_path) != os.path.abspath(MODEL_BUNDLE_PATH):
+    print(f"Serve it with MODEL_BUNDLE_PATH={os.path.abspath(out_path)} TRAINING_DATA_PATH={os.path.abspath(args.data)}")
@@ -0,0 +1,18 @@
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def misspell(word, rng, edits):
+    # Random deletions, insertions, substitutions and transpositions
+    chars = list(word)
+    for _ in range(edits):
+        position = rng.randrange(max(len(chars), 1))
+        kind = rng.choice(("delete", "insert", "substitute", "transpose"))
+        if kind == "delete" and len(chars) > 1:
+            del chars[position]
+        elif kind == "insert":
+            chars.insert(position, rng.choice(LETTERS))
+        elif kind == "substitute" and chars:
+            chars[position] = rng.choice(LETTERS)
+        elif kind == "transpose" and position + 1 < len(chars):
+            chars[position], chars[position + 1] = chars[position + 1], chars[position]
+    return "".join(chars)
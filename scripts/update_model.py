@@ -0,0 +1,40 @@
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from model import DiseasePredictor
+
+MODEL_BUNDLE_PATH = os.path.join(ROOT, "models", "disease_predictor.joblib")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add labelled cases to the saved model bundle without a full retrain")
+    parser.add_argument("rows", help="CSV of new cases in the Training.csv layout")
+    parser.add_argument("--bundle", default=MODEL_BUNDLE_PATH)
+    parser.add_argument("--rf-trees", type=int, default=10, help="Random forest trees to grow and retire")
+    args = parser.parse_args()
+
+    predictor = DiseasePredictor.load(args.bundle)
+    print(f"Serving {predictor.version} trained on {len(predictor.training_y)} rows")
+
+    start = time.perf_counter()
+    status = predictor.update(args.rows, rf_trees=args.rf_trees)
+    print(f"Naive Bayes and random forest updated in {time.perf_counter() - start:.2f}s "
+          f"(revision {status['revision']}, {status['training_rows']} rows)")
+
+    start = time.perf_counter()
+    predictor.wait_for_refit()
+    if predictor.refit_error:
+        sys.exit(f"SVM/GB refit failed: {predictor.refit_error}")
+    print(f"SVM and gradient boosting refit in the background in {time.perf_counter() - start:.2f}s")
+
+    predictor.save(args.bundle)
+    print(f"Saved revision {predictor.revision} to {args.bundle}")
+
+
+if __name__ == "__main__":
+    main()
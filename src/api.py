@@ -0,0 +1,307 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from flask import Flask, Response, jsonify, request
+from metrics import METRICS, PROFILER, add_lookup_collectors, stats_collector
+from micro_batcher import MICRO_BATCH_MAX_ROWS, MicroBatcher
+from model import DiseasePredictor
+from model_host import ModelHost
+from nlp_processor import SymptomExtractor
+from prediction_cache import PredictionCache
+from posterior_table import PosteriorTable
+from suggestions import SymptomSuggester, disease_posterior
+from recommendations import default_catalog
+
+# Headless JSON API over the predictor and extractor. Every worker process
+# loads the model bundle once, or maps the one shared copy under
+# MODEL_HOST_DIR; serve with a multi-process WSGI server, e.g.
+#   gunicorn -w 4 -b 0.0.0.0:8000 --chdir src 'api:create_app()'
+# Requests carry all conversation state, so any worker can answer any request.
+
+# Relative paths, the defaults and any set in the environment, are taken
+# from the repository root, so the server finds its files whether it is
+# started there or in src
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+TRAINING_DATA_PATH = os.path.join(ROOT, os.environ.get("TRAINING_DATA_PATH", "data/Training.csv"))
+MODEL_BUNDLE_PATH = os.path.join(ROOT, os.environ.get("MODEL_BUNDLE_PATH", "models/disease_predictor.joblib"))
+POSTERIOR_TABLE_PATH = os.path.join(ROOT, os.environ.get("POSTERIOR_TABLE_PATH", "models/posterior_table.npy"))
+SCORING_THREADS = int(os.environ.get("SCORING_THREADS", "2"))
+SCORING_TIMEOUT = float(os.environ.get("SCORING_TIMEOUT", "30"))
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "10000"))
+NLP_OFFLINE = os.environ.get("NLP_OFFLINE") == "1"
+# Set NLP_BUNDLED=1 to lemmatize with the bundled table instead of loading
+# WordNet into every worker
+NLP_BUNDLED = os.environ.get("NLP_BUNDLED") == "1"
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", "100000"))
+PREDICTION_CACHE_TTL = float(os.environ["PREDICTION_CACHE_TTL"]) if os.environ.get("PREDICTION_CACHE_TTL") else None
+# Cascade mode, as in app.py
+CASCADE_AGREEMENT = float(os.environ["CASCADE_AGREEMENT"]) if os.environ.get("CASCADE_AGREEMENT") else None
+CASCADE_CONFIDENCE_GAP = float(os.environ.get("CASCADE_CONFIDENCE_GAP", "10"))
+# Distilled student served instead of the ensemble, as in app.py
+STUDENT_MODEL_PATH = os.path.join(ROOT, os.environ["STUDENT_MODEL_PATH"]) if os.environ.get("STUDENT_MODEL_PATH") else None
+# Set MODEL_HOST_DIR to map the models published there (by the first worker
+# to start, or scripts/publish_models.py) instead of loading a private copy
+MODEL_HOST_DIR = os.path.join(ROOT, os.environ["MODEL_HOST_DIR"]) if os.environ.get("MODEL_HOST_DIR") else None
+MIN_SYMPTOMS = 3
+
+
+class RequestError(Exception):
+    pass
+
+
+class NotReady(Exception):
+    pass
+
+
+class InferenceService:
+    # The models of one worker process and a small pool that runs the
+    # CPU-bound work, so request threads only wait on it and a burst of
+    # requests queues instead of oversubscribing the CPU. Single predictions
+    # go through a MicroBatcher, which scores concurrent requests together.
+    def __init__(self, predictor, extractor, threads=SCORING_THREADS, micro_batch=MICRO_BATCH_MAX_ROWS):
+        self.predictor = predictor
+        self.extractor = extractor
+        self.suggester = SymptomSuggester.from_predictor(predictor)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="scoring")
+        self.batcher = MicroBatcher(predictor, max_batch=micro_batch) if micro_batch > 0 else None
+        if self.batcher is not None:
+            METRICS.add_collector(stats_collector("micro_batch", self.batcher.stats))
+
+    @classmethod
+    def load(cls, bundle_path=MODEL_BUNDLE_PATH, training_data_path=TRAINING_DATA_PATH,
+             threads=SCORING_THREADS, offline=NLP_OFFLINE, compiled=False, bundled=NLP_BUNDLED):
+        predictor = None
+        if STUDENT_MODEL_PATH:
+            predictor = DiseasePredictor.load_student_if_current(STUDENT_MODEL_PATH, bundle_path, training_data_path)
+        if predictor is None and MODEL_HOST_DIR:
+            predictor = ModelHost(MODEL_HOST_DIR).load_or_publish(bundle_path, training_data_path)
+        if predictor is None:
+            predictor = DiseasePredictor.load_or_train(bundle_path, training_data_path)
+        if PREDICTION_CACHE_SIZE > 0:
+            predictor.cache = PredictionCache(max_entries=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL)
+        predictor.posterior_table = PosteriorTable.load_if_current(POSTERIOR_TABLE_PATH, predictor.version)
+        add_lookup_collectors(predictor)
+        default_catalog().check(predictor.encoder.classes_)
+        if CASCADE_AGREEMENT is not None and predictor.student is None and predictor.compiled is None:
+            predictor.calibrate_cascade(predictor.training_X, CASCADE_AGREEMENT, CASCADE_CONFIDENCE_GAP)
+        if compiled and predictor.student is None and predictor.compiled is None:
+            predictor.compile()
+        extractor = SymptomExtractor(offline=offline, bundled=bundled)
+        extractor.get_matcher(predictor.symptom_index)
+        return cls(predictor, extractor, threads)
+
+    def run(self, fn, *args):
+        return self.pool.submit(fn, *args).result(timeout=SCORING_TIMEOUT)
+
+    def score(self, symptoms):
+        if self.batcher is not None:
+            return self.batcher.predict(symptoms, timeout=SCORING_TIMEOUT)
+        return self.run(self.predictor.predict, symptoms)
+
+    def suggest(self, symptoms, k=3, method="information_gain"):
+        # Information gain is weighed over the ensemble's top diseases for
+        # the symptoms so far, rather than the suggester's own tables
+        known, _ = self.split_known(symptoms)
+        posterior = None
+        if known and method == "information_gain":
+            posterior = disease_posterior(*self.score(known))
+        return self.suggester.suggest(known, k=k, method=method, disease_probabilities=posterior)
+
+    def split_known(self, symptoms):
+        known = [s for s in symptoms if s in self.predictor.symptom_index]
+        unknown = [s for s in symptoms if s not in self.predictor.symptom_index]
+        return known, unknown
+
+    def extract(self, text):
+        return sorted(self.run(self.extractor.extract_symptoms, text, self.predictor.symptom_index))
+
+    def predict(self, symptoms):
+        # The version is read before scoring, so a switch during the call
+        # can only make a client think its answer is older than it is
+        known, unknown = self.split_known(symptoms)
+        version = self.predictor.version
+        diseases, confidences = self.score(known)
+        result = prediction_result(diseases, confidences, unknown)
+        result["version"] = version
+        return result
+
+    def predict_batch(self, symptom_lists):
+        results = self.run(self.predictor.predict_batch, symptom_lists)
+        return [prediction_result(diseases, confidences) for diseases, confidences in results]
+
+    def chat(self, message, symptoms):
+        # One chat turn: extract symptoms from the message, merge them with the
+        # ones already confirmed and predict once there are enough
+        extracted = self.extract(message)
+        known, unknown = self.split_known(symptoms)
+        confirmed = sorted(set(known) | set(extracted))
+        response = {"extracted": extracted, "symptoms": confirmed, "unknown": unknown}
+        if len(confirmed) >= MIN_SYMPTOMS:
+            diseases, confidences = self.score(confirmed)
+            response.update(prediction_result(diseases, confidences))
+        else:
+            response["remaining"] = MIN_SYMPTOMS - len(confirmed)
+            if confirmed:
+                response["suggestions"] = self.suggest(confirmed)
+        return response
+
+
+def prediction_result(diseases, confidences, unknown=None):
+    catalog = default_catalog()
+    predictions = [
+        {
+            "disease": disease,
+            "confidence": confidence,
+            "medications": list(catalog.items('medications', disease)),
+            "tests": list(catalog.items('tests', disease))
+        }
+        for disease, confidence in zip(diseases, confidences)
+    ]
+    result = {"predictions": predictions}
+    if unknown is not None:
+        result["unknown"] = unknown
+    return result
+
+
+def string_list(value, name):
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise RequestError(f"'{name}' must be a list of strings")
+    return value
+
+
+def json_body():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise RequestError("Request body must be a JSON object")
+    return body
+
+
+def create_app(service=None, **load_options):
+    # Loads the models in the background so the worker answers /healthz at
+    # once and /readyz only reports ready when it can serve predictions
+    app = Flask(__name__)
+    state = {"service": service, "error": None}
+
+    def load():
+        try:
+            state["service"] = InferenceService.load(**load_options)
+        except Exception as e:
+            state["error"] = str(e)
+            print(f"Error loading models: {e}")
+
+    if service is None:
+        threading.Thread(target=load, name="model-loader", daemon=True).start()
+
+    def ready_service():
+        if state["service"] is None:
+            raise NotReady()
+        return state["service"]
+
+    @app.after_request
+    def count_request(response):
+        METRICS.count("http_requests_total", endpoint=request.endpoint or "unknown", status=response.status_code)
+        return response
+
+    @app.errorhandler(RequestError)
+    def request_error(e):
+        return jsonify(error=str(e)), 400
+
+    @app.errorhandler(NotReady)
+    def not_ready(e):
+        return jsonify(error="Models are not loaded"), 503
+
+    @app.errorhandler(TimeoutError)
+    def scoring_timeout(e):
+        return jsonify(error="Scoring timed out"), 503
+
+    @app.get("/healthz")
+    def healthz():
+        return jsonify(status="ok")
+
+    @app.get("/readyz")
+    def readyz():
+        if state["service"] is not None:
+            return jsonify(status="ready")
+        if state["error"] is not None:
+            return jsonify(status="failed", error=state["error"]), 503
+        return jsonify(status="loading"), 503
+
+    @app.get("/version")
+    def version():
+        return jsonify(ready_service().predictor.serving_version())
+
+    @app.get("/cache")
+    def cache():
+        predictor = ready_service().predictor
+        return jsonify(
+            cache=predictor.cache.stats() if predictor.cache is not None else None,
+            posterior_table=predictor.posterior_table.stats() if predictor.posterior_table is not None else None
+        )
+
+    @app.get("/metrics")
+    def metrics():
+        # Prometheus text by default, JSON lines with ?format=json. Empty
+        # unless the worker runs with METRICS_ENABLED=1.
+        if request.args.get("format") == "json":
+            return Response(METRICS.json_lines(), mimetype="application/x-ndjson")
+        return Response(METRICS.prometheus_text(), mimetype="text/plain; version=0.0.4")
+
+    @app.get("/profile")
+    def profile():
+        # Collapsed stacks from the sampling profiler (METRICS_PROFILE=1)
+        if PROFILER is None:
+            return jsonify(error="Profiler is not running; set METRICS_PROFILE=1"), 404
+        return Response(PROFILER.collapsed(), mimetype="text/plain")
+
+    @app.get("/symptoms")
+    def symptoms():
+        return jsonify(symptoms=list(ready_service().predictor.symptom_index))
+
+    @app.post("/extract")
+    def extract():
+        body = json_body()
+        if not isinstance(body.get("text"), str):
+            raise RequestError("'text' must be a string")
+        return jsonify(symptoms=ready_service().extract(body["text"]))
+
+    @app.post("/predict")
+    def predict():
+        symptoms = string_list(json_body().get("symptoms"), "symptoms")
+        return jsonify(ready_service().predict(symptoms))
+
+    @app.post("/predict/batch")
+    def predict_batch():
+        symptom_lists = json_body().get("symptoms")
+        if not isinstance(symptom_lists, list):
+            raise RequestError("'symptoms' must be a list of symptom lists")
+        if len(symptom_lists) > MAX_BATCH_SIZE:
+            raise RequestError(f"At most {MAX_BATCH_SIZE} symptom lists per request")
+        for symptoms in symptom_lists:
+            string_list(symptoms, "symptoms")
+        return jsonify(results=ready_service().predict_batch(symptom_lists))
+
+    @app.post("/suggest")
+    def suggest():
+        body = json_body()
+        symptoms = string_list(body.get("symptoms", []), "symptoms")
+        k = body.get("k", 3)
+        method = body.get("method", "information_gain")
+        if not isinstance(k, int) or isinstance(k, bool) or k < 1:
+            raise RequestError("'k' must be a positive integer")
+        if method not in ("information_gain", "cooccurrence"):
+            raise RequestError("'method' must be 'information_gain' or 'cooccurrence'")
+        return jsonify(suggestions=ready_service().suggest(symptoms, k=k, method=method))
+
+    @app.post("/chat")
+    def chat():
+        body = json_body()
+        if not isinstance(body.get("message"), str):
+            raise RequestError("'message' must be a string")
+        symptoms = string_list(body.get("symptoms", []), "symptoms")
+        return jsonify(ready_service().chat(body["message"], symptoms))
+
+    return app
+
+
+if __name__ == "__main__":
+    create_app().run(host="0.0.0.0", port=int(os.environ.get("PORT", "8000")), threaded=True)
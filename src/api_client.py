@@ -0,0 +1,81 @@
+import time
+import requests
+
+# Thin clients for the inference API in api.py with the same methods the
+# Streamlit app uses on DiseasePredictor and SymptomExtractor, so the app
+# can run without loading any models.
+
+# Seconds a model version reported by the service is trusted before asking
+# again; every /predict answer also reports it
+VERSION_TTL = 5.0
+
+
+class InferenceClient:
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def get(self, path):
+        response = self.session.get(self.base_url + path, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def post(self, path, body):
+        response = self.session.post(self.base_url + path, json=body, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+
+class RemotePredictor:
+    def __init__(self, client, version_ttl=VERSION_TTL):
+        self.client = client
+        self.symptom_index = {symptom: i for i, symptom in enumerate(client.get("/symptoms")["symptoms"])}
+        self.version_ttl = version_ttl
+        self.known_version = None
+        self.version_seen = 0.0
+
+    @property
+    def version(self):
+        # The service can switch models at any time, so a version older than
+        # version_ttl is asked for again instead of trusted
+        if self.known_version is None or time.monotonic() - self.version_seen > self.version_ttl:
+            self.remember_version(self.client.get("/version")["version"])
+        return self.known_version
+
+    def remember_version(self, version):
+        self.known_version = version
+        self.version_seen = time.monotonic()
+
+    def predict(self, symptoms):
+        response = self.client.post("/predict", {"symptoms": list(symptoms)})
+        if "version" in response:
+            self.remember_version(response["version"])
+        predictions = response["predictions"]
+        return [p["disease"] for p in predictions], [p["confidence"] for p in predictions]
+
+    def predict_batch(self, symptom_lists):
+        results = self.client.post("/predict/batch", {"symptoms": [list(s) for s in symptom_lists]})["results"]
+        return [
+            ([p["disease"] for p in r["predictions"]], [p["confidence"] for p in r["predictions"]])
+            for r in results
+        ]
+
+
+class RemoteSuggester:
+    def __init__(self, client):
+        self.client = client
+
+    def suggest(self, confirmed, k=3, method="information_gain", disease_probabilities=None):
+        # The service weighs suggestions by its own ensemble's prediction
+        body = {"symptoms": list(confirmed), "k": k, "method": method}
+        return self.client.post("/suggest", body)["suggestions"]
+
+
+class RemoteExtractor:
+    def __init__(self, client):
+        self.client = client
+
+    def extract_symptoms(self, text, symptom_index=None):
+        # The server matches against its own model's symptom index
+        return self.client.post("/extract", {"text": text})["symptoms"]
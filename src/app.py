@@ -1,19 +1,128 @@
+import os
+import time
 import streamlit as st
+from chat_session import ChatSession
+from metrics import METRICS, METRICS_EXPORT_PATH, PROFILER, add_lookup_collectors, start_file_export, stats_collector
+from micro_batcher import MICRO_BATCH_MAX_ROWS, MicroBatcher
 from model import DiseasePredictor
+from model_host import ModelHost
+from model_registry import MODEL_REGISTRY_PATH, ModelRegistry
 from nlp_processor import SymptomExtractor
+from prediction_cache import PredictionCache
+from posterior_table import PosteriorTable
+from recommendations import default_catalog
+from suggestions import FollowingSuggester, SymptomSuggester, disease_posterior
 from symptoms import AVAILABLE_SYMPTOMS
 
 # import os
 # os.environ["TF_ENABLE_ONEDNN_OPTS"] = "0"
 
 
+# Set TRAINING_DATA_PATH and MODEL_BUNDLE_PATH to serve a bundle trained on
+# another file, e.g. one written by train_models.py --data
+TRAINING_DATA_PATH = os.environ.get("TRAINING_DATA_PATH", "data/Training.csv")
+MODEL_BUNDLE_PATH = os.environ.get("MODEL_BUNDLE_PATH", "models/disease_predictor.joblib")
+POSTERIOR_TABLE_PATH = os.environ.get("POSTERIOR_TABLE_PATH", "models/posterior_table.npy")
+# Set NLP_OFFLINE=1 to never download NLTK data and fall back to the bundled
+# stopwords and lemma table for anything not installed
+NLP_OFFLINE = os.environ.get("NLP_OFFLINE") == "1"
+# Set NLP_BUNDLED=1 to always use the bundled lemma table, so the process
+# doesn't load WordNet
+NLP_BUNDLED = os.environ.get("NLP_BUNDLED") == "1"
+# Set INFERENCE_API_URL to use a running api.py service instead of loading
+# the models in the Streamlit process
+INFERENCE_API_URL = os.environ.get("INFERENCE_API_URL")
+PREDICTION_CACHE_SIZE = int(os.environ.get("PREDICTION_CACHE_SIZE", "100000"))
+PREDICTION_CACHE_TTL = float(os.environ["PREDICTION_CACHE_TTL"]) if os.environ.get("PREDICTION_CACHE_TTL") else None
+# Set CASCADE_AGREEMENT (e.g. 0.95) to score with Naive Bayes first and run
+# every model only when it is unsure, at the threshold that keeps that share
+# of top diseases equal to the full ensemble on the training rows, with the
+# top confidence within CASCADE_CONFIDENCE_GAP points of it on average
+CASCADE_AGREEMENT = float(os.environ["CASCADE_AGREEMENT"]) if os.environ.get("CASCADE_AGREEMENT") else None
+CASCADE_CONFIDENCE_GAP = float(os.environ.get("CASCADE_CONFIDENCE_GAP", "10"))
+# Set STUDENT_MODEL_PATH (e.g. models/student.npz from scripts/distill_model.py)
+# to serve the distilled student instead of loading the full ensemble
+STUDENT_MODEL_PATH = os.environ.get("STUDENT_MODEL_PATH")
+# Set MODEL_HOST_DIR (e.g. models/host) to share one read-only copy of the
+# models between app processes on the machine, see model_host.py
+MODEL_HOST_DIR = os.environ.get("MODEL_HOST_DIR")
+# Messages drawn per page of chat history; older pages load on request
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "20"))
+
+
+def prepare_predictor(predictor):
+    # One prediction cache for all sessions, since the same symptom sets recur
+    predictor.cache = PredictionCache(max_entries=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL)
+    # Precomputed results from scripts/build_posterior_table.py, if built for this model
+    predictor.posterior_table = PosteriorTable.load_if_current(POSTERIOR_TABLE_PATH, predictor.version)
+    # Every disease in data/recommendations.json must be one the model predicts
+    default_catalog().check(predictor.encoder.classes_)
+    # The cascade needs the sklearn models, which attached processes don't load
+    if CASCADE_AGREEMENT is not None and predictor.student is None and predictor.compiled is None:
+        predictor.calibrate_cascade(predictor.training_X, CASCADE_AGREEMENT, CASCADE_CONFIDENCE_GAP)
+    return predictor
+
+
 # Initialize the disease predictor and symptom extractor
 @st.cache_resource
 def load_models():
-    predictor = DiseasePredictor()
-    predictor.train("data/Training.csv")
-    extractor = SymptomExtractor()
-    return predictor, extractor
+    # Set METRICS_ENABLED=1 and METRICS_EXPORT_PATH to write the app's metrics
+    # (JSON lines, or Prometheus text for a .prom file) once a minute
+    if METRICS_EXPORT_PATH:
+        start_file_export(METRICS_EXPORT_PATH, profiler=PROFILER)
+
+    if INFERENCE_API_URL:
+        from api_client import InferenceClient, RemoteExtractor, RemotePredictor, RemoteSuggester
+        client = InferenceClient(INFERENCE_API_URL)
+        return RemotePredictor(client), RemoteExtractor(client), RemoteSuggester(client)
+
+    if MODEL_REGISTRY_PATH:
+        # Several model versions from the registry config, see
+        # model_registry.py. Sessions are answered by its default version,
+        # which follows the config as it is edited.
+        predictor = ModelRegistry.from_config(MODEL_REGISTRY_PATH, TRAINING_DATA_PATH, prepare=prepare_predictor)
+        predictor.watch(MODEL_REGISTRY_PATH, TRAINING_DATA_PATH)
+        METRICS.add_collector(predictor.collect)
+        # Suggestions come from the tables of whichever version is the default
+        suggester = FollowingSuggester(predictor.get)
+    else:
+        predictor = None
+        if STUDENT_MODEL_PATH:
+            predictor = DiseasePredictor.load_student_if_current(STUDENT_MODEL_PATH, MODEL_BUNDLE_PATH, TRAINING_DATA_PATH)
+        if predictor is None and MODEL_HOST_DIR:
+            predictor = ModelHost(MODEL_HOST_DIR).load_or_publish(MODEL_BUNDLE_PATH, TRAINING_DATA_PATH)
+        if predictor is None:
+            # Loads the saved bundle and only retrains when Training.csv has changed
+            predictor = DiseasePredictor.load_or_train(MODEL_BUNDLE_PATH, TRAINING_DATA_PATH)
+        prepare_predictor(predictor)
+        add_lookup_collectors(predictor)
+        suggester = SymptomSuggester.from_predictor(predictor)
+    extractor = SymptomExtractor(offline=NLP_OFFLINE, bundled=NLP_BUNDLED)
+    # Build the symptom matcher now rather than on the first message
+    extractor.get_matcher(predictor.symptom_index)
+    if MICRO_BATCH_MAX_ROWS > 0:
+        # Every session's script runs on its own thread, so turns submitted at
+        # the same moment are scored together in one batch
+        predictor = MicroBatcher(predictor)
+        METRICS.add_collector(stats_collector("micro_batch", predictor.stats))
+    return predictor, extractor, suggester
+
+@st.fragment
+def chat_history(chat):
+    # Draws the newest pages of the history. "Show earlier messages" reruns
+    # only this fragment, and a new turn only redraws the pages shown, so the
+    # work per rerun doesn't grow with the conversation.
+    pages = st.session_state.get('history_pages', 1)
+    shown = pages * HISTORY_PAGE_SIZE
+    if len(chat.log) > shown:
+        if st.button("Show earlier messages"):
+            st.session_state.history_pages = pages + 1
+            st.rerun(scope="fragment")
+    elif chat.dropped:
+        st.caption(f"{chat.dropped} earlier messages are no longer kept.")
+    for role, content in chat.recent(shown):
+        with st.chat_message(role):
+            st.write(content)
 
 def main():
     # Set page config for favicon
@@ -30,90 +139,107 @@ def main():
         st.title("Disease Prediction System")
 
     # Load models
-    predictor, extractor = load_models()
+    predictor, extractor, suggester = load_models()
+    recommendations = default_catalog()
 
-    # Initialize session state for symptoms
-    if 'confirmed_symptoms' not in st.session_state:
-        st.session_state.confirmed_symptoms = set()
-    if 'messages' not in st.session_state:
-        st.session_state.messages = []
+    # Initialize session state: confirmed symptoms and the message log
+    if 'chat' not in st.session_state:
+        st.session_state.chat = ChatSession()
+    chat = st.session_state.chat
 
     # Display chat history
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.write(message["content"])
+    with METRICS.span("app_stage", stage="history"):
+        chat_history(chat)
 
     # Chat input with symptom suggestions
     prompt = st.chat_input("Describe your symptoms")
+    # A clicked suggestion counts as a message naming just that symptom
+    suggested = st.session_state.pop('suggested_symptom', None)
+    if suggested and not prompt:
+        prompt = suggested
 
     if prompt:
+        turn_start = time.perf_counter()
         # Display user message
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        chat.add("user", prompt)
         with st.chat_message("user"):
             st.write(prompt)
 
         # Extract symptoms from user input
-        extracted_symptoms = extractor.extract_symptoms(prompt, predictor.symptom_index)
+        if prompt == suggested:
+            extracted_symptoms = [suggested]
+        else:
+            with METRICS.span("app_stage", stage="extract"):
+                extracted_symptoms = extractor.extract_symptoms(prompt, predictor.symptom_index)
 
         # Assistant response
         with st.chat_message("assistant"):
             if not extracted_symptoms:
                 st.write("I couldn't identify any specific symptoms. Please try being more specific.")
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": "I couldn't identify any specific symptoms. Please try being more specific."
-                })
+                chat.add("assistant", "I couldn't identify any specific symptoms. Please try being more specific.")
             else:
                 # Add extracted symptoms to confirmed symptoms
-                st.session_state.confirmed_symptoms.update(extracted_symptoms)
+                chat.confirm(extracted_symptoms, predictor.symptom_index)
 
                 # Show identified symptoms
                 response = "I identified the following symptoms:\n" + "\n".join([f"- {s}" for s in extracted_symptoms])
                 st.write(response)
-                st.session_state.messages.append({"role": "assistant", "content": response})
+                chat.add("assistant", response)
 
-                # Make prediction with current symptoms if at least 3 are present
-                if len(st.session_state.confirmed_symptoms) >= 3:
-                    diseases, confidences = predictor.predict(list(st.session_state.confirmed_symptoms))
+                # Make prediction with current symptoms if at least 3 are present;
+                # a turn that adds no new symptom reuses the last prediction
+                if chat.symptom_count >= 3:
+                    with METRICS.span("app_stage", stage="predict"):
+                        diseases, confidences = chat.predict(predictor)
                     result = "\nTop 3 Predictions:"
-                    from prescriptions import PRESCRIPTIONS
-                    
-                    # Collect all medicines for predicted diseases
-                    all_medicines = {}
-                    for disease, confidence in zip(diseases, confidences):
-                        if disease in PRESCRIPTIONS:
-                            for medicine in PRESCRIPTIONS[disease]:
-                                if medicine not in all_medicines:
-                                    all_medicines[medicine] = []
-                                all_medicines[medicine].append(disease)
-                    
                     for i, (disease, confidence) in enumerate(zip(diseases, confidences), 1):
                         result += f"\n{i}. {disease} (Confidence: {confidence:.1f}%)"
-                        if disease in PRESCRIPTIONS:
-                            result += f"\n   Recommended medications: {', '.join(PRESCRIPTIONS[disease])}"
+                        medications = recommendations.items('medications', disease)
+                        if medications:
+                            result += f"\n   Recommended medications: {', '.join(medications)}"
+                        tests = recommendations.items('tests', disease)
+                        if tests:
+                            result += f"\n   Recommended diagnostic tests: {', '.join(tests)}"
                     
                     st.write(result)
                     
                     # Display common medicines only
                     st.write("\n🏥 Common Medicine Recommendations:")
-                    common_medicines = [medicine for medicine, diseases in all_medicines.items() if len(diseases) > 1]
+                    common_medicines = recommendations.common('medications', diseases)
                     if common_medicines:
                         for medicine in common_medicines:
                             st.write(f"- {medicine}")
                     
                     st.write("\n⚠️ Note: These are general recommendations. Please consult a healthcare professional for proper diagnosis and treatment.")
-                    st.session_state.messages.append({"role": "assistant", "content": result})
+                    chat.add("assistant", result)
 
                     if confidences[0] < 50:
                         st.write("Note: The confidence is low. Please consult a healthcare professional for accurate diagnosis.")
                 else:
-                    remaining = 3 - len(st.session_state.confirmed_symptoms)
+                    remaining = 3 - chat.symptom_count
                     st.write(f"Please describe {remaining} more symptom{'s' if remaining > 1 else ''} for a prediction.")
+        # The whole turn, including rendering the response
+        METRICS.observe_seconds("chat_turn", time.perf_counter() - turn_start)
+
+    # Offer likely next symptoms as one-click options until a prediction is possible
+    if 0 < chat.symptom_count < 3:
+        with METRICS.span("app_stage", stage="suggest"):
+            # Weighed over the ensemble's top diseases for the symptoms so
+            # far; the API does this itself for a remote suggester
+            posterior = None if INFERENCE_API_URL else disease_posterior(*chat.predict(predictor))
+            suggestions = suggester.suggest(sorted(chat.symptoms(predictor.symptom_index)), k=3,
+                                            disease_probabilities=posterior)
+        if suggestions:
+            st.write("Do you also have any of these?")
+            for column, symptom in zip(st.columns(len(suggestions)), suggestions):
+                if column.button(symptom, key=f"suggest_{symptom}"):
+                    st.session_state.suggested_symptom = symptom
+                    st.rerun()
 
     # Add a clear button
     if st.button("Clear All"):
-        st.session_state.confirmed_symptoms.clear()
-        st.session_state.messages = []
+        chat.clear()
+        st.session_state.history_pages = 1
         st.rerun()
 
 if __name__ == "__main__":
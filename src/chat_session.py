@@ -0,0 +1,73 @@
+import os
+import zlib
+from collections import deque
+from itertools import islice
+
+# Chat state of one browser session in the Streamlit app. Thousands of these
+# live in one server process, so it is kept small and bounded: the confirmed
+# symptoms are a bitmask over the predictor's symptom index (bit i for
+# symptom column i) rather than a set of strings, and the message log keeps
+# only the newest max_messages messages as (role, text) pairs, with longer
+# texts zlib-compressed. Nothing here grows with the length of the
+# conversation except the count of dropped messages.
+
+CHAT_HISTORY_LIMIT = int(os.environ.get("CHAT_HISTORY_LIMIT", "200"))
+# Shorter texts don't get smaller under zlib
+COMPRESS_MIN_CHARS = 128
+
+
+class ChatSession:
+    def __init__(self, max_messages=CHAT_HISTORY_LIMIT):
+        self.mask = 0
+        self.log = deque(maxlen=max_messages)
+        self.messages = 0
+        # ((model version, mask), prediction) of the last predict(), reused
+        # until the symptoms or the serving models change
+        self.prediction = None
+
+    def confirm(self, symptoms, symptom_index):
+        # Adds the known symptoms; returns how many were new
+        before = self.mask
+        for symptom in symptoms:
+            if symptom in symptom_index:
+                self.mask |= 1 << symptom_index[symptom]
+        return (self.mask & ~before).bit_count()
+
+    @property
+    def symptom_count(self):
+        return self.mask.bit_count()
+
+    def symptoms(self, symptom_index):
+        mask = self.mask
+        return [symptom for symptom, index in symptom_index.items() if mask >> index & 1]
+
+    def predict(self, predictor):
+        key = (predictor.version, self.mask)
+        if self.prediction is None or self.prediction[0] != key:
+            self.prediction = (key, predictor.predict(self.symptoms(predictor.symptom_index)))
+        return self.prediction[1]
+
+    def add(self, role, content):
+        if len(content) >= COMPRESS_MIN_CHARS:
+            content = zlib.compress(content.encode("utf-8"))
+        self.log.append((role, content))
+        self.messages += 1
+
+    @property
+    def dropped(self):
+        # Messages that no longer fit in the log
+        return self.messages - len(self.log)
+
+    def recent(self, n):
+        # The newest n kept messages, oldest first, as (role, text)
+        newest = list(islice(reversed(self.log), n))
+        return [
+            (role, zlib.decompress(content).decode("utf-8") if isinstance(content, bytes) else content)
+            for role, content in reversed(newest)
+        ]
+
+    def clear(self):
+        self.mask = 0
+        self.log.clear()
+        self.messages = 0
+        self.prediction = None
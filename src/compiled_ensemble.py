@@ -0,0 +1,379 @@
+import operator
+import numpy as np
+from scipy import sparse
+from sklearn.dummy import DummyClassifier
+from sklearn.svm import SVC
+from model import row_softmax
+
+# Batches up to this size take the per-row paths below
+SMALL_BATCH = 4
+NO_MATCH = np.iinfo(np.int64).max
+
+# Compiled form of the DiseasePredictor ensemble. The fitted SVM, Naive Bayes,
+# Random Forest and Gradient Boosting models are exported into flat NumPy
+# arrays once, so scoring a request is a handful of vectorized operations
+# instead of four sklearn predict_proba dispatches with their input checks.
+#
+# Every array lives in self.arrays so the whole ensemble can be written to a
+# single file and mapped back in by other processes.
+
+
+class CompiledEnsemble:
+    def __init__(self, arrays, n_classes, n_features, gamma):
+        self.arrays = arrays
+        self.n_classes = n_classes
+        self.n_features = n_features
+        self.gamma = gamma
+        self._pairs = np.triu_indices(n_classes, k=1)
+
+    @classmethod
+    def from_predictor(cls, predictor):
+        if not isinstance(predictor.svm_model, SVC):
+            raise ValueError("The compiled ensemble needs the kernel SVC, not a streaming-trained linear SVM")
+        arrays = {}
+        arrays.update(_compile_svm(predictor.svm_model))
+        arrays.update(_compile_nb(predictor.nb_model))
+        arrays.update(_compile_forest(
+            "rf", predictor.rf_model.estimators_, predictor.rf_model.n_features_in_
+        ))
+        arrays.update(_compile_forest(
+            "gb", predictor.gb_model.estimators_.ravel(), predictor.gb_model.n_features_in_
+        ))
+
+        n_classes = len(predictor.encoder.classes_)
+        rf_values = np.concatenate([
+            tree.tree_.value[:, 0, :] for tree in predictor.rf_model.estimators_
+        ])
+        arrays["rf_leaf_values"] = np.ascontiguousarray(rf_values)
+
+        gb = predictor.gb_model
+        gb_values = np.concatenate([
+            gb.learning_rate * tree.tree_.value[:, 0, 0] for tree in gb.estimators_.ravel()
+        ])
+        arrays["gb_leaf_values"] = gb_values
+        arrays["gb_init"] = _gb_init_raw(gb)
+
+        return cls(arrays, n_classes, len(predictor.symptom_columns), float(predictor.svm_model._gamma))
+
+    def predict_proba_matrix(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        present = X > 0.5
+        active = _active_features(present, self.n_features)
+        return {
+            'svm': self._svm_proba(X, active),
+            'nb': self._nb_proba(present),
+            'rf': self._rf_proba(present, active),
+            'gb': self._gb_proba(present, active)
+        }
+
+    def _svm_proba(self, X, active):
+        a = self.arrays
+
+        # RBF kernel against every support vector. With binary inputs the
+        # squared distances are small integers, so they are exact. A few rows
+        # are cheaper to score by summing the support vector columns of the
+        # symptoms that are present than with a full matrix product.
+        if len(X) <= SMALL_BATCH:
+            dot = a["svm_sv_t"][active].sum(axis=1)
+        else:
+            dot = X @ a["svm_sv_t"][:self.n_features]
+        sq_dist = (X * X).sum(axis=1)[:, None] + a["svm_sv_sq"] - 2 * dot
+        kernel = np.exp(-self.gamma * sq_dist)
+
+        # One-vs-one decision values, then libsvm's Platt sigmoid per pair
+        decision = kernel @ a["svm_pair_coef"] + a["svm_intercept"]
+        f_ab = decision * a["svm_prob_a"] + a["svm_prob_b"]
+        e = np.exp(-np.abs(f_ab))
+        pairwise = np.where(f_ab >= 0, e / (1.0 + e), 1.0 / (1.0 + e))
+        pairwise = np.clip(pairwise, 1e-7, 1 - 1e-7)
+
+        if self.n_classes == 2:
+            return np.column_stack([pairwise[:, 0], 1 - pairwise[:, 0]])
+
+        r = np.zeros((len(X), self.n_classes, self.n_classes))
+        first, second = self._pairs
+        r[:, first, second] = pairwise
+        r[:, second, first] = 1 - pairwise
+        if len(X) <= SMALL_BATCH:
+            return np.array([_multiclass_probability_row(row) for row in r.tolist()])
+        return _multiclass_probability(r)
+
+    def _nb_proba(self, present):
+        a = self.arrays
+
+        # Per-class sum of (x - theta)^2 / var, read from the x=0 / x=1 tables
+        sq_terms = np.where(present[:, None, :], a["nb_sq_one"], a["nb_sq_zero"])
+        joint_log_likelihood = a["nb_log_prior"] + (a["nb_log_norm"] - 0.5 * sq_terms.sum(axis=2))
+        return row_softmax(joint_log_likelihood)
+
+    def _forest_leaf_values(self, prefix, present, active):
+        a = self.arrays
+        max_depth = int(a[f"{prefix}_max_depth"][0])
+
+        # Shallow trees are cheapest to walk level by level; deep ones jump
+        # from one right turn to the next
+        if max_depth <= 2 * (active.shape[1] + 1):
+            binary = np.zeros((len(present), self.n_features + 1), dtype=np.intp)
+            binary[:, :self.n_features] = present
+            rows = np.arange(len(present))[:, None]
+            nodes = np.broadcast_to(a[f"{prefix}_root_nodes"], (len(present), len(a[f"{prefix}_root_nodes"])))
+            for _ in range(max_depth):
+                nodes = a[f"{prefix}_child"][2 * nodes + binary[rows, a[f"{prefix}_feature"][nodes]]]
+        else:
+            nodes = _apply_forest(a, prefix, active, self.n_features + 1)
+        return a[f"{prefix}_leaf_values"][nodes]
+
+    def _rf_proba(self, present, active):
+        values = self._forest_leaf_values("rf", present, active)
+        return values.sum(axis=1) / values.shape[1]
+
+    def _gb_proba(self, present, active):
+        n_trees_per_stage = len(self.arrays["gb_init"])
+        values = self._forest_leaf_values("gb", present, active)
+        raw = self.arrays["gb_init"] + values.reshape(len(values), -1, n_trees_per_stage).sum(axis=1)
+        if n_trees_per_stage == 1:
+            positive = 1.0 / (1.0 + np.exp(-raw[:, 0]))
+            return np.column_stack([1 - positive, positive])
+        return row_softmax(raw)
+
+
+def _compile_svm(svm):
+    # An SVC fitted on sparse input keeps its support vectors and dual
+    # coefficients as sparse matrices
+    dual_coef = svm.dual_coef_.toarray() if sparse.issparse(svm.dual_coef_) else svm.dual_coef_
+    support_vectors = svm.support_vectors_
+    if sparse.issparse(support_vectors):
+        support_vectors = support_vectors.toarray()
+    n_support = svm.n_support_
+    starts = np.concatenate([[0], np.cumsum(n_support)])
+    n_classes = len(n_support)
+
+    # Column p holds the coefficients libsvm uses for the p-th (i, j) class pair
+    pairs = [(i, j) for i in range(n_classes) for j in range(i + 1, n_classes)]
+    pair_coef = np.zeros((support_vectors.shape[0], len(pairs)))
+    for p, (i, j) in enumerate(pairs):
+        pair_coef[starts[i]:starts[i + 1], p] = dual_coef[j - 1, starts[i]:starts[i + 1]]
+        pair_coef[starts[j]:starts[j + 1], p] = dual_coef[i, starts[j]:starts[j + 1]]
+
+    # Transposed, with a zero row for the padding feature index
+    support_vectors = np.asarray(support_vectors, dtype=np.float64)
+    sv_t = np.zeros((support_vectors.shape[1] + 1, len(support_vectors)))
+    sv_t[:-1] = support_vectors.T
+    return {
+        "svm_sv_t": sv_t,
+        "svm_sv_sq": (support_vectors * support_vectors).sum(axis=1),
+        "svm_pair_coef": pair_coef,
+        "svm_intercept": np.asarray(svm._intercept_, dtype=np.float64),
+        "svm_prob_a": np.asarray(svm.probA_, dtype=np.float64),
+        "svm_prob_b": np.asarray(svm.probB_, dtype=np.float64)
+    }
+
+
+def _compile_nb(nb):
+    theta = nb.theta_
+    var = nb.var_
+    return {
+        "nb_log_prior": np.log(nb.class_prior_),
+        "nb_log_norm": -0.5 * np.sum(np.log(2.0 * np.pi * var), axis=1),
+        "nb_sq_zero": ((0.0 - theta) ** 2) / var,
+        "nb_sq_one": ((1.0 - theta) ** 2) / var
+    }
+
+
+def _gb_init_raw(gb):
+    n_trees_per_stage = gb.estimators_.shape[1]
+    if isinstance(gb.init_, str) and gb.init_ == 'zero':
+        return np.zeros(n_trees_per_stage)
+    if not isinstance(gb.init_, DummyClassifier):
+        raise ValueError("Compiled ensemble only supports the default GradientBoosting init estimator")
+    # The prior-based init does not depend on the input, so one row is enough
+    return gb._raw_predict_init(np.zeros((1, gb.n_features_in_), dtype=np.float32))[0]
+
+
+def _compile_forest(prefix, trees, n_features):
+    # Inputs are binary, so each split sends x=0 left and x=1 right. A path
+    # therefore runs down the chain of left children until it reaches a node
+    # testing a symptom that is present, turns right, and starts a new chain.
+    # Every tree is flattened into chains and a sorted (chain, feature) table
+    # giving the first node on that chain that tests the feature.
+    #
+    # The plain node arrays (split feature and a child table indexed by
+    # 2 * node + x) are kept as well for shallow trees. Leaves test a padding
+    # column that is always 0 and point back to themselves.
+    chain_leaf = []
+    right_chain = []
+    roots = []
+    keys = []
+    depths = []
+    nodes = []
+    features = []
+    children = []
+    root_nodes = []
+    max_depth = 0
+    offset = 0
+
+    for tree in trees:
+        t = tree.tree_
+        internal = t.children_left != -1
+        thresholds = t.threshold[internal]
+        if len(thresholds) and (thresholds.min() < 0 or thresholds.max() >= 1):
+            raise ValueError("Compiled ensemble requires trees fitted on binary features")
+
+        leaf = t.children_left == -1
+        own = np.arange(t.node_count) + offset
+        features.append(np.where(leaf, n_features, t.feature))
+        children.append(np.column_stack([
+            np.where(leaf, own, t.children_left + offset),
+            np.where(leaf, own, t.children_right + offset)
+        ]).ravel())
+        root_nodes.append(offset)
+        max_depth = max(max_depth, t.max_depth)
+
+        tree_right_chain = np.full(t.node_count, -1, dtype=np.int64)
+        root_chain = len(chain_leaf)
+        chain_leaf.append(-1)
+        roots.append(root_chain)
+        stack = [(0, root_chain, 0)]
+        while stack:
+            node, chain, depth = stack.pop()
+            left = t.children_left[node]
+            if left == -1:
+                chain_leaf[chain] = offset + node
+                continue
+            keys.append(chain * (n_features + 1) + t.feature[node])
+            depths.append(depth)
+            nodes.append(offset + node)
+            new_chain = len(chain_leaf)
+            chain_leaf.append(-1)
+            tree_right_chain[node] = new_chain
+            stack.append((left, chain, depth + 1))
+            stack.append((t.children_right[node], new_chain, depth + 1))
+
+        right_chain.append(tree_right_chain)
+        offset += t.node_count
+
+    keys = np.asarray(keys, dtype=np.int64)
+    depths = np.asarray(depths, dtype=np.int64)
+    nodes = np.asarray(nodes, dtype=np.int64)
+
+    # Keep only the shallowest node per (chain, feature) key, and end the
+    # table with a sentinel so searchsorted never runs off the end
+    order = np.lexsort((depths, keys))
+    keys, first = np.unique(keys[order], return_index=True)
+    keys = np.append(keys, NO_MATCH)
+    key_depth = np.append(depths[order][first], NO_MATCH)
+    key_node = np.append(nodes[order][first], -1)
+    return {
+        f"{prefix}_max_depth": np.array([max_depth], dtype=np.int64),
+        f"{prefix}_feature": np.concatenate(features).astype(np.intp),
+        f"{prefix}_child": np.concatenate(children).astype(np.intp),
+        f"{prefix}_root_nodes": np.asarray(root_nodes, dtype=np.intp),
+        f"{prefix}_roots": np.asarray(roots, dtype=np.int64),
+        f"{prefix}_chain_leaf": np.asarray(chain_leaf, dtype=np.int64),
+        f"{prefix}_right_chain": np.concatenate(right_chain),
+        f"{prefix}_keys": keys,
+        f"{prefix}_key_depth": key_depth,
+        f"{prefix}_key_node": key_node
+    }
+
+
+def _active_features(present, n_features):
+    # Indices of the present symptoms per row, padded with n_features, which
+    # never appears in a forest table
+    counts = np.count_nonzero(present, axis=1)
+    width = max(int(counts.max()) if len(counts) else 0, 1)
+    order = np.argsort(~present, axis=1, kind='stable')[:, :width]
+    return np.where(np.arange(width) < counts[:, None], order, n_features)
+
+
+def _apply_forest(arrays, prefix, active, stride):
+    roots = arrays[f"{prefix}_roots"]
+    keys = arrays[f"{prefix}_keys"]
+    key_depth = arrays[f"{prefix}_key_depth"]
+    key_node = arrays[f"{prefix}_key_node"]
+    right_chain = arrays[f"{prefix}_right_chain"]
+
+    chains = np.broadcast_to(roots, (len(active), len(roots)))
+    rows = np.arange(len(active))[:, None]
+    trees = np.arange(len(roots))
+
+    # A path turns right at most once per present symptom
+    for _ in range(active.shape[1] + 1):
+        lookup = chains[:, :, None] * stride + active[:, None, :]
+        position = np.searchsorted(keys, lookup)
+        found = keys[position] == lookup
+        depth = np.where(found, key_depth[position], NO_MATCH)
+        best = depth.argmin(axis=2)
+        turns = found[rows, trees, best]
+        if not turns.any():
+            break
+        chains = np.where(turns, right_chain[key_node[position[rows, trees, best]]], chains)
+
+    return arrays[f"{prefix}_chain_leaf"][chains]
+
+
+def _multiclass_probability_row(r):
+    # Same as _multiclass_probability for a single row in plain Python floats,
+    # which beats NumPy's per-call overhead on a 10x10 problem. Instead of
+    # dividing every p[j] by (1 + diff) after each update, p is kept scaled
+    # by the running product of those factors and normalised once per sweep.
+    k = len(r)
+    Q = [[0.0] * k for _ in range(k)]
+    for t in range(k):
+        for j in range(t):
+            Q[t][t] += r[j][t] * r[j][t]
+            Q[t][j] = Q[j][t]
+        for j in range(t + 1, k):
+            Q[t][t] += r[j][t] * r[j][t]
+            Q[t][j] = -r[j][t] * r[t][j]
+    p = [1.0 / k] * k
+    eps = 0.005 / k
+    mul = operator.mul
+
+    for _ in range(max(100, k)):
+        Qp = [sum(map(mul, Q_t, p)) for Q_t in Q]
+        pQp = sum(map(mul, p, Qp))
+        if max(abs(value - pQp) for value in Qp) < eps:
+            break
+        scale = 1.0
+        for t in range(k):
+            Q_t = Q[t]
+            diff = (-Qp[t] + pQp) / Q_t[t]
+            p[t] += diff * scale
+            pQp = (pQp + diff * (diff * Q_t[t] + 2 * Qp[t])) / (1 + diff) / (1 + diff)
+            Qp = [(value + diff * q) / (1 + diff) for value, q in zip(Qp, Q_t)]
+            scale *= 1 + diff
+        p = [value / scale for value in p]
+    return p
+
+
+def _multiclass_probability(r):
+    # libsvm's pairwise coupling (Wu, Lin and Weng, method 2), run for all
+    # rows at once; each row stops iterating once it meets libsvm's criterion
+    n_rows, k = r.shape[:2]
+    Q = -np.transpose(r, (0, 2, 1)) * r
+    diagonal = (r * r).sum(axis=1)
+    Q[:, np.arange(k), np.arange(k)] = diagonal
+    p = np.full((n_rows, k), 1.0 / k)
+    eps = 0.005 / k
+
+    active = np.arange(n_rows)
+    for _ in range(max(100, k)):
+        Qa = Q[active]
+        pa = p[active]
+        Qp = np.einsum('ntj,nj->nt', Qa, pa)
+        pQp = (pa * Qp).sum(axis=1)
+        error = np.abs(Qp - pQp[:, None]).max(axis=1)
+        keep = error >= eps
+        if not keep.any():
+            break
+        active = active[keep]
+        Qa, pa, Qp, pQp = Qa[keep], pa[keep], Qp[keep], pQp[keep]
+        for t in range(k):
+            diff = (-Qp[:, t] + pQp) / Qa[:, t, t]
+            pa[:, t] += diff
+            pQp = (pQp + diff * (diff * Qa[:, t, t] + 2 * Qp[:, t])) / (1 + diff) / (1 + diff)
+            Qp = (Qp + diff[:, None] * Qa[:, t, :]) / (1 + diff)[:, None]
+            pa /= (1 + diff)[:, None]
+        p[active] = pa
+    return p
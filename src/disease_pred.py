@@ -1,6 +1,7 @@
 import streamlit as st
 from model import DiseasePredictor
 from nlp_processor import SymptomExtractor
+from recommendations import default_catalog
 from symptoms import AVAILABLE_SYMPTOMS
 import os
 
@@ -70,26 +71,19 @@ def main():
                 if len(st.session_state.confirmed_symptoms) >= 3:
                     diseases, confidences = predictor.predict(list(st.session_state.confirmed_symptoms))
                     result = "\nTop 3 Predictions:"
-                    
-                    # Collect all diagnostic tests for predicted diseases
-                    all_tests = {}
-                    for disease, confidence in zip(diseases, confidences):
-                        if disease in TESTS:
-                            for test in TESTS[disease]:
-                                if test not in all_tests:
-                                    all_tests[test] = []
-                                all_tests[test].append(disease)
+                    recommendations = default_catalog()
                     
                     for i, (disease, confidence) in enumerate(zip(diseases, confidences), 1):
                         result += f"\n{i}. {disease} (Confidence: {confidence:.1f}%)"
-                        if disease in TESTS:
-                            result += f"\n   Recommended diagnostic tests: {', '.join(TESTS[disease])}"
+                        tests = recommendations.items('tests', disease)
+                        if tests:
+                            result += f"\n   Recommended diagnostic tests: {', '.join(tests)}"
                     
                     st.write(result)
                     
                     # Display common diagnostic tests across multiple diseases
                     st.write("\n🏥 Common Diagnostic Test Recommendations:")
-                    common_tests = [test for test, diseases in all_tests.items() if len(diseases) > 1]
+                    common_tests = recommendations.common('tests', diseases)
                     if common_tests:
                         for test in common_tests:
                             st.write(f"- {test}")
@@ -0,0 +1,164 @@
+import json
+import os
+import numpy as np
+from scipy.optimize import minimize
+from features import pack_rows, unpack_rows
+from model import top_k_indices
+
+# A compact student model distilled from the four-model ensemble: one small
+# ReLU hidden layer (or plain softmax regression with hidden=0) over the
+# binary symptom columns, fitted to reproduce the ensemble's weighted
+# probabilities rather than the training labels. The saved artifact holds
+# the weights plus what a predictor needs besides the models (classes,
+# symptom columns, the bit-packed training rows for the suggester), so a
+# replica can serve from it without loading the joblib bundle.
+
+# Bump whenever the layout of the saved student changes
+STUDENT_FORMAT_VERSION = 2
+
+
+class StudentModel:
+    def __init__(self, arrays, metadata):
+        self.arrays = arrays
+        self.metadata = metadata
+        self.classes = np.asarray(metadata['classes'])
+        self.symptoms = metadata['symptoms']
+
+    def predict_proba(self, X):
+        a = self.arrays
+        hidden = np.asarray(X, dtype=np.float64)
+        if 'W1' in a:
+            hidden = np.maximum(hidden @ a['W1'] + a['b1'], 0)
+        return softmax(hidden @ a['W2'] + a['b2'])
+
+    def save(self, path, training_X, training_y):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # np.savez appends .npz to names without it, so the temporary file
+        # keeps the extension
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(
+            tmp_path,
+            metadata=np.array(json.dumps(self.metadata)),
+            training_bits=pack_rows(training_X),
+            training_y=np.asarray(training_y),
+            **self.arrays
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        # The student and the training rows saved with it
+        with np.load(path, allow_pickle=False) as f:
+            metadata = json.loads(str(f['metadata']))
+            if metadata.get('format_version') != STUDENT_FORMAT_VERSION:
+                raise ValueError(f"Unsupported student model format: {metadata.get('format_version')}")
+            arrays = {name: f[name] for name in ('W1', 'b1', 'W2', 'b2') if name in f.files}
+            training_X = unpack_rows(f['training_bits'], len(metadata['symptoms']))
+            training_y = f['training_y']
+        return cls(arrays, metadata), training_X, training_y
+
+
+def softmax(scores):
+    scores = scores - scores.max(axis=1, keepdims=True)
+    proba = np.exp(scores)
+    return proba / proba.sum(axis=1, keepdims=True)
+
+
+def intake_rows(n_rows, n_symptoms, rng, min_symptoms=1, max_symptoms=7):
+    # Random symptom sets of the size users report in the chat, which the
+    # training rows alone cover poorly
+    X = np.zeros((n_rows, n_symptoms), dtype=np.uint8)
+    for i, size in enumerate(rng.integers(min_symptoms, max_symptoms + 1, size=n_rows)):
+        X[i, rng.choice(n_symptoms, size, replace=False)] = 1
+    return X
+
+
+def transfer_set(predictor, n_synthetic=20000, seed=0):
+    # Rows to distill on, and the ensemble's weighted probabilities for them
+    rng = np.random.default_rng(seed)
+    X = np.vstack([predictor.training_X, intake_rows(n_synthetic, len(predictor.symptom_columns), rng)])
+    models = predictor.snapshot()
+    return X, predictor._weighted(predictor.predict_proba_matrix(X, models)), models['version']
+
+
+def fit_student(X, targets, hidden=32, l2=1e-5, max_iter=3000, seed=0):
+    # Minimises the cross-entropy against the soft targets (the KL divergence
+    # from the ensemble plus a constant) with L-BFGS, on the whole transfer set
+    X = np.asarray(X, dtype=np.float64)
+    n_features, n_classes = X.shape[1], targets.shape[1]
+    shapes = {'W1': (n_features, hidden), 'b1': (hidden,), 'W2': (hidden, n_classes), 'b2': (n_classes,)}
+    if not hidden:
+        shapes = {'W2': (n_features, n_classes), 'b2': (n_classes,)}
+    sizes = [int(np.prod(shape)) for shape in shapes.values()]
+
+    def unflatten(w):
+        arrays = {}
+        for (name, shape), end in zip(shapes.items(), np.cumsum(sizes)):
+            arrays[name] = w[end - int(np.prod(shape)):end].reshape(shape)
+        return arrays
+
+    def loss_and_gradient(w):
+        a = unflatten(w)
+        hidden_in = X @ a['W1'] + a['b1'] if hidden else None
+        h = np.maximum(hidden_in, 0) if hidden else X
+        proba = softmax(h @ a['W2'] + a['b2'])
+        loss = -(targets * np.log(np.maximum(proba, 1e-300))).sum() / len(X)
+        error = (proba - targets) / len(X)
+        gradients = {'W2': h.T @ error, 'b2': error.sum(axis=0)}
+        if hidden:
+            back = (error @ a['W2'].T) * (hidden_in > 0)
+            gradients['W1'] = X.T @ back
+            gradients['b1'] = back.sum(axis=0)
+        for name in ('W1', 'W2'):
+            if name in a:
+                loss += l2 * (a[name] ** 2).sum()
+                gradients[name] = gradients[name] + 2 * l2 * a[name]
+        return loss, np.concatenate([gradients[name].ravel() for name in shapes])
+
+    # Small random input weights so the hidden units start out different
+    rng = np.random.default_rng(seed)
+    w0 = np.concatenate([
+        rng.normal(0, 0.1, size) if name == 'W1' else np.zeros(size) for name, size in zip(shapes, sizes)
+    ])
+    result = minimize(loss_and_gradient, w0, jac=True, method='L-BFGS-B', options={'maxiter': max_iter})
+    return unflatten(result.x)
+
+
+def distill(predictor, hidden=32, n_synthetic=20000, l2=1e-5, max_iter=3000, seed=0):
+    if predictor.model_id is None:
+        raise ValueError("This model has no model ID to distill it from; retrain it first")
+    X, targets, version = transfer_set(predictor, n_synthetic, seed)
+    arrays = fit_student(X, targets, hidden, l2, max_iter, seed)
+    metadata = {
+        'format_version': STUDENT_FORMAT_VERSION,
+        'teacher_version': version,
+        'training_hash': predictor.training_hash,
+        'model_id': predictor.model_id,
+        'revision': predictor.revision,
+        'hidden': hidden,
+        'transfer_rows': len(X),
+        'classes': predictor.encoder.classes_.tolist(),
+        'symptoms': sorted(predictor.symptom_index, key=predictor.symptom_index.get),
+        'symptom_columns': list(predictor.symptom_columns),
+        'weights': dict(predictor.weights)
+    }
+    return StudentModel({name: np.ascontiguousarray(a) for name, a in arrays.items()}, metadata)
+
+
+def fidelity(teacher, student, top_k=3):
+    # How closely the student's probabilities follow the ensemble's on the
+    # same rows, ranking ties the way predict() does
+    teacher_top = top_k_indices(teacher, top_k)
+    student_top = top_k_indices(student, top_k)
+    overlap = np.mean([len(set(t) & set(s)) / top_k for t, s in zip(teacher_top, student_top)])
+    kl = (teacher * (np.log(np.maximum(teacher, 1e-300)) - np.log(np.maximum(student, 1e-300)))).sum(axis=1)
+    return {
+        'rows': len(teacher),
+        'top1_agreement': float(np.mean(teacher_top[:, 0] == student_top[:, 0])),
+        f'top{top_k}_overlap': float(overlap),
+        'kl_mean': float(kl.mean()),
+        'kl_p95': float(np.percentile(kl, 95)),
+        'max_abs_diff': float(np.abs(teacher - student).max())
+    }
@@ -0,0 +1,208 @@
+import json
+import os
+import joblib
+import numpy as np
+from sklearn.base import clone
+from model import DiseasePredictor, fit_model, top_k_indices
+
+# Evaluation of a DiseasePredictor on a whole symptom matrix at once: one
+# predict_proba call per model for all rows (in chunks), metrics computed
+# from confusion matrices with NumPy, and bootstrap resamples and k-fold
+# refits spread over worker processes. Labels are the encoded class ids of
+# the predictor's LabelEncoder throughout.
+
+METRIC_NAMES = ('accuracy', 'precision', 'recall', 'f1', 'macro_f1')
+
+
+def score_matrix(predictor, X, chunk_size=10000):
+    # Predicted class id of every row, for the ensemble and for each model on
+    # its own. Rows without symptoms get no answer from predict(), so they
+    # are counted as the most common training disease, as a caller would
+    # have to guess. Ties go to the highest class id, as in predict().
+    models = predictor.snapshot()
+    predictions = {}
+    for start in range(0, len(X), chunk_size):
+        probas = predictor.predict_proba_matrix(X[start:start + chunk_size], models)
+        probas['ensemble'] = predictor._weighted(probas)
+        for name, proba in probas.items():
+            predictions.setdefault(name, []).append(top_k_indices(proba, 1)[:, 0])
+    predictions = {name: np.concatenate(chunks) for name, chunks in predictions.items()}
+
+    empty = ~X.any(axis=1)
+    if empty.any():
+        most_common = np.bincount(predictor.training_y).argmax()
+        for pred in predictions.values():
+            pred[empty] = most_common
+    return predictions
+
+
+def confusion_matrices(y_true, y_pred, n_classes):
+    # (n, n_classes, n_classes) counts for n label/prediction sets of equal
+    # length, rows true and columns predicted; 1-d inputs give one matrix
+    y_true = np.atleast_2d(y_true)
+    y_pred = np.atleast_2d(y_pred)
+    n = len(y_true)
+    cells = (np.arange(n)[:, None] * n_classes + y_true) * n_classes + y_pred
+    return np.bincount(cells.ravel(), minlength=n * n_classes * n_classes).reshape(n, n_classes, n_classes)
+
+
+def metrics_from_confusion(confusion):
+    # Accuracy, support-weighted precision/recall/F1 and macro F1 of each
+    # confusion matrix, as sklearn computes them with zero_division=0
+    confusion = np.asarray(confusion, dtype=np.float64)
+    if confusion.ndim == 2:
+        return {name: float(values[0]) for name, values in metrics_from_confusion(confusion[None]).items()}
+    correct = np.diagonal(confusion, axis1=1, axis2=2)
+    support = confusion.sum(axis=2)
+    predicted = confusion.sum(axis=1)
+    total = support.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted > 0, correct / predicted, 0.0)
+        recall = np.where(support > 0, correct / support, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        weights = support / total[:, None]
+    return {
+        'accuracy': correct.sum(axis=1) / total,
+        'precision': (precision * weights).sum(axis=1),
+        'recall': (recall * weights).sum(axis=1),
+        'f1': (f1 * weights).sum(axis=1),
+        # Only classes that occur in the labels or the predictions, like sklearn
+        'macro_f1': np.array([row[present].mean() if present.any() else 0.0
+                              for row, present in zip(f1, (support + predicted) > 0)])
+    }
+
+
+def _bootstrap_chunk(y_true, y_pred, n_classes, n_resamples, seed):
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(y_true), size=(n_resamples, len(y_true)))
+    return metrics_from_confusion(confusion_matrices(y_true[rows], y_pred[rows], n_classes))
+
+
+def bootstrap(y_true, y_pred, n_classes, n_resamples=1000, confidence=0.95, seed=0, n_jobs=1, chunk_resamples=100):
+    # Percentile confidence interval of every metric over n_resamples
+    # resamples of the rows with replacement. Chunks of resamples run in
+    # parallel, each with its own seed, so results don't depend on n_jobs.
+    chunks = [min(chunk_resamples, n_resamples - start) for start in range(0, n_resamples, chunk_resamples)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    results = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(_bootstrap_chunk)(y_true, y_pred, n_classes, size, chunk_seed)
+        for size, chunk_seed in zip(chunks, seeds)
+    )
+    tail = (1 - confidence) / 2 * 100
+    intervals = {}
+    for name in METRIC_NAMES:
+        values = np.concatenate([result[name] for result in results])
+        intervals[name] = {
+            'low': float(np.percentile(values, tail)),
+            'high': float(np.percentile(values, 100 - tail)),
+            'std': float(values.std())
+        }
+    return intervals
+
+
+def fold_spec(predictor):
+    # What a worker process needs to refit the predictor's ensemble: unfitted
+    # copies of its models and the label and symptom encodings. The predictor
+    # itself holds locks and threads and can't be sent to another process.
+    models = predictor.snapshot()
+    return {
+        'models': {name: clone(models[name]) for name in ('svm', 'nb', 'rf', 'gb')},
+        'encoder': predictor.encoder,
+        'symptom_index': predictor.symptom_index,
+        'symptom_columns': predictor.symptom_columns,
+        'weights': predictor.weights,
+        'compact_training': predictor.compact_training
+    }
+
+
+def fold_predictor(spec, X, y):
+    # A predictor with the spec's ensemble fitted on X, y the way train()
+    # fits it
+    fold = DiseasePredictor()
+    fold.encoder = spec['encoder']
+    fold.predictions_classes = fold.encoder.classes_
+    fold.symptom_index = spec['symptom_index']
+    fold.symptom_columns = spec['symptom_columns']
+    fold.weights = spec['weights']
+    fold.compact_training = spec['compact_training']
+    inputs = fold._fit_inputs(X, y, *fold._compacted(X, y))
+    for name, fit_input in inputs.items():
+        model, _, _ = fit_model(clone(spec['models'][name]), *fit_input)
+        setattr(fold, f"{name}_model", model)
+    fold.training_X = X
+    fold.training_y = y
+    return fold
+
+
+def _evaluate_fold(spec, X, y, train_rows, test_rows):
+    fold = fold_predictor(spec, X[train_rows], y[train_rows])
+    n_classes = len(spec['encoder'].classes_)
+    return {
+        name: metrics_from_confusion(confusion_matrices(y[test_rows], pred, n_classes)[0])
+        for name, pred in score_matrix(fold, X[test_rows]).items()
+    }
+
+
+def stratified_folds(y, k, seed=0):
+    # (train rows, test rows) of k folds, with every class spread evenly
+    rng = np.random.default_rng(seed)
+    fold_of = np.empty(len(y), dtype=np.int64)
+    for label in np.unique(y):
+        rows = rng.permutation(np.flatnonzero(y == label))
+        fold_of[rows] = (np.arange(len(rows)) + rng.integers(k)) % k
+    return [(np.flatnonzero(fold_of != i), np.flatnonzero(fold_of == i)) for i in range(k)]
+
+
+def cross_validate(predictor, X, y, k=5, seed=0, n_jobs=1):
+    # Refits the ensemble on k-1 folds and scores the held-out fold, for each
+    # of the k folds in parallel; per-fold metrics for the ensemble and each
+    # model, and their mean and standard deviation
+    spec = fold_spec(predictor)
+    folds = joblib.Parallel(n_jobs=n_jobs)(
+        joblib.delayed(_evaluate_fold)(spec, X, y, train_rows, test_rows)
+        for train_rows, test_rows in stratified_folds(y, k, seed)
+    )
+    summary = {}
+    for name in folds[0]:
+        summary[name] = {}
+        for metric in METRIC_NAMES:
+            values = np.array([fold[name][metric] for fold in folds])
+            summary[name][metric] = {'mean': float(values.mean()), 'std': float(values.std())}
+    return {'folds': folds, 'summary': summary}
+
+
+def write_report(directory, report, confusion, class_names, plot=True):
+    # metrics.json, confusion_matrix.csv and, if plot and matplotlib is
+    # installed, confusion_matrix.png, drawn off-screen
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, "metrics.json"), os.path.join(directory, "confusion_matrix.csv")]
+    with open(paths[0], "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    with open(paths[1], "w", encoding="utf-8") as f:
+        f.write("true\\predicted," + ",".join(class_names) + "\n")
+        for name, row in zip(class_names, confusion):
+            f.write(name + "," + ",".join(str(int(n)) for n in row) + "\n")
+
+    if not plot:
+        return paths
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        return paths
+    fig, ax = plt.subplots(figsize=(10, 8))
+    image = ax.imshow(confusion, cmap='Blues')
+    fig.colorbar(image, ax=ax)
+    ax.set_xticks(range(len(class_names)), class_names, rotation=45, ha='right')
+    ax.set_yticks(range(len(class_names)), class_names)
+    for (i, j), n in np.ndenumerate(confusion):
+        ax.text(j, i, int(n), ha='center', va='center', color='white' if n > confusion.max() / 2 else 'black')
+    ax.set_xlabel("Predicted Label")
+    ax.set_ylabel("True Label")
+    ax.set_title("Confusion Matrix")
+    fig.tight_layout()
+    paths.append(os.path.join(directory, "confusion_matrix.png"))
+    fig.savefig(paths[-1], dpi=100)
+    plt.close(fig)
+    return paths
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Compact symptom features. Symptoms are binary and only a few percent of
+# them are present in a case, so rows are kept as uint8 (1 byte per symptom),
+# bit-packed (1 bit per symptom) or CSR (only the present symptoms) instead of
+# the int64/float64 DataFrames pandas produces by default.
+
+LABEL_COLUMN = "prognosis"
+
+
+def is_parquet(path):
+    return str(path).endswith((".parquet", ".pq"))
+
+
+def read_symptom_columns(path):
+    # Header-only read: the symptom columns without loading any rows
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        columns = pq.read_schema(path).names
+    else:
+        columns = pd.read_csv(path, nrows=0).columns
+    return [column for column in columns if column != LABEL_COLUMN and not column.startswith("Unnamed")]
+
+
+def load_training_data(path, symptom_columns=None):
+    # Reads the symptom columns straight into uint8 and the labels as
+    # strings. Missing or non-binary values raise instead of being dropped.
+    if symptom_columns is None:
+        symptom_columns = read_symptom_columns(path)
+    dtypes = {column: np.uint8 for column in symptom_columns}
+    dtypes[LABEL_COLUMN] = str
+    data = pd.read_csv(path, usecols=symptom_columns + [LABEL_COLUMN], dtype=dtypes)
+    X = data[symptom_columns].to_numpy()
+    if X.size and X.max() > 1:
+        raise ValueError(f"Symptom values in {path} must be 0 or 1")
+    return X, data[LABEL_COLUMN].to_numpy(), symptom_columns
+
+
+def iter_blocks(path, symptom_columns=None, block_rows=100000):
+    # Streams a CSV or Parquet file as (uint8 symptoms, labels) blocks of at
+    # most block_rows rows, so memory depends on the block size and not on
+    # the file. Every block is checked against the symptom schema.
+    if symptom_columns is None:
+        symptom_columns = read_symptom_columns(path)
+    columns = symptom_columns + [LABEL_COLUMN]
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        batches = pq.ParquetFile(path).iter_batches(batch_size=block_rows, columns=columns)
+        frames = (batch.to_pandas() for batch in batches)
+    else:
+        # Read as floats so missing values survive to validation instead of
+        # failing the parser without saying where
+        dtypes = {column: np.float32 for column in symptom_columns}
+        dtypes[LABEL_COLUMN] = str
+        frames = pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=block_rows)
+
+    first_row = 0
+    for frame in frames:
+        yield validate_block(frame, symptom_columns, path, first_row)
+        first_row += len(frame)
+
+
+def validate_block(frame, symptom_columns, path, first_row):
+    missing = [column for column in symptom_columns + [LABEL_COLUMN] if column not in frame.columns]
+    if missing:
+        raise ValueError(f"{path} is missing {len(missing)} columns, e.g. {missing[:5]}")
+    values = frame[symptom_columns].to_numpy()
+    invalid = ~np.isin(values, (0, 1))
+    if invalid.any():
+        row, column = np.argwhere(invalid)[0]
+        raise ValueError(
+            f"{path} row {first_row + row + 1}: {symptom_columns[column]} is {values[row, column]}, expected 0 or 1"
+        )
+    labels = frame[LABEL_COLUMN].to_numpy(dtype=object)
+    empty = pd.isna(labels) | (labels == "")
+    if empty.any():
+        raise ValueError(f"{path} row {first_row + np.flatnonzero(empty)[0] + 1}: missing {LABEL_COLUMN}")
+    return values.astype(np.uint8), labels.astype(str)
+
+
+def read_labels(path, block_rows=1000000):
+    # The label column alone, for a pass that only needs classes and counts
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=block_rows, columns=[LABEL_COLUMN]):
+            yield batch.column(0).to_numpy(zero_copy_only=False).astype(str)
+    else:
+        for frame in pd.read_csv(path, usecols=[LABEL_COLUMN], dtype=str, chunksize=block_rows):
+            yield frame[LABEL_COLUMN].to_numpy(dtype=object).astype(str)
+
+
+class Reservoir:
+    # Uniform random sample of up to `size` rows from a stream of blocks
+    # (reservoir sampling), for the models that need their rows in memory
+    def __init__(self, size, n_features, seed=0):
+        self.X = np.zeros((size, n_features), dtype=np.uint8)
+        self.y = np.zeros(size, dtype=np.int64)
+        self.size = size
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    def add(self, X, y):
+        # Fill the free slots first, then row t replaces a random slot with
+        # probability size / (t + 1)
+        fill = max(0, min(len(y), self.size - self.seen))
+        self.X[self.seen:self.seen + fill] = X[:fill]
+        self.y[self.seen:self.seen + fill] = y[:fill]
+        t = self.seen + np.arange(fill, len(y))
+        slots = (self.rng.random(len(t)) * (t + 1)).astype(np.int64)
+        keep = np.flatnonzero(slots < self.size) + fill
+        if len(keep):
+            # A later row wins a slot chosen twice in the same block
+            slots = slots[keep - fill][::-1]
+            slots, last = np.unique(slots, return_index=True)
+            rows = keep[::-1][last]
+            self.X[slots] = X[rows]
+            self.y[slots] = y[rows]
+        self.seen += len(y)
+
+    def sample(self):
+        n = min(self.seen, self.size)
+        return self.X[:n], self.y[:n]
+
+
+def to_csr(X):
+    # Only the present symptoms, as float32 like the trees use internally
+    return sparse.csr_matrix(X, dtype=np.float32)
+
+
+def pack_rows(X):
+    return np.packbits(X, axis=1)
+
+
+def compact_rows(X, y):
+    # Collapses identical (symptoms, label) rows into one, in order of first
+    # occurrence. Returns the unique rows, their labels and how many times
+    # each occurred. Models whose fit sums over rows fit them with the counts
+    # as sample_weight as they fit all rows; resampling models don't.
+    labels = np.ascontiguousarray(y, dtype='<u4').view(np.uint8).reshape(len(y), 4)
+    keys = np.ascontiguousarray(np.concatenate([pack_rows(X), labels], axis=1))
+    keys = keys.view(np.dtype((np.void, keys.shape[1]))).ravel()
+    _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    order = np.argsort(first)
+    first = first[order]
+    return X[first], y[first], counts[order]
+
+
+def unpack_rows(bits, n_features):
+    return np.unpackbits(bits, axis=1, count=n_features)
+
+
+def nbytes(X):
+    # Memory held by a dense array, a DataFrame or a sparse matrix
+    if sparse.issparse(X):
+        return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes
+    if isinstance(X, pd.DataFrame):
+        return int(X.memory_usage(index=False, deep=True).sum())
+    return X.nbytes
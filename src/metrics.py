@@ -0,0 +1,321 @@
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import nullcontext
+
+# In-process timing spans, counters and histograms for the chat hot path,
+# exported as Prometheus text or JSON lines. Everything is off unless
+# METRICS_ENABLED=1 (or METRICS.enabled is set): a disabled span is a shared
+# no-op context manager and a disabled counter returns at once. Series are
+# keyed by name and labels in the order they are passed, so each call site
+# always passes its labels in the same order.
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED") == "1"
+METRICS_EXPORT_PATH = os.environ.get("METRICS_EXPORT_PATH")
+METRICS_EXPORT_INTERVAL = float(os.environ.get("METRICS_EXPORT_INTERVAL", "60"))
+METRICS_PROFILE = os.environ.get("METRICS_PROFILE") == "1"
+METRICS_PROFILE_INTERVAL = float(os.environ.get("METRICS_PROFILE_INTERVAL", "0.02"))
+
+# Upper bounds in seconds for span durations, and in rows for sizes
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1, 2, 5, 10, 100, 1000, 10000, 100000, 1000000)
+
+NULL_SPAN = nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        # One count per bucket plus one for values above the largest bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        with self.lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        # (cumulative (bound, count) pairs, sum, count)
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = []
+        running = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            running += n
+            cumulative.append((bound, running))
+        return cumulative, total, count
+
+
+class CounterSeries:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, value=1):
+        with self.lock:
+            self.value += value
+
+
+class Span:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Metrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+
+    def span(self, name, **labels):
+        # Times the block into the histogram <name>_seconds
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self.histogram(name + "_seconds", LATENCY_BUCKETS, tuple(labels.items())))
+
+    def timed(self, histogram):
+        # span() for a histogram bound with histogram()
+        return Span(histogram) if self.enabled else NULL_SPAN
+
+    def count(self, name, value=1, **labels):
+        if self.enabled:
+            self.counter(name, tuple(labels.items())).inc(value)
+
+    def observe(self, name, value, buckets=SIZE_BUCKETS, **labels):
+        if self.enabled:
+            self.histogram(name, buckets, tuple(labels.items())).observe(value)
+
+    def observe_seconds(self, name, seconds, **labels):
+        # What a span records, for code that times itself
+        if self.enabled:
+            self.histogram(name + "_seconds", LATENCY_BUCKETS, tuple(labels.items())).observe(seconds)
+
+    # counter() and histogram() return the series for a name and labels,
+    # created on first use. Hot paths bind them once and update them
+    # directly, which skips building the key and taking the registry lock;
+    # they check enabled themselves.
+    def counter(self, name, labels=()):
+        key = (name, labels)
+        counter = self.counters.get(key)
+        if counter is None:
+            with self.lock:
+                counter = self.counters.setdefault(key, CounterSeries())
+        return counter
+
+    def histogram(self, name, buckets=LATENCY_BUCKETS, labels=()):
+        key = (name, labels)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def remove(self, name, labels=()):
+        # Drops a counter or histogram series, e.g. of something unloaded;
+        # code still holding it can update it but it is no longer exported
+        with self.lock:
+            self.counters.pop((name, labels), None)
+            self.histograms.pop((name, labels), None)
+
+    def add_collector(self, collect):
+        # collect() is called on every export and returns (name, labels, type,
+        # value) series, for numbers something else already keeps
+        self.collectors.append(collect)
+
+    def reset(self):
+        # Bound series stay registered and are zeroed in place
+        with self.lock:
+            counters = list(self.counters.values())
+            histograms = list(self.histograms.values())
+        for counter in counters:
+            with counter.lock:
+                counter.value = 0
+        for histogram in histograms:
+            with histogram.lock:
+                histogram.clear()
+
+    def series(self):
+        # (name, labels, type, value) for every counter, histogram and collected
+        # series, where a histogram's value is (cumulative buckets, sum, count)
+        with self.lock:
+            counters = sorted(self.counters.items(), key=lambda item: item[0])
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        for (name, labels), counter in counters:
+            yield name, labels, "counter", counter.value
+        for (name, labels), histogram in histograms:
+            yield name, labels, "histogram", histogram.snapshot()
+        for collect in list(self.collectors):
+            yield from collect()
+
+    def prometheus_text(self):
+        lines = []
+        typed = set()
+        for name, labels, kind, value in self.series():
+            if name not in typed:
+                lines.append(f"# TYPE {name} {kind}")
+                typed.add(name)
+            if kind != "histogram":
+                lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            buckets, total, count = value
+            for bound, cumulative in buckets:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def json_lines(self):
+        # One JSON object per series, stamped with the export time
+        now = time.time()
+        lines = []
+        for name, labels, kind, value in self.series():
+            record = {"time": now, "name": name, "labels": dict(labels), "type": kind}
+            if kind != "histogram":
+                record["value"] = value
+            else:
+                buckets, record["sum"], record["count"] = value
+                record["buckets"] = {("+Inf" if bound == float("inf") else bound): n for bound, n in buckets}
+            lines.append(json.dumps(record))
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def write(self, path):
+        # Prometheus text for *.prom, JSON lines (appended) otherwise
+        if path.endswith(".prom"):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, path)
+        else:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(self.json_lines())
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+def stats_collector(prefix, get_stats):
+    # Collector exposing the numbers in a stats() dict (PredictionCache,
+    # PosteriorTable) as gauges named <prefix>_<key>; get_stats may return None
+    def collect():
+        stats = get_stats() or {}
+        for key, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                yield f"{prefix}_{key}", (), "gauge", value
+    return collect
+
+
+def add_lookup_collectors(predictor, metrics=None):
+    # A DiseasePredictor's cache and posterior table hit counts, read from
+    # their stats() on export rather than counted again on every prediction
+    metrics = metrics or METRICS
+    metrics.add_collector(stats_collector("prediction_cache", lambda: predictor.cache and predictor.cache.stats()))
+    metrics.add_collector(stats_collector(
+        "posterior_table", lambda: predictor.posterior_table and predictor.posterior_table.stats()
+    ))
+
+
+class SamplingProfiler:
+    # Samples the stack of every other thread at a fixed interval and counts
+    # each distinct stack, in the collapsed format flamegraph tools read
+    # ("outer;inner count" per line). Costs one stack walk per thread per
+    # sample and nothing when stopped.
+    def __init__(self, interval=METRICS_PROFILE_INTERVAL, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            sampled = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                sampled.append(";".join(reversed(stack)))
+            with self.lock:
+                self.stacks.update(sampled)
+                self.samples += 1
+
+    def collapsed(self):
+        with self.lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def write(self, path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.collapsed())
+        os.replace(tmp_path, path)
+
+
+def start_file_export(path, interval=METRICS_EXPORT_INTERVAL, metrics=None, profiler=None):
+    # Writes the metrics (and the profile, next to them) every interval
+    # seconds, for processes without an HTTP endpoint such as the Streamlit app
+    metrics = metrics or METRICS
+
+    def export():
+        while True:
+            time.sleep(interval)
+            try:
+                metrics.write(path)
+                if profiler is not None:
+                    profiler.write(f"{path}.stacks")
+            except OSError as e:
+                print(f"Error exporting metrics to {path}: {e}")
+
+    thread = threading.Thread(target=export, name="metrics-export", daemon=True)
+    thread.start()
+    return thread
+
+
+METRICS = Metrics(enabled=METRICS_ENABLED)
+# Started only when asked for, since it samples for the life of the process
+PROFILER = SamplingProfiler().start() if METRICS_PROFILE else None
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from metrics import METRICS, SIZE_BUCKETS
+
+# Coalesces predict() calls from many threads (API request threads, Streamlit
+# sessions) into one predict_batch() call, so concurrent chat turns share one
+# vectorized predict_proba per model instead of queueing behind each other.
+# A single worker thread scores a batch; calls that arrive while it is busy
+# form the next one. Under concurrent load (the last batch or the queue
+# holds more than one call) the worker also lingers up to max_wait seconds
+# for more before scoring; a lone call on an idle service is scored at once.
+
+MICRO_BATCH_WAIT_MS = float(os.environ.get("MICRO_BATCH_WAIT_MS", "2"))
+# Callers score each turn on its own when this is 0
+MICRO_BATCH_MAX_ROWS = int(os.environ.get("MICRO_BATCH_MAX_ROWS", "256"))
+
+BATCH_ROWS = METRICS.histogram("micro_batch_rows", SIZE_BUCKETS)
+
+
+class MicroBatcher:
+    def __init__(self, predictor, max_wait=MICRO_BATCH_WAIT_MS / 1000, max_batch=MICRO_BATCH_MAX_ROWS):
+        self.predictor = predictor
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.pending = []
+        self.condition = threading.Condition()
+        self.closed = False
+        self.batches = 0
+        self.rows = 0
+        self.largest = 0
+        self.last_batch = 0
+        self.thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self.thread.start()
+
+    @property
+    def symptom_index(self):
+        return self.predictor.symptom_index
+
+    @property
+    def version(self):
+        return self.predictor.version
+
+    def submit(self, symptoms):
+        # Future of (diseases, confidences) for one symptom list
+        future = Future()
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self.pending.append((list(symptoms), future))
+            self.condition.notify()
+        return future
+
+    def predict(self, symptoms, timeout=None):
+        # Same result as DiseasePredictor.predict, scored with whatever else
+        # is in flight
+        future = self.submit(symptoms)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            # Not scored yet: drop it from the queue
+            future.cancel()
+            raise
+
+    async def predict_async(self, symptoms):
+        return await asyncio.wrap_future(self.submit(symptoms))
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
+
+    def _take_batch(self):
+        with self.condition:
+            while not self.pending and not self.closed:
+                self.condition.wait()
+            if not self.pending:
+                return None
+            busy = self.last_batch > 1 or len(self.pending) > 1
+            deadline = time.monotonic() + (self.max_wait if busy else 0)
+            while len(self.pending) < self.max_batch and not self.closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = self.pending[:self.max_batch]
+            del self.pending[:self.max_batch]
+            self.last_batch = len(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            # Callers that gave up (e.g. timed out) are dropped unscored
+            batch = [(symptoms, future) for symptoms, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            if METRICS.enabled:
+                BATCH_ROWS.observe(len(batch))
+            try:
+                results = self.predictor.predict_batch([symptoms for symptoms, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+            self.batches += 1
+            self.rows += len(batch)
+            self.largest = max(self.largest, len(batch))
+
+    def stats(self):
+        return {
+            'max_wait_ms': self.max_wait * 1000,
+            'max_batch': self.max_batch,
+            'batches': self.batches,
+            'rows': self.rows,
+            'mean_batch': self.rows / self.batches if self.batches else 0.0,
+            'largest_batch': self.largest,
+            'queued': len(self.pending)
+        }
@@ -1,15 +1,67 @@
-
-import pandas as pd
+import copy
+import hashlib
+import itertools
+import json
+import os
+import pickle
+import threading
+import time
+import tracemalloc
+import uuid
+import joblib
+import sklearn
 import numpy as np
 from sklearn.svm import SVC
+from sklearn.linear_model import SGDClassifier
 from sklearn.naive_bayes import GaussianNB
 from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+from sklearn.isotonic import IsotonicRegression
 from sklearn.preprocessing import LabelEncoder
-from scipy import stats
+from sklearn.base import clone
+from scipy import optimize, sparse
+from scipy.special import expit
+from features import Reservoir, compact_rows, iter_blocks, load_training_data, pack_rows, read_labels, read_symptom_columns, to_csr, unpack_rows
+from metrics import METRICS, SIZE_BUCKETS
+
+# Metric series for scoring with the models, bound once. Cache and posterior
+# table hits are counted by their own stats() instead, which keeps a hit free
+# of metric updates.
+SCORED_ROWS = METRICS.histogram("scored_batch_rows", SIZE_BUCKETS)
+PREDICT_PROBA_SECONDS = {
+    name: METRICS.histogram("predict_proba_seconds", labels=(("model", name),))
+    for name in ("svm", "nb", "rf", "gb", "compiled", "student")
+}
+RANK_SECONDS = METRICS.histogram("rank_seconds")
+CASCADE_ROWS = {
+    stage: METRICS.counter("cascade_rows_total", (("exit", stage),))
+    for stage in ("early", "escalated")
+}
+
+ENSEMBLE_MODELS = ('svm', 'nb', 'rf', 'gb')
+
+# Bump whenever the layout of the saved bundle changes so stale files get retrained
+BUNDLE_FORMAT_VERSION = 4
+
+# Model weights for ensemble
+DEFAULT_WEIGHTS = {
+    'svm': 0.3,
+    'nb': 0.2,
+    'rf': 0.25,
+    'gb': 0.25
+}
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 
 class DiseasePredictor:
     def __init__(self):
-        self.svm_model = SVC(probability=True, kernel='rbf', C=1.0)
+        self.svm_model = SVC(probability=True, kernel='rbf', C=1.0, random_state=42)
         self.nb_model = GaussianNB()
         self.rf_model = RandomForestClassifier(n_estimators=100, random_state=42)
         self.gb_model = GradientBoostingClassifier(n_estimators=100, random_state=42)
@@ -17,83 +69,947 @@ class DiseasePredictor:
         self.symptom_index = {}
         self.predictions_classes = []
         self.symptom_columns = []
-        # Model weights for ensemble
-        self.weights = {
-            'svm': 0.3,
-            'nb': 0.2,
-            'rf': 0.25,
-            'gb': 0.25
-        }
+        # Hash of the CSV the models were fitted on, used to detect stale bundles
+        self.training_hash = None
+        # Random ID given to every set of fitted models (train() and each
+        # update()), which cached predictions, posterior tables, students and
+        # published models are keyed on
+        self.model_id = None
+        # Optional flat-array form of the ensemble, see compile()
+        self.compiled = None
+        # Optional PredictionCache shared between sessions
+        self.cache = None
+        # Optional precomputed PosteriorTable, only used while its version matches
+        self.posterior_table = None
+        # Training rows kept for update(): uint8 symptom matrix and encoded
+        # labels. A predictor attached to a ModelHost holds the mapped
+        # bit-packed rows in training_bits instead, unpacked on first use.
+        self._training_X = None
+        self.training_bits = None
+        self.training_y = None
+        # Optional precomputed SymptomSuggester tables, mapped from a ModelHost
+        self.suggester_tables = None
+        # Bumped by every update() that swaps in new models, and the revision
+        # at which each model was last replaced
+        self.revision = 0
+        self.model_revisions = {'svm': 0, 'nb': 0, 'rf': 0, 'gb': 0}
+        # Guards swapping models against scoring and saving
+        self.lock = threading.Lock()
+        # Serialises update() and the background refit publishing their models
+        self.update_lock = threading.Lock()
+        self.refit_thread = None
+        self.refit_requested = False
+        self.refit_error = None
+        # Wall time of each model in the last train(), and its peak traced
+        # memory when traced
+        self.training_report = {}
+        # Whether train() and the background refit fit Naive Bayes and the SVM
+        # on unique rows weighted by their counts instead of every row (the
+        # trees always fit every row)
+        self.compact_training = True
+        # Optional cascade settings from enable_cascade()
+        self.cascade = None
+        # Optional distilled StudentModel served instead of the ensemble
+        self.student = None
+        self.weights = dict(DEFAULT_WEIGHTS)
 
-    def train(self, training_data_path):
-        # Read the training data
-        data = pd.read_csv(training_data_path).dropna(axis=1)
+    def train(self, training_data_path, n_jobs=1, compact=True, trace_memory=False):
+        # Read the training data as a uint8 symptom matrix and string labels
+        X, labels, self.symptom_columns = load_training_data(training_data_path)
 
         # Get symptoms list and create index
-        self.symptom_columns = data.columns[:-1].tolist()
+        self.symptom_index = {}
         for index, symptom in enumerate(self.symptom_columns):
             formatted_symptom = " ".join(word.capitalize() for word in symptom.split("_"))
             self.symptom_index[formatted_symptom] = index
 
         # Encode the target variable
-        data["prognosis"] = self.encoder.fit_transform(data["prognosis"])
+        y = self.encoder.fit_transform(labels)
         self.predictions_classes = self.encoder.classes_
 
-        # Split features and target
-        X = data.iloc[:, :-1]
-        y = data.iloc[:, -1]
+        # Case archives repeat the same symptoms and diagnosis many times.
+        # The models are fitted on the unique rows weighted by their counts;
+        # the full rows are still kept for update().
+        self.compact_training = compact
+        start = time.perf_counter()
+        X_fit, y_fit, weights = self._compacted(X, y)
+        self.training_report = {'compaction': {
+            'rows': len(y),
+            'unique_rows': len(y_fit),
+            'seconds': time.perf_counter() - start
+        }}
+
+        # (rows, labels, sample weights) of each model. SVM and the trees take
+        # the sparse matrix directly; GaussianNB needs dense rows and is fed
+        # the uint8 matrix a block at a time.
+        inputs = self._fit_inputs(X, y, X_fit, y_fit, weights)
+
+        # Train all models. With n_jobs > 1 the four models are fitted at the
+        # same time in worker processes, and the cores left over after one
+        # process per model go to the random forest's own tree building.
+        start = time.perf_counter()
+        models = {'svm': self.svm_model, 'gb': self.gb_model, 'rf': self.rf_model, 'nb': self.nb_model}
+        if n_jobs == -1:
+            n_jobs = os.cpu_count() or 1
+        if n_jobs > 1:
+            self.rf_model.set_params(n_jobs=max(1, n_jobs - len(models) + 1))
+            fitted = joblib.Parallel(n_jobs=min(n_jobs, len(models)))(
+                joblib.delayed(fit_model)(model, *inputs[name], trace_memory=trace_memory)
+                for name, model in models.items()
+            )
+        else:
+            fitted = [fit_model(model, *inputs[name], trace_memory=trace_memory) for name, model in models.items()]
+        for name, (model, seconds, peak) in zip(models, fitted):
+            setattr(self, f"{name}_model", model)
+            self.training_report[name] = fit_report(seconds, peak)
+        # Single requests are faster without spinning up threads
+        self.rf_model.set_params(n_jobs=None)
+        self.training_report['total_seconds'] = time.perf_counter() - start
+        self.training_report['n_jobs'] = n_jobs
+        self.compiled = None
+
+        self.training_X = X
+        self.training_y = y
+        self.revision = 0
+        self.model_revisions = {'svm': 0, 'nb': 0, 'rf': 0, 'gb': 0}
+        self.training_hash = file_sha256(training_data_path)
+        self.model_id = uuid.uuid4().hex
+
+    def _compacted(self, X, y):
+        # (rows, labels, sample weights) to fit on; no weights when
+        # compaction is off or finds no repeated rows
+        if self.compact_training:
+            X_unique, y_unique, counts = compact_rows(X, y)
+            if len(y_unique) < len(y):
+                return X_unique, y_unique, counts
+        return X, y, None
+
+    @staticmethod
+    def _fit_inputs(X, y, X_fit, y_fit, weights):
+        # The trees always get every row. The forest bootstraps the rows it
+        # is given, and a bootstrap of unique rows weighted by their counts is
+        # a different draw of trees than a bootstrap of all rows. Boosting's
+        # weighted split gains round differently from the same sums over
+        # repeated rows, and on binary symptoms many splits tie, so the
+        # weighted trees branch differently.
+        X_sparse = to_csr(X_fit)
+        full_input = (X_sparse, y_fit, None) if weights is None else (to_csr(X), y, None)
+        return {
+            'svm': (X_sparse, y_fit, weights),
+            'gb': full_input,
+            'rf': full_input,
+            'nb': (X_fit, y_fit, weights)
+        }
+
+    def train_streaming(self, training_data_path, block_rows=100000, sample_rows=100000, epochs=1, seed=42,
+                        trace_memory=False):
+        # Trains from a CSV or Parquet file of any size with memory bounded by
+        # block_rows and sample_rows. A first pass reads only the labels. Then
+        # each block updates GaussianNB (partial_fit) and a linear SVM trained
+        # by SGD, which replaces the kernel SVC, and feeds a reservoir sample
+        # of sample_rows rows on which the forest and boosting are fitted.
+        start = time.perf_counter()
+        self.symptom_columns = read_symptom_columns(training_data_path)
+        self.symptom_index = {}
+        for index, symptom in enumerate(self.symptom_columns):
+            formatted_symptom = " ".join(word.capitalize() for word in symptom.split("_"))
+            self.symptom_index[formatted_symptom] = index
+
+        classes = set()
+        for labels in read_labels(training_data_path):
+            classes.update(labels)
+        self.encoder.fit(sorted(classes))
+        self.predictions_classes = self.encoder.classes_
+        class_ids = np.arange(len(self.encoder.classes_))
+
+        self.nb_model = GaussianNB()
+        self.svm_model = SGDClassifier(loss='modified_huber', random_state=seed)
+        reservoir = Reservoir(sample_rows, len(self.symptom_columns), seed)
+        rng = np.random.default_rng(seed)
+        column_sums = np.zeros(len(self.symptom_columns))
+        for epoch in range(epochs):
+            for X, labels in iter_blocks(training_data_path, self.symptom_columns, block_rows):
+                y = self.encoder.transform(labels)
+                if epoch == 0:
+                    self.nb_model.partial_fit(X, y, classes=class_ids)
+                    column_sums += X.sum(axis=0)
+                    reservoir.add(X, y)
+                # SGD sees each block in random order
+                order = rng.permutation(len(y))
+                self.svm_model.partial_fit(to_csr(X[order]), y[order], classes=class_ids)
+        n_rows = reservoir.seen
+
+        # Variance smoothing from the whole file, as fit_gaussian_nb does
+        frequency = column_sums / max(n_rows, 1)
+        epsilon = self.nb_model.var_smoothing * (frequency * (1 - frequency)).max()
+        self.nb_model.var_ += epsilon - self.nb_model.epsilon_
+        self.nb_model.epsilon_ = epsilon
+        self.training_report = {'streaming_seconds': time.perf_counter() - start}
+
+        X_sample, y_sample = reservoir.sample()
+        X_sparse = to_csr(X_sample)
+        for name in ('rf', 'gb'):
+            model, seconds, peak = fit_model(getattr(self, f"{name}_model"), X_sparse, y_sample, trace_memory=trace_memory)
+            setattr(self, f"{name}_model", model)
+            self.training_report[name] = fit_report(seconds, peak)
+        self.training_report.update(
+            total_seconds=time.perf_counter() - start, rows=n_rows, sample_rows=len(y_sample)
+        )
+        self.compiled = None
+
+        # The sample stands in for the training rows in update()
+        self.training_X = X_sample.copy()
+        self.training_y = y_sample.copy()
+        self.revision = 0
+        self.model_revisions = {'svm': 0, 'nb': 0, 'rf': 0, 'gb': 0}
+        self.training_hash = file_sha256(training_data_path)
+        self.model_id = uuid.uuid4().hex
+
+    def save(self, bundle_path):
+        if self.model_id is None:
+            raise ValueError("This model has no model ID to save it under; retrain it first")
+        with self.lock:
+            bundle = {
+                'format_version': BUNDLE_FORMAT_VERSION,
+                'sklearn_version': sklearn.__version__,
+                'training_hash': self.training_hash,
+                'model_id': self.model_id,
+                'revision': self.revision,
+                'model_revisions': dict(self.model_revisions),
+                'models': {
+                    'svm': self.svm_model,
+                    'nb': self.nb_model,
+                    'rf': self.rf_model,
+                    'gb': self.gb_model
+                },
+                'encoder': self.encoder,
+                'symptom_index': self.symptom_index,
+                'symptom_columns': self.symptom_columns,
+                'weights': self.weights,
+                # Bit-packed, 1 bit per symptom
+                'training_bits': pack_rows(self.training_X),
+                'training_y': self.training_y
+            }
+            info = {'model_id': self.model_id, 'version': self.version, 'training_hash': self.training_hash}
+
+        directory = os.path.dirname(bundle_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Write uncompressed so the arrays can be memory-mapped on load, and
+        # swap the file in atomically so other processes never see a partial bundle
+        tmp_path = f"{bundle_path}.{os.getpid()}.tmp"
+        joblib.dump(bundle, tmp_path)
+        os.replace(tmp_path, bundle_path)
+
+        # A small JSON next to the bundle names its models, so students and
+        # published models can be checked against it without loading it
+        tmp_path = f"{bundle_path}.json.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        os.replace(tmp_path, f"{bundle_path}.json")
+
+    @staticmethod
+    def read_bundle_info(bundle_path):
+        # What save() wrote next to the bundle, or None
+        try:
+            with open(f"{bundle_path}.json", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def load(cls, bundle_path, mmap_mode='c'):
+        # Copy-on-write mapping: pages stay shared between processes but libsvm
+        # still gets the writable buffers it insists on
+        bundle = joblib.load(bundle_path, mmap_mode=mmap_mode)
+        if bundle.get('format_version') != BUNDLE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported model bundle format: {bundle.get('format_version')}")
+        if bundle.get('sklearn_version') != sklearn.__version__:
+            raise ValueError(
+                f"Model bundle was built with scikit-learn {bundle.get('sklearn_version')}, "
+                f"running {sklearn.__version__}"
+            )
+
+        predictor = cls()
+        predictor.svm_model = bundle['models']['svm']
+        predictor.nb_model = bundle['models']['nb']
+        predictor.rf_model = bundle['models']['rf']
+        predictor.gb_model = bundle['models']['gb']
+        predictor.encoder = bundle['encoder']
+        predictor.predictions_classes = predictor.encoder.classes_
+        predictor.symptom_index = bundle['symptom_index']
+        predictor.symptom_columns = bundle['symptom_columns']
+        predictor.weights = bundle['weights']
+        predictor.training_hash = bundle['training_hash']
+        predictor.model_id = bundle['model_id']
+        predictor.revision = bundle['revision']
+        predictor.model_revisions = bundle['model_revisions']
+        predictor.training_bits = bundle['training_bits']
+        predictor.training_y = bundle['training_y']
+        return predictor
+
+    @classmethod
+    def load_student(cls, student_path):
+        # A predictor that serves only the distilled student saved by
+        # scripts/distill_model.py, without loading the ensemble bundle.
+        # update(), compile() and the cascade need the full ensemble.
+        from distillation import StudentModel
+        student, training_X, training_y = StudentModel.load(student_path)
+        metadata = student.metadata
+        predictor = cls()
+        predictor.encoder.classes_ = student.classes
+        predictor.predictions_classes = student.classes
+        predictor.symptom_index = {symptom: index for index, symptom in enumerate(student.symptoms)}
+        predictor.symptom_columns = metadata['symptom_columns']
+        predictor.weights = metadata['weights']
+        predictor.training_hash = metadata['training_hash']
+        predictor.model_id = metadata['model_id']
+        predictor.revision = metadata['revision']
+        predictor.training_X = training_X
+        predictor.training_y = training_y
+        predictor.student = student
+        return predictor
+
+    @classmethod
+    def load_student_if_current(cls, student_path, bundle_path, training_data_path):
+        # load_student() if the student exists and was distilled from the
+        # bundle's models, fitted on the current training data, else None.
+        # Without the bundle's info file only the training data is checked.
+        if not os.path.exists(student_path):
+            return None
+        try:
+            predictor = cls.load_student(student_path)
+        except (ValueError, KeyError, OSError) as e:
+            print(f"Ignoring unusable student model {student_path}: {e}")
+            return None
+        info = cls.read_bundle_info(bundle_path)
+        if info is not None and info.get('model_id') != predictor.model_id:
+            print(f"Ignoring student model {student_path} distilled from other models than {bundle_path}")
+            return None
+        if predictor.training_hash != file_sha256(training_data_path):
+            print(f"Ignoring student model {student_path} distilled from other training data")
+            return None
+        return predictor
+
+    @classmethod
+    def load_or_train(cls, bundle_path, training_data_path):
+        # Reuse the saved bundle unless the training data changed since it was built
+        training_hash = file_sha256(training_data_path)
+        if os.path.exists(bundle_path):
+            try:
+                predictor = cls.load(bundle_path)
+                if predictor.training_hash == training_hash:
+                    return predictor
+            except (ValueError, KeyError, EOFError, pickle.UnpicklingError) as e:
+                print(f"Ignoring unusable model bundle {bundle_path}: {e}")
+
+        predictor = cls()
+        predictor.train(training_data_path)
+        predictor.save(bundle_path)
+        return predictor
+
+    def encode_rows(self, rows):
+        # Symptom matrix and encoded labels of new cases given as a DataFrame
+        # or CSV file in the Training.csv layout
+        if isinstance(rows, (str, os.PathLike)):
+            X, labels, _ = load_training_data(rows, self.symptom_columns)
+        else:
+            missing = [column for column in self.symptom_columns + ['prognosis'] if column not in rows.columns]
+            if missing:
+                raise ValueError(f"New rows are missing {len(missing)} columns, e.g. {missing[:5]}")
+            X = rows[self.symptom_columns].to_numpy(dtype=np.uint8)
+            labels = rows['prognosis'].to_numpy()
+        unknown = set(labels) - set(self.encoder.classes_)
+        if unknown:
+            raise ValueError(f"Unknown diseases {sorted(unknown)}; adding a disease needs a full train()")
+        return X, self.encoder.transform(labels)
+
+    def update(self, new_rows, rf_trees=10, background=True):
+        # Add labelled cases without retraining everything. GaussianNB and the
+        # random forest are swapped in right away: NB via partial_fit on the new
+        # rows, the forest by growing rf_trees trees on all rows and retiring as
+        # many of its oldest. SVM and GB are refit on all rows, on a background
+        # thread unless background=False, and swapped in together when ready.
+        X_new, y_new = self.encode_rows(new_rows)
+        if self.training_X is None:
+            raise ValueError("This model has no training rows to update; retrain it first")
+        if not len(y_new):
+            return self.serving_version()
+
+        with self.update_lock:
+            training_X = np.concatenate([self.training_X, X_new])
+            training_y = np.concatenate([self.training_y, y_new])
+
+            nb = copy.deepcopy(self.nb_model)
+            nb.partial_fit(X_new, y_new)
+
+            # Warm start appends trees to a copy of the list the serving forest
+            # uses. It needs a fresh seed per update, otherwise every update
+            # would grow trees from the same seeds.
+            rf = copy.copy(self.rf_model)
+            rf.estimators_ = list(rf.estimators_)
+            rf.set_params(warm_start=True, n_estimators=len(rf.estimators_) + rf_trees,
+                          random_state=len(training_y))
+            rf.fit(to_csr(training_X), training_y)
+            rf.estimators_ = rf.estimators_[rf_trees:]
+            rf.set_params(warm_start=False, n_estimators=len(rf.estimators_))
+
+            self._publish({'nb': nb, 'rf': rf}, training_X, training_y)
+
+        with self.lock:
+            self.refit_requested = True
+            if background and self.refit_thread is None:
+                self.refit_thread = threading.Thread(target=self._refit_loop, name="model-refit", daemon=True)
+                self.refit_thread.start()
+        if not background:
+            self._refit_loop()
+        return self.serving_version()
+
+    def wait_for_refit(self, timeout=None):
+        # Blocks until the background SVM/GB refit has been swapped in
+        thread = self.refit_thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.refit_thread is None
+
+    def _refit_loop(self):
+        # Refits until no update arrived during the last refit
+        while True:
+            with self.lock:
+                if not self.refit_requested:
+                    if self.refit_thread is threading.current_thread():
+                        self.refit_thread = None
+                    return
+                self.refit_requested = False
+                X, y = self.training_X, self.training_y
+                svm, gb = clone(self.svm_model), clone(self.gb_model)
+            try:
+                inputs = self._fit_inputs(X, y, *self._compacted(X, y))
+                fit_model(svm, *inputs['svm'])
+                fit_model(gb, *inputs['gb'])
+            except Exception as e:
+                print(f"Error refitting SVM/GB: {e}")
+                with self.lock:
+                    self.refit_error = str(e)
+                    if self.refit_thread is threading.current_thread():
+                        self.refit_thread = None
+                return
+            with self.update_lock:
+                self._publish({'svm': svm, 'gb': gb})
+                self.refit_error = None
 
-        # Train all models
-        self.svm_model.fit(X, y)
-        self.nb_model.fit(X, y)
-        self.rf_model.fit(X, y)
-        self.gb_model.fit(X, y)
+    def _publish(self, models, training_X=None, training_y=None):
+        # Swap in new models (and the compiled kernel built from them) as one
+        # step. Callers hold update_lock, so nothing else swaps in between.
+        compiled = None
+        if self.compiled is not None:
+            from compiled_ensemble import CompiledEnsemble
+            candidate = copy.copy(self)
+            for name, model in models.items():
+                setattr(candidate, f"{name}_model", model)
+            compiled = CompiledEnsemble.from_predictor(candidate)
+
+        with self.lock:
+            for name, model in models.items():
+                setattr(self, f"{name}_model", model)
+            if self.compiled is not None:
+                self.compiled = compiled
+            if training_X is not None:
+                self.training_X = training_X
+                self.training_y = training_y
+            self.revision += 1
+            for name in models:
+                self.model_revisions[name] = self.revision
+            self.model_id = uuid.uuid4().hex
+
+    @property
+    def training_X(self):
+        if self._training_X is None and self.training_bits is not None:
+            self._training_X = unpack_rows(self.training_bits, len(self.symptom_columns))
+        return self._training_X
+
+    @training_X.setter
+    def training_X(self, X):
+        self._training_X = X
+        self.training_bits = None
+
+    @property
+    def version(self):
+        # Identifies the fitted models, so cached predictions of one model are
+        # never served for another
+        version = self.model_id
+        if self.student is not None:
+            version = f"{version}/student"
+        elif self.weights != DEFAULT_WEIGHTS:
+            # The same models with other weights rank differently
+            version = f"{version}/weights=" + ",".join(f"{name}:{self.weights[name]:g}" for name in sorted(self.weights))
+        return version
+
+    def serving_version(self):
+        # What is serving right now, for health checks and the API
+        with self.lock:
+            return {
+                'version': self.version,
+                'model_id': self.model_id,
+                'training_hash': self.training_hash,
+                'revision': self.revision,
+                'model_revisions': dict(self.model_revisions),
+                'training_rows': 0 if self.training_y is None else len(self.training_y),
+                'refit_pending': self.refit_thread is not None,
+                'compiled': self.compiled is not None,
+                'student': self.student is not None
+            }
+
+    def snapshot(self):
+        # The models and version to score one request with, taken together so
+        # a concurrent update() can't mix old and new models in one answer
+        with self.lock:
+            return {
+                'version': self.version,
+                'svm': self.svm_model,
+                'nb': self.nb_model,
+                'rf': self.rf_model,
+                'gb': self.gb_model,
+                'compiled': self.compiled,
+                'cascade': self.cascade,
+                'student': self.student
+            }
 
     def predict(self, symptoms):
-        if not symptoms:
-            return [], []
+        return self.predict_batch([symptoms])[0]
+
+    def symptom_matrix(self, symptom_lists):
+        # Binary encoding of each symptom list, one row per list
+        rows = []
+        cols = []
+        for row, symptoms in enumerate(symptom_lists):
+            for symptom in symptoms:
+                if symptom in self.symptom_index:
+                    rows.append(row)
+                    cols.append(self.symptom_index[symptom])
+        X = np.zeros((len(symptom_lists), len(self.symptom_columns)), dtype=np.uint8)
+        X[rows, cols] = 1
+        return X
 
-        # Create an input vector (binary encoding of symptoms)
-        input_vector = np.zeros(len(self.symptom_columns))
+    def compile(self):
+        # Switch scoring to the fused NumPy kernel; call again after retraining
+        from compiled_ensemble import CompiledEnsemble
+        compiled = CompiledEnsemble.from_predictor(self)
+        with self.lock:
+            self.compiled = compiled
+        return compiled
+
+    def predict_proba_matrix(self, X, models=None):
+        if models is None:
+            models = self.snapshot()
+        if models['student'] is not None:
+            with METRICS.timed(PREDICT_PROBA_SECONDS['student']):
+                return {'student': models['student'].predict_proba(X)}
+        if models['compiled'] is not None:
+            with METRICS.timed(PREDICT_PROBA_SECONDS['compiled']):
+                return models['compiled'].predict_proba_matrix(X)
+
+        # One predict_proba call per model for the whole uint8 matrix; each
+        # model converts it to the dtype it needs. The rows stay C-ordered, so
+        # GaussianNB sums each row in the same order as a single-row call. Its
+        # probabilities are normalised here rather than by scipy's logsumexp,
+        # whose rounding depends on the batch shape.
+        probas = {}
+        with METRICS.timed(PREDICT_PROBA_SECONDS['svm']):
+            probas['svm'] = models['svm'].predict_proba(X)
+        with METRICS.timed(PREDICT_PROBA_SECONDS['nb']):
+            probas['nb'] = row_softmax(models['nb'].predict_joint_log_proba(X))
+        with METRICS.timed(PREDICT_PROBA_SECONDS['rf']):
+            probas['rf'] = models['rf'].predict_proba(X)
+        with METRICS.timed(PREDICT_PROBA_SECONDS['gb']):
+            probas['gb'] = models['gb'].predict_proba(X)
+        return probas
+
+    def symptom_mask(self, symptoms):
+        # Canonical form of a symptom set: bit i is set for symptom column i
+        mask = 0
         for symptom in symptoms:
             if symptom in self.symptom_index:
-                input_vector[self.symptom_index[symptom]] = 1
+                mask |= 1 << self.symptom_index[symptom]
+        return mask
 
-        # Convert the input vector into a DataFrame with the correct feature names.
-        import pandas as pd
-        input_df = pd.DataFrame([input_vector], columns=self.symptom_columns)
+    def predict_batch(self, symptom_lists, top_k=3, chunk_size=10000):
+        results = [([], []) for _ in symptom_lists]
+        rows = [i for i, symptoms in enumerate(symptom_lists) if symptoms]
 
-        # Get probability predictions from all models using the DataFrame
-        svm_proba = self.svm_model.predict_proba(input_df)
-        nb_proba = self.nb_model.predict_proba(input_df)
-        rf_proba = self.rf_model.predict_proba(input_df)
-        gb_proba = self.gb_model.predict_proba(input_df)
+        models = self.snapshot()
+        table = self.posterior_table
+        if table is not None and (table.version != models['version'] or top_k > table.top_k):
+            table = None
 
-        # Weighted ensemble prediction
-        weighted_proba = (
-            svm_proba * self.weights['svm'] +
-            nb_proba * self.weights['nb'] +
-            rf_proba * self.weights['rf'] +
-            gb_proba * self.weights['gb']
-        )
+        # Answer what we can from the posterior table and the cache, and only
+        # score the rest
+        if (table is not None or self.cache is not None) and rows:
+            masks = {i: self.symptom_mask(symptom_lists[i]) for i in rows}
+            misses = []
+            for i in rows:
+                found = table.lookup(masks[i], top_k) if table is not None else None
+                if found is None and self.cache is not None:
+                    found = self.cache.get(models['version'], masks[i], top_k)
+                if found is None:
+                    misses.append(i)
+                else:
+                    results[i] = found
+            self._score_rows(symptom_lists, misses, top_k, chunk_size, results, models)
+            if self.cache is not None:
+                for i in misses:
+                    self.cache.put(models['version'], masks[i], top_k, *results[i])
+            return results
+
+        self._score_rows(symptom_lists, rows, top_k, chunk_size, results, models)
+        return results
 
-        # Get top 3 predictions
-        top_3_indices = weighted_proba[0].argsort()[-3:][::-1]
-        diseases = []
-        confidences = []
-        
-        for idx in top_3_indices:
-            disease = self.encoder.inverse_transform([idx])[0]
-            confidence = float(weighted_proba[0][idx] * 100)
-            agreement_boost = 1.0
-            if (svm_proba[0][idx] > 0.3 and rf_proba[0][idx] > 0.3 and 
-                nb_proba[0][idx] > 0.3 and gb_proba[0][idx] > 0.3):
-                agreement_boost = 1.2
-            
-            adjusted_confidence = min(confidence * agreement_boost, 100)
-            diseases.append(disease)
-            confidences.append(adjusted_confidence)
-            
+    def _score_rows(self, symptom_lists, rows, top_k, chunk_size, results, models):
+        if METRICS.enabled and rows:
+            SCORED_ROWS.observe(len(rows))
+        # Score in chunks so very large batches don't materialise one huge matrix
+        for start in range(0, len(rows), chunk_size):
+            chunk_rows = rows[start:start + chunk_size]
+            X = self.symptom_matrix([symptom_lists[i] for i in chunk_rows])
+            if models['cascade'] is not None and models['compiled'] is None and models['student'] is None:
+                diseases, confidences = self._cascade_rank(X, models, top_k)
+            else:
+                probas = self.predict_proba_matrix(X, models)
+                with METRICS.timed(RANK_SECONDS):
+                    diseases, confidences = self._rank(probas, top_k)
+            for i, row in enumerate(chunk_rows):
+                results[row] = (diseases[i], confidences[i])
+
+    def use_student(self, student):
+        # Serve the distilled StudentModel instead of the ensemble, or the
+        # ensemble again with None. A student is not refitted by update(), so
+        # distill a new one after retraining.
+        with self.lock:
+            self.student = student
+        # Cached results may come from the other model
+        if self.cache is not None:
+            self.cache.invalidate()
+
+    def enable_cascade(self, threshold, confidence_map=None):
+        # Score with Naive Bayes first, and run every model only for rows
+        # where NB's margin of its top disease over the runner-up is below
+        # threshold. confidence_map, the (NB probability, ensemble
+        # confidence) points fitted by calibrate_cascade(), puts early answers
+        # on the ensemble's confidence scale; without it they carry NB's own
+        # probabilities. Ignored while the compiled kernel is active.
+        with self.lock:
+            self.cascade = {'threshold': threshold, 'confidence_map': confidence_map}
+        # Cached results may come from the other mode
+        if self.cache is not None:
+            self.cache.invalidate()
+
+    def disable_cascade(self):
+        with self.lock:
+            self.cascade = None
+        if self.cache is not None:
+            self.cache.invalidate()
+
+    def calibrate_cascade(self, X, target_agreement=0.99, max_confidence_gap=10.0, top_k=3):
+        # Enables the cascade with the lowest threshold at which the top
+        # disease still matches the full ensemble on target_agreement of the
+        # rows of X (uint8 symptoms, e.g. training_X), and the early answers'
+        # top confidence is on average within max_confidence_gap percentage
+        # points of the ensemble's. NB's probabilities are mapped onto the
+        # ensemble's confidences by an isotonic fit over the top_k diseases
+        # NB would answer with.
+        models = self.snapshot()
+        probas = self.predict_proba_matrix(X, models)
+        full = self._weighted(probas)
+        nb = self._cheap_proba(X, models)
+        nb_top = top_k_indices(nb, min(top_k, nb.shape[1]))
+        rows = np.arange(len(X))[:, None]
+        served = self._confidences(probas, full, nb_top)
+        isotonic = IsotonicRegression(out_of_bounds='clip').fit(nb[rows, nb_top].ravel(), served.ravel())
+        confidence_map = (isotonic.X_thresholds_, isotonic.y_thresholds_)
+
+        differs = nb_top[:, 0] != top_k_indices(full, 1)[:, 0]
+        gaps = np.abs(np.interp(nb[rows[:, 0], nb_top[:, 0]], *confidence_map) - served[:, 0])
+        allowed = int(np.floor((1 - target_agreement) * len(X) + 1e-9))
+        threshold = cascade_threshold(cascade_margins(nb), differs, allowed, gaps, max_confidence_gap)
+        self.enable_cascade(threshold, confidence_map)
+        return threshold
+
+    def _cheap_proba(self, X, models):
+        with METRICS.timed(PREDICT_PROBA_SECONDS['nb']):
+            return row_softmax(models['nb'].predict_joint_log_proba(X))
+
+    def cascade_exits(self, X, models=None):
+        # Which rows of X the cascade answers from Naive Bayes alone, and
+        # NB's probabilities
+        if models is None:
+            models = self.snapshot()
+        nb = self._cheap_proba(X, models)
+        return cascade_margins(nb) >= models['cascade']['threshold'], nb
+
+    def _cascade_rank(self, X, models, top_k):
+        early, nb = self.cascade_exits(X, models)
+
+        # Confident rows are ranked by Naive Bayes with confidences mapped to
+        # the ensemble's scale, the rest by the full ensemble exactly as
+        # without the cascade
+        diseases = [None] * len(X)
+        confidences = [None] * len(X)
+        rows = np.flatnonzero(early)
+        if len(rows):
+            top_indices = top_k_indices(nb[rows], top_k)
+            top_confidences = nb[rows[:, None], top_indices] * 100
+            confidence_map = models['cascade']['confidence_map']
+            if confidence_map is not None:
+                top_confidences = np.interp(top_confidences / 100, *confidence_map)
+            early_diseases = self.encoder.classes_[top_indices].tolist()
+            early_confidences = top_confidences.tolist()
+            for i, row in enumerate(rows):
+                diseases[row] = early_diseases[i]
+                confidences[row] = early_confidences[i]
+        rows = np.flatnonzero(~early)
+        if len(rows):
+            ranked_diseases, ranked_confidences = self._rank(self.predict_proba_matrix(X[rows], models), top_k)
+            for i, row in enumerate(rows):
+                diseases[row] = ranked_diseases[i]
+                confidences[row] = ranked_confidences[i]
+        if METRICS.enabled:
+            CASCADE_ROWS['early'].inc(int(early.sum()))
+            CASCADE_ROWS['escalated'].inc(len(X) - int(early.sum()))
         return diseases, confidences
 
+    def _weighted(self, probas):
+        # Weighted ensemble of the models in probas, summed in the order of
+        # the full ensemble and renormalised when some are left out. The
+        # student already stands for the weighted ensemble.
+        if 'student' in probas:
+            return probas['student']
+        weighted_proba = None
+        for name in ('svm', 'nb', 'rf', 'gb'):
+            if name in probas:
+                term = probas[name] * self.weights[name]
+                weighted_proba = term if weighted_proba is None else weighted_proba + term
+        if len(probas) < len(self.weights):
+            weighted_proba = weighted_proba / sum(self.weights[name] for name in probas)
+        return weighted_proba
+
+    def _rank(self, probas, top_k):
+        # Weighted ensemble prediction
+        weighted_proba = self._weighted(probas)
+        top_indices = top_k_indices(weighted_proba, top_k)
+        confidences = self._confidences(probas, weighted_proba, top_indices)
+        diseases = self.encoder.classes_[top_indices]
+        return diseases.tolist(), confidences.tolist()
+
+    def _confidences(self, probas, weighted_proba, indices):
+        # Confidence in % of the given diseases of each row. Diseases that
+        # all four models independently rate above 0.3 are boosted; the
+        # student or a subset of the models has nothing to agree with, so
+        # gets no boost.
+        rows = np.arange(len(indices))[:, None]
+        confidences = weighted_proba[rows, indices] * 100
+        if all(name in probas for name in ENSEMBLE_MODELS):
+            agreement = np.ones(indices.shape, dtype=bool)
+            for name in ENSEMBLE_MODELS:
+                agreement &= probas[name][rows, indices] > 0.3
+            confidences = np.minimum(confidences * np.where(agreement, 1.2, 1.0), 100)
+        return confidences
+
+
+def fit_model(model, X, y, sample_weight=None, trace_memory=False):
+    # Fits one model and measures its wall time, and with trace_memory the
+    # peak memory traced while fitting (numpy buffers and Python objects, not
+    # native allocations), else None. Tracing slows every allocation in the
+    # process, so only train_models.py turns it on.
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        if isinstance(model, GaussianNB):
+            fit_gaussian_nb(model, X, y, sample_weight=sample_weight)
+        elif isinstance(model, SVC) and sample_weight is not None and model.gamma == 'scale':
+            fit_weighted_svc(model, X, y, sample_weight)
+        else:
+            model.fit(X, y, sample_weight=sample_weight)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    return model, seconds, peak
+
+
+def fit_report(seconds, peak):
+    return {'seconds': seconds, 'peak_mb': None if peak is None else peak / 2**20}
+
+
+def fit_weighted_svc(model, X, y, sample_weight):
+    # gamma='scale' is 1 / (n_features * X.var()) over the rows SVC is given.
+    # For compacted rows it has to be the variance of the rows they stand
+    # for, so it is computed with the weights and passed as a number. The
+    # fitted kernel keeps that value; the parameter goes back to 'scale' so
+    # refits on other rows compute their own.
+    squared = X.multiply(X) if sparse.issparse(X) else np.square(X, dtype=np.float64)
+    total = sample_weight.sum() * X.shape[1]
+    mean = (sample_weight @ X).sum() / total
+    variance = (sample_weight @ squared).sum() / total - mean ** 2
+    model.set_params(gamma=1.0 / (X.shape[1] * variance) if variance != 0 else 1.0)
+    try:
+        model.fit(X, y, sample_weight=sample_weight)
+        if model.probability:
+            # _probA/_probB are private to sklearn's SVC. This relies on the
+            # sklearn version pinned in the bundle (load() refuses any other),
+            # and the check below fails the fit if predict_proba stops
+            # reading them the way libsvm does.
+            model._probA, model._probB = weighted_platt(model, X, y, sample_weight)
+            rows = X[:50]
+            if not np.allclose(model.predict_proba(rows), platt_proba(model, rows), rtol=0, atol=1e-9):
+                raise RuntimeError(
+                    f"scikit-learn {sklearn.__version__} no longer computes SVC probabilities from "
+                    f"_probA/_probB; the weighted Platt calibration needs updating"
+                )
+    finally:
+        model.set_params(gamma='scale')
+    return model
+
+
+def platt_proba(model, X):
+    # SVC probabilities computed by hand from the one-vs-one decision values
+    # and the model's Platt sigmoids, as sklearn's libsvm does: a sigmoid per
+    # pair of classes, then pairwise coupling (even for two classes)
+    from compiled_ensemble import _multiclass_probability
+    values = copy.copy(model).set_params(decision_function_shape='ovo').decision_function(X)
+    if values.ndim == 1:
+        values = -values[:, None]
+    pairwise = np.clip(expit(-(values * model._probA + model._probB)), 1e-7, 1 - 1e-7)
+    n_classes = len(model.classes_)
+    r = np.zeros((len(values), n_classes, n_classes))
+    first, second = np.triu_indices(n_classes, 1)
+    r[:, first, second] = pairwise
+    r[:, second, first] = 1 - pairwise
+    return _multiclass_probability(r)
+
+
+def weighted_platt(model, X, y, counts, n_folds=5):
+    # libsvm turns SVC decision values into probabilities with a sigmoid per
+    # pair of classes, fitted on decision values from a 5-fold split of the
+    # rows it was given. Given compacted rows it splits the unique rows and
+    # ignores their counts, so its sigmoids aren't the ones all rows give.
+    # Here each row's count is spread over the folds the way a split of all
+    # rows spreads the copies, and each sigmoid is fitted with the held-out
+    # counts as weights. Returns (probA, probB) in libsvm's pair order.
+    rng = np.random.default_rng(model.random_state)
+    counts = np.asarray(counts, dtype=np.int64)
+    fold_counts = rng.multinomial(counts, np.full(n_folds, 1 / n_folds))
+    pairs = list(itertools.combinations(model.classes_, 2))
+    decisions = {pair: ([], [], []) for pair in pairs}
+    for fold in range(n_folds):
+        held_out = fold_counts[:, fold]
+        fit_counts = counts - held_out
+        fit_rows = np.flatnonzero(fit_counts)
+        test_rows = np.flatnonzero(held_out)
+        sub = clone(model).set_params(probability=False, decision_function_shape='ovo')
+        sub.fit(X[fit_rows], y[fit_rows], sample_weight=fit_counts[fit_rows])
+        values = sub.decision_function(X[test_rows])
+        if values.ndim == 1:
+            # Two classes: sklearn flips the sign to favour the second one
+            values = -values[:, None]
+        y_test = y[test_rows]
+        for column, pair in enumerate(itertools.combinations(sub.classes_, 2)):
+            rows = (y_test == pair[0]) | (y_test == pair[1])
+            decisions[pair][0].append(values[rows, column])
+            decisions[pair][1].append(y_test[rows] == pair[0])
+            decisions[pair][2].append(held_out[test_rows][rows])
+
+    # A pair missing from every fold keeps libsvm's own sigmoid
+    prob_a, prob_b = model._probA.copy(), model._probB.copy()
+    for index, pair in enumerate(pairs):
+        if decisions[pair][0]:
+            prob_a[index], prob_b[index] = fit_sigmoid(*(np.concatenate(parts) for parts in decisions[pair]))
+    return prob_a, prob_b
+
+
+def fit_sigmoid(decision, positive, weight):
+    # Platt's P(positive) = 1 / (1 + exp(A * decision + B)) as libsvm fits
+    # it, with targets smoothed by the class totals, every row weighted
+    prior1 = weight[positive].sum()
+    prior0 = weight[~positive].sum()
+    negative_target = np.where(positive, 1 / (prior1 + 2), (prior0 + 1) / (prior0 + 2))
+
+    def loss(params):
+        z = decision * params[0] + params[1]
+        residual = weight * (expit(z) - negative_target)
+        value = weight @ (np.logaddexp(0, z) - negative_target * z)
+        return value, np.array([residual @ decision, residual.sum()])
+
+    start = [0.0, np.log((prior0 + 1) / (prior1 + 1))]
+    return optimize.minimize(loss, start, jac=True, method='BFGS').x
+
+
+def fit_gaussian_nb(model, X, y, chunk_rows=100000, sample_weight=None):
+    # GaussianNB.fit would convert the whole uint8 matrix to float64 at once.
+    # partial_fit over blocks gives the same means and variances, except that
+    # it takes the variance smoothing from the first block, unweighted; that
+    # is corrected here from the column frequencies (a binary column's
+    # variance is p(1-p)), which are the class means weighted by class count.
+    classes = np.unique(y)
+    for start in range(0, len(y), chunk_rows):
+        weights = None if sample_weight is None else sample_weight[start:start + chunk_rows]
+        model.partial_fit(X[start:start + chunk_rows], y[start:start + chunk_rows], classes=classes,
+                          sample_weight=weights)
+    if len(y) > chunk_rows or sample_weight is not None:
+        frequency = model.class_count_ @ model.theta_ / model.class_count_.sum()
+        epsilon = model.var_smoothing * (frequency * (1 - frequency)).max()
+        model.var_ += epsilon - model.epsilon_
+        model.epsilon_ = epsilon
+    return model
+
+
+def row_softmax(log_scores):
+    # The row sums are accumulated column by column because numpy's axis=1
+    # reduction adds in a different order depending on the number of rows
+    proba = np.exp(log_scores - log_scores.max(axis=1, keepdims=True))
+    total = proba[:, 0].copy()
+    for column in range(1, proba.shape[1]):
+        total += proba[:, column]
+    return proba / total[:, None]
+
+
+def cascade_margins(proba):
+    # Margin of each row's top disease over the runner-up
+    top_two = np.partition(proba, -2, axis=1)[:, -2:]
+    return top_two[:, 1] - top_two[:, 0]
+
+
+def cascade_threshold(margins, differs, allowed, gaps=None, max_gap=float('inf')):
+    # Lowest margin threshold at which at most `allowed` of the rows exit
+    # early with a different top disease than the full ensemble and, with
+    # gaps, the early rows' mean gap stays within max_gap. A threshold admits
+    # every row with that margin, so only the end of a run of equal margins
+    # is a candidate. inf when even the most confident row fails.
+    if not len(margins):
+        return float('inf')
+    order = np.argsort(-margins, kind='stable')
+    sorted_margins = margins[order]
+    wrong = np.cumsum(differs[order])
+    group_end = np.append(sorted_margins[1:] < sorted_margins[:-1], True)
+    valid = group_end & (wrong <= allowed)
+    if gaps is not None:
+        valid &= np.cumsum(gaps[order]) / np.arange(1, len(margins) + 1) <= max_gap
+    candidates = np.flatnonzero(valid)
+    if not len(candidates):
+        return float('inf')
+    return float(sorted_margins[candidates[-1]])
+
 
+def top_k_indices(scores, k):
+    # Column indices of the k largest scores per row, best first. Ties are
+    # ordered highest index first, matching argsort()[-k:][::-1].
+    n_classes = scores.shape[1]
+    if k < n_classes:
+        candidates = np.argpartition(scores, n_classes - k, axis=1)[:, n_classes - k:]
+    else:
+        candidates = np.broadcast_to(np.arange(n_classes), scores.shape)
+    rows = np.arange(len(scores))[:, None]
+    order = np.lexsort((-candidates, -scores[rows, candidates]), axis=1)
+    return candidates[rows, order]
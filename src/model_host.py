@@ -0,0 +1,194 @@
+import glob
+import hashlib
+import json
+import os
+import numpy as np
+from compiled_ensemble import CompiledEnsemble
+from features import pack_rows
+from model import DiseasePredictor, file_sha256
+from suggestions import suggester_tables
+
+# Serves one copy of the fitted models to every worker process on a machine.
+# publish() writes the compiled ensemble's arrays (see CompiledEnsemble), the
+# bit-packed training rows and the symptom suggester's tables into one flat
+# file, next to a JSON manifest giving each array's dtype, shape and offset. attach() maps that file read-only and
+# hands the arrays to a CompiledEnsemble as zero-copy views, so the pages
+# live once in the OS page cache and each extra worker adds only its own
+# interpreter, not another copy of the support vectors and tree tables.
+#
+# The manifest is swapped in atomically after its data file is complete, and
+# a data file is never rewritten in place: a republished ensemble goes to a
+# new file and workers move to it with refresh(). Attached predictors score
+# with the compiled kernel only, so update() runs in the process that
+# publishes, not in the workers.
+
+HOST_FORMAT_VERSION = 2
+MANIFEST_NAME = "manifest.json"
+# Arrays start on cache-line boundaries
+ALIGNMENT = 64
+
+
+class ModelHost:
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+
+    def publish(self, predictor):
+        # Writes the predictor's models as the current ones and returns the
+        # manifest. Needs the full ensemble, not a student or attached predictor.
+        if predictor.student is not None:
+            raise ValueError("Only the full ensemble can be published")
+        if predictor.model_id is None:
+            raise ValueError("This model has no model ID to publish it under; retrain it first")
+        models = predictor.snapshot()
+        compiled = models['compiled'] or CompiledEnsemble.from_predictor(predictor)
+        arrays = dict(compiled.arrays)
+        arrays['training_bits'] = pack_rows(predictor.training_X)
+        arrays['training_y'] = np.asarray(predictor.training_y)
+        tables = suggester_tables(predictor.training_X, predictor.training_y, len(predictor.encoder.classes_))
+        for name, table in tables.items():
+            arrays[f'suggester_{name}'] = table
+
+        layout = {}
+        offset = 0
+        for name, array in arrays.items():
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+            offset += array.nbytes
+
+        os.makedirs(self.directory, exist_ok=True)
+        # The version can contain '/' (e.g. '/weights=...'), so the file is
+        # named after its digest
+        data_file = f"ensemble-{hashlib.sha256(models['version'].encode()).hexdigest()[:32]}.bin"
+        data_path = os.path.join(self.directory, data_file)
+        tmp_path = f"{data_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            for name, array in arrays.items():
+                f.seek(layout[name]['offset'])
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate(max(offset, 1))
+        os.replace(tmp_path, data_path)
+
+        manifest = {
+            'format_version': HOST_FORMAT_VERSION,
+            'data_file': data_file,
+            'arrays': layout,
+            'version': models['version'],
+            'training_hash': predictor.training_hash,
+            'model_id': predictor.model_id,
+            'revision': predictor.revision,
+            'n_classes': compiled.n_classes,
+            'n_features': compiled.n_features,
+            'gamma': compiled.gamma,
+            'classes': predictor.encoder.classes_.tolist(),
+            'symptoms': sorted(predictor.symptom_index, key=predictor.symptom_index.get),
+            'symptom_columns': list(predictor.symptom_columns),
+            'weights': dict(predictor.weights)
+        }
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+        # Workers still mapping an older file keep it until they refresh; on
+        # POSIX its pages stay valid after the name is gone. A worker that
+        # read the old manifest but hadn't mapped its file yet reads the new
+        # one and retries, see current().
+        for path in glob.glob(os.path.join(self.directory, "ensemble-*.bin")):
+            if os.path.basename(path) != data_file:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return manifest
+
+    def read_manifest(self):
+        with open(self.manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != HOST_FORMAT_VERSION:
+            raise ValueError(f"Unsupported model host format: {manifest.get('format_version')}")
+        return manifest
+
+    def map_arrays(self, manifest):
+        # Read-only views of every array in the manifest's data file
+        data = np.memmap(os.path.join(self.directory, manifest['data_file']), dtype=np.uint8, mode='r')
+        arrays = {}
+        for name, spec in manifest['arrays'].items():
+            dtype = np.dtype(spec['dtype'])
+            count = int(np.prod(spec['shape'], dtype=np.int64))
+            arrays[name] = np.frombuffer(data, dtype, count, spec['offset']).reshape(spec['shape'])
+        return arrays
+
+    def current(self, attempts=3):
+        # The manifest and its mapped arrays. publish() removes the previous
+        # data file right after swapping in its manifest, so a missing data
+        # file means the manifest just read is already stale: read it again.
+        for attempt in range(attempts):
+            manifest = self.read_manifest()
+            try:
+                return manifest, self.map_arrays(manifest)
+            except FileNotFoundError:
+                if attempt == attempts - 1:
+                    raise
+
+    def attach(self):
+        # A DiseasePredictor scoring with the published models, mapped in
+        # rather than loaded
+        manifest, arrays = self.current()
+        predictor = DiseasePredictor()
+        predictor.encoder.classes_ = np.asarray(manifest['classes'])
+        predictor.predictions_classes = predictor.encoder.classes_
+        predictor.symptom_index = {symptom: index for index, symptom in enumerate(manifest['symptoms'])}
+        predictor.symptom_columns = manifest['symptom_columns']
+        self._install(predictor, manifest, arrays)
+        return predictor
+
+    def refresh(self, predictor):
+        # Switches an attached predictor to the models published since it
+        # attached, if any; True if it switched
+        if self.read_manifest()['version'] == predictor.version:
+            return False
+        manifest, arrays = self.current()
+        self._install(predictor, manifest, arrays)
+        if predictor.cache is not None:
+            predictor.cache.invalidate()
+        return True
+
+    def _install(self, predictor, manifest, arrays):
+        # The training rows stay packed in the mapping; only code that needs
+        # them unpacked (update(), calibrating the cascade) unpacks a copy
+        training_bits = arrays.pop('training_bits')
+        training_y = arrays.pop('training_y')
+        tables = {name[len('suggester_'):]: arrays.pop(name) for name in list(arrays) if name.startswith('suggester_')}
+        compiled = CompiledEnsemble(arrays, manifest['n_classes'], manifest['n_features'], manifest['gamma'])
+        with predictor.lock:
+            predictor.compiled = compiled
+            predictor.training_hash = manifest['training_hash']
+            predictor.model_id = manifest['model_id']
+            predictor.revision = manifest['revision']
+            predictor.weights = manifest['weights']
+            predictor.training_X = None
+            predictor.training_bits = training_bits
+            predictor.training_y = training_y
+            predictor.suggester_tables = tables
+
+    def load_or_publish(self, bundle_path, training_data_path):
+        # Attaches to the published models if they are the bundle's current
+        # models, else publishes those and attaches to them. The bundle's info
+        # file names its version, so a current bundle isn't loaded at all;
+        # without it the bundle is loaded to compare. The first worker to
+        # start publishes for the rest.
+        published = None
+        if os.path.exists(self.manifest_path):
+            try:
+                published = self.read_manifest()['version']
+            except (ValueError, KeyError, OSError) as e:
+                print(f"Ignoring unusable model host {self.directory}: {e}")
+        info = DiseasePredictor.read_bundle_info(bundle_path)
+        if (published is not None and info is not None and info.get('version') == published
+                and info.get('training_hash') == file_sha256(training_data_path)):
+            return self.attach()
+        predictor = DiseasePredictor.load_or_train(bundle_path, training_data_path)
+        if predictor.version != published:
+            self.publish(predictor)
+        return self.attach()
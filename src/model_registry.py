@@ -0,0 +1,378 @@
+import json
+import os
+import pickle
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from metrics import METRICS
+from model import DiseasePredictor
+from model_host import ModelHost
+
+# Several DiseasePredictor versions in one process, addressed by ID. A
+# version is loaded on its first use and the least recently used ones are
+# dropped once the loaded versions hold more than the memory budget (the
+# default and shadow versions are never dropped). Requests go to the default version,
+# which switches atomically once its replacement has loaded. A shadow
+# version can score a sampled fraction of requests on a background thread
+# after the answer has been returned; its top-1 agreement with the version
+# that answered is recorded but never served.
+#
+# The versions can come from a JSON config that is re-read when it changes:
+#   {"default": "v1", "shadow": "v2", "shadow_fraction": 0.1,
+#    "versions": {"v1": {"bundle": "models/disease_predictor.joblib"},
+#                 "v2": {"bundle": "models/disease_predictor.joblib", "weights": {"svm": 0.4, "nb": 0.1}},
+#                 "small": {"student": "models/student.npz"}}}
+# A version's spec is fixed once registered; new models get a new ID.
+
+MODEL_REGISTRY_PATH = os.environ.get("MODEL_REGISTRY_PATH")
+MODEL_REGISTRY_BUDGET_MB = float(os.environ.get("MODEL_REGISTRY_BUDGET_MB", "1024"))
+MODEL_REGISTRY_WATCH_INTERVAL = float(os.environ.get("MODEL_REGISTRY_WATCH_INTERVAL", "5"))
+SHADOW_THREADS = int(os.environ.get("SHADOW_THREADS", "1"))
+# Shadow batches waiting beyond this are skipped rather than queued
+SHADOW_QUEUE_LIMIT = int(os.environ.get("SHADOW_QUEUE_LIMIT", "100"))
+
+
+class ByteCounter:
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += memoryview(data).nbytes
+
+
+class SizePickler(pickle.Pickler):
+    def persistent_id(self, obj):
+        # Arrays in a read-only file mapping, like a ModelHost's, are page
+        # cache shared with every process mapping the file, not memory of
+        # this version's own; they are left out of its size
+        if isinstance(obj, np.ndarray):
+            base = obj
+            while base is not None:
+                if isinstance(base, np.memmap):
+                    return "mapped" if base.mode == 'r' else None
+                base = getattr(base, 'base', None)
+        return None
+
+
+def predictor_nbytes(predictor):
+    # Bytes the predictor's models and training rows take up, measured as
+    # their pickled size without building the pickle. Training rows not
+    # unpacked yet are counted packed.
+    counter = ByteCounter()
+    parts = (predictor.svm_model, predictor.nb_model, predictor.rf_model, predictor.gb_model,
+             predictor.compiled, predictor.student, predictor._training_X, predictor.training_bits,
+             predictor.training_y, predictor.suggester_tables)
+    SizePickler(counter, protocol=pickle.HIGHEST_PROTOCOL).dump(parts)
+    return counter.bytes
+
+
+def version_loader(spec, training_data_path):
+    # Loader for a config entry: a bundle, a published ModelHost directory
+    # ("host", with "bundle" to publish from) or a distilled student, plus
+    # optional ensemble weights to override
+    def load():
+        if 'student' in spec:
+            predictor = DiseasePredictor.load_student(spec['student'])
+        elif 'host' in spec:
+            predictor = ModelHost(spec['host']).load_or_publish(spec['bundle'], training_data_path)
+        else:
+            predictor = DiseasePredictor.load(spec['bundle'])
+        if 'weights' in spec:
+            predictor.weights = {**predictor.weights, **spec['weights']}
+        return predictor
+    return load
+
+
+class ModelRegistry:
+    def __init__(self, budget_mb=MODEL_REGISTRY_BUDGET_MB, prepare=None, shadow_threads=SHADOW_THREADS,
+                 shadow_queue_limit=SHADOW_QUEUE_LIMIT, seed=None):
+        self.budget = budget_mb * 2**20
+        # Called with each predictor once it has loaded (cache, posterior table...)
+        self.prepare = prepare
+        self.loaders = {}
+        self.specs = {}
+        # version ID -> (predictor, bytes), least recently used first
+        self.loaded = OrderedDict()
+        self.load_locks = {}
+        self.symptom_columns = None
+        self.default = None
+        self.shadow = None
+        self.shadow_fraction = 0.0
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.shadow_pool = ThreadPoolExecutor(max_workers=shadow_threads, thread_name_prefix="shadow")
+        self.shadow_queue_limit = shadow_queue_limit
+        self.shadow_pending = 0
+        self.shadow_dropped = 0
+        self.counts = {}
+        self.histograms = {}
+        self.config_path = None
+        self.config_mtime = None
+        self.watcher = None
+
+    @classmethod
+    def from_config(cls, path, training_data_path, **kwargs):
+        registry = cls(**kwargs)
+        registry.apply_config(path, training_data_path)
+        return registry
+
+    def register(self, version_id, load, spec=None):
+        # load() returns a new DiseasePredictor; spec is what the config said,
+        # kept to notice a config giving an existing ID other models
+        with self.lock:
+            if version_id in self.loaders:
+                if spec is not None and spec == self.specs.get(version_id):
+                    return
+                raise ValueError(f"Model version {version_id!r} is already registered; give new models a new ID")
+            self.loaders[version_id] = load
+            self.specs[version_id] = spec
+            self.load_locks[version_id] = threading.Lock()
+            self.counts[version_id] = {
+                'requests': 0, 'rows': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                'shadow_rows': 0, 'shadow_agreed': 0, 'shadow_seconds': 0.0, 'shadow_errors': 0,
+                'loads': 0, 'load_seconds': 0.0, 'evictions': 0
+            }
+            self.histograms[version_id] = METRICS.histogram("registry_predict_seconds", labels=(("version", version_id),))
+            if self.default is None:
+                self.default = version_id
+
+    def unregister(self, version_id):
+        with self.lock:
+            if version_id in (self.default, self.shadow):
+                raise ValueError(f"Model version {version_id!r} is the default or the shadow")
+            self.loaders.pop(version_id, None)
+            self.specs.pop(version_id, None)
+            self.loaded.pop(version_id, None)
+            self.load_locks.pop(version_id, None)
+            self.counts.pop(version_id, None)
+            self.histograms.pop(version_id, None)
+        METRICS.remove("registry_predict_seconds", (("version", version_id),))
+
+    def get(self, version_id=None):
+        version_id = version_id or self.default
+        with self.lock:
+            entry = self.loaded.get(version_id)
+            if entry is not None:
+                self.loaded.move_to_end(version_id)
+                return entry[0]
+            if version_id not in self.loaders:
+                raise KeyError(f"Unknown model version {version_id!r}")
+            load, load_lock = self.loaders[version_id], self.load_locks[version_id]
+
+        # One thread loads a version; others asking for it wait for that load
+        with load_lock:
+            with self.lock:
+                entry = self.loaded.get(version_id)
+                if entry is not None:
+                    self.loaded.move_to_end(version_id)
+                    return entry[0]
+            start = time.perf_counter()
+            predictor = load()
+            if self.symptom_columns is not None and list(predictor.symptom_columns) != self.symptom_columns:
+                raise ValueError(f"Model version {version_id!r} has other symptom columns than the loaded versions")
+            if self.prepare is not None:
+                self.prepare(predictor)
+            size = predictor_nbytes(predictor)
+            with self.lock:
+                if version_id not in self.loaders:
+                    # Unregistered while loading: serve this call, keep nothing
+                    return predictor
+                if self.symptom_columns is None:
+                    self.symptom_columns = list(predictor.symptom_columns)
+                self.loaded[version_id] = (predictor, size)
+                counts = self.counts[version_id]
+                counts['loads'] += 1
+                counts['load_seconds'] += time.perf_counter() - start
+                self._evict_locked(version_id)
+        return predictor
+
+    def _evict_locked(self, keep):
+        # Drops least recently used versions until the rest fit the budget.
+        # The default, the shadow and the version just asked for stay even if
+        # they alone are over it. Callers still holding a dropped predictor
+        # can finish.
+        total = sum(size for _, size in self.loaded.values())
+        for version_id in list(self.loaded):
+            if total <= self.budget:
+                break
+            if version_id in (keep, self.default, self.shadow):
+                continue
+            total -= self.loaded.pop(version_id)[1]
+            self.counts[version_id]['evictions'] += 1
+
+    def set_default(self, version_id):
+        # Loads the new default first, so requests keep going to the old one
+        # until it is ready; then one assignment switches them over. The old
+        # default may then be dropped to fit the budget.
+        self.get(version_id)
+        with self.lock:
+            previous, self.default = self.default, version_id
+            self._evict_locked(version_id)
+        return previous
+
+    def set_shadow(self, version_id, fraction):
+        if version_id is not None and version_id not in self.loaders:
+            raise KeyError(f"Unknown model version {version_id!r}")
+        if not 0 <= fraction <= 1:
+            raise ValueError("The shadow fraction must be between 0 and 1")
+        with self.lock:
+            self.shadow, self.shadow_fraction = version_id, fraction
+            self._evict_locked(self.default)
+
+    @property
+    def symptom_index(self):
+        return self.get().symptom_index
+
+    @property
+    def version(self):
+        # The default version's model version, which changes when the
+        # default switches
+        return self.get().version
+
+    def predict(self, symptoms, version_id=None):
+        return self.predict_batch([symptoms], version_id=version_id)[0]
+
+    def predict_batch(self, symptom_lists, top_k=3, version_id=None):
+        version_id = version_id or self.default
+        predictor = self.get(version_id)
+        start = time.perf_counter()
+        results = predictor.predict_batch(symptom_lists, top_k=top_k)
+        seconds = time.perf_counter() - start
+        # A version unregistered while it answered is no longer counted
+        if METRICS.enabled and version_id in self.histograms:
+            self.histograms[version_id].observe(seconds)
+        with self.lock:
+            counts = self.counts.get(version_id)
+            if counts is not None:
+                counts['requests'] += 1
+                counts['rows'] += len(symptom_lists)
+                counts['seconds'] += seconds
+                counts['max_seconds'] = max(counts['max_seconds'], seconds)
+        self._submit_shadow(version_id, symptom_lists, results)
+        return results
+
+    def _submit_shadow(self, version_id, symptom_lists, results):
+        shadow, fraction = self.shadow, self.shadow_fraction
+        if shadow is None or shadow == version_id or fraction <= 0:
+            return
+        rows = [i for i in range(len(symptom_lists)) if self.random.random() < fraction]
+        if not rows:
+            return
+        with self.lock:
+            if self.shadow_pending >= self.shadow_queue_limit:
+                self.shadow_dropped += 1
+                return
+            self.shadow_pending += 1
+        answered = [top_disease(results[i]) for i in rows]
+        self.shadow_pool.submit(self._score_shadow, shadow, [symptom_lists[i] for i in rows], answered)
+
+    def _score_shadow(self, version_id, symptom_lists, answered):
+        try:
+            start = time.perf_counter()
+            results = self.get(version_id).predict_batch(symptom_lists, top_k=1)
+            seconds = time.perf_counter() - start
+            agreed = sum(top_disease(result) == disease for result, disease in zip(results, answered))
+            with self.lock:
+                counts = self.counts.get(version_id)
+                if counts is not None:
+                    counts['shadow_rows'] += len(symptom_lists)
+                    counts['shadow_agreed'] += agreed
+                    counts['shadow_seconds'] += seconds
+        except Exception as e:
+            print(f"Error shadow scoring with model version {version_id}: {e}")
+            with self.lock:
+                if version_id in self.counts:
+                    self.counts[version_id]['shadow_errors'] += 1
+        finally:
+            with self.lock:
+                self.shadow_pending -= 1
+
+    def wait_for_shadow(self, timeout=None):
+        # Blocks until queued shadow scoring has finished
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.shadow_pending:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def apply_config(self, path, training_data_path):
+        # Registers new versions from the config, then switches the default
+        # and the shadow. Versions no longer listed are dropped.
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+        versions = config['versions']
+        for version_id, spec in versions.items():
+            self.register(version_id, version_loader(spec, training_data_path), spec)
+        default = config.get('default') or next(iter(versions))
+        if default != self.default or default not in self.loaded:
+            self.set_default(default)
+        self.set_shadow(config.get('shadow'), float(config.get('shadow_fraction', 0.0)))
+        for version_id in list(self.loaders):
+            if version_id not in versions:
+                self.unregister(version_id)
+
+    def watch(self, path, training_data_path, interval=MODEL_REGISTRY_WATCH_INTERVAL):
+        # Re-applies the config whenever its modification time changes, so a
+        # new default or shadow rolls out without restarting the process
+        self.config_path = path
+        self.config_mtime = os.path.getmtime(path)
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    mtime = os.path.getmtime(path)
+                    if mtime != self.config_mtime:
+                        self.config_mtime = mtime
+                        self.apply_config(path, training_data_path)
+                except Exception as e:
+                    print(f"Error applying model registry config {path}: {e}")
+
+        self.watcher = threading.Thread(target=run, name="model-registry-watch", daemon=True)
+        self.watcher.start()
+
+    def stats(self):
+        with self.lock:
+            versions = {}
+            for version_id, counts in self.counts.items():
+                entry = self.loaded.get(version_id)
+                versions[version_id] = {
+                    **counts,
+                    'loaded': entry is not None,
+                    'mb': entry[1] / 2**20 if entry is not None else 0.0,
+                    'mean_ms': counts['seconds'] / counts['requests'] * 1000 if counts['requests'] else 0.0,
+                    'shadow_agreement': (
+                        counts['shadow_agreed'] / counts['shadow_rows'] if counts['shadow_rows'] else None
+                    )
+                }
+            return {
+                'default': self.default,
+                'shadow': self.shadow,
+                'shadow_fraction': self.shadow_fraction,
+                'budget_mb': self.budget / 2**20,
+                'loaded_mb': sum(size for _, size in self.loaded.values()) / 2**20,
+                'shadow_pending': self.shadow_pending,
+                'shadow_dropped': self.shadow_dropped,
+                'versions': versions
+            }
+
+    def collect(self):
+        # Metrics collector: the per-version numbers of stats() as gauges
+        # labelled with the version
+        stats = self.stats()
+        yield "model_registry_loaded_mb", (), "gauge", stats['loaded_mb']
+        yield "model_registry_shadow_dropped", (), "gauge", stats['shadow_dropped']
+        for version_id, counts in stats['versions'].items():
+            labels = (("version", version_id),)
+            yield "model_registry_default", labels, "gauge", int(version_id == stats['default'])
+            for key in ('requests', 'rows', 'shadow_rows', 'shadow_agreed', 'shadow_errors', 'loads', 'evictions', 'mb'):
+                yield f"model_registry_{key}", labels, "gauge", counts[key]
+
+
+def top_disease(result):
+    diseases, _ = result
+    return diseases[0] if diseases else None
@@ -1,25 +1,103 @@
+import json
+import os
+import re
+from functools import lru_cache
 import nltk
-from nltk.tokenize import word_tokenize
+from nltk.tokenize import word_tokenize, NLTKWordTokenizer
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
 import string
-from difflib import get_close_matches
+import time
+from metrics import METRICS
+from symptom_matcher import SymptomMatcher
+
+NLP_RESOURCES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "nlp_resources.json")
+
+# NLTK packages and where nltk.data.find looks for them
+REQUIRED_PACKAGES = {
+    'punkt_tab': 'tokenizers/punkt_tab',
+    'stopwords': 'corpora/stopwords',
+    'wordnet': 'corpora/wordnet',
+    'omw-1.4': 'corpora/omw-1.4',
+}
+
+_wordnet_lemmatizer = WordNetLemmatizer()
+
+# Bound once so timing a message is a single histogram update
+EXTRACT_SECONDS = {
+    tier: METRICS.histogram("extract_symptoms_seconds", labels=(("tier", tier),))
+    for tier in ("exact", "token", "fuzzy", "none")
+}
+
+
+@lru_cache(maxsize=65536)
+def wordnet_lemmatize(token):
+    # Chat messages repeat the same few hundred words, so each process only
+    # asks WordNet about a word once
+    return _wordnet_lemmatizer.lemmatize(token)
+
+
+_word_tokenizer = NLTKWordTokenizer()
+_sentence_end = re.compile(r"(?<=[.!?])\s+")
+
+
+def simple_word_tokenize(text):
+    return [token for sentence in _sentence_end.split(text) for token in _word_tokenizer.tokenize(sentence)]
+
+
+def has_resource(path):
+    try:
+        nltk.data.find(path)
+        return True
+    except LookupError:
+        return False
+
+
+def load_bundled_resources(path=NLP_RESOURCES_PATH):
+    # Stopwords and a lemma table for the symptom vocabulary, generated by
+    # scripts/build_nlp_resources.py
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
 
 class SymptomExtractor:
-    def __init__(self):
-        # Download all required NLTK data with error handling
-        required_packages = ['punkt', 'stopwords', 'wordnet', 'omw-1.4']
-        for package in required_packages:
-            try:
-                nltk.data.find(f'tokenizers/{package}' if package == 'punkt' 
-                              else f'corpora/{package}' if package in ['stopwords', 'wordnet']
-                              else package)
-            except LookupError:
-                print(f"Downloading {package}...")
-                nltk.download(package, quiet=True)
-
-        self.lemmatizer = WordNetLemmatizer()
-        self.stop_words = set(stopwords.words('english'))
+    def __init__(self, offline=False, preload=True, bundled=False, resources_path=NLP_RESOURCES_PATH):
+        # offline: never download, use whatever NLTK data is installed and the
+        # bundled resources for anything missing.
+        # preload: load WordNet now instead of on the first message.
+        # bundled: always use the bundled stopwords and lemma table.
+        if not offline and not bundled:
+            # Download all required NLTK data with error handling
+            for package, path in REQUIRED_PACKAGES.items():
+                if not has_resource(path):
+                    print(f"Downloading {package}...")
+                    nltk.download(package, quiet=True)
+
+        resources = None
+        if not bundled and has_resource(REQUIRED_PACKAGES['stopwords']):
+            self.stop_words = set(stopwords.words('english'))
+        else:
+            resources = load_bundled_resources(resources_path)
+            self.stop_words = set(resources['stopwords'])
+
+        if not bundled and has_resource(REQUIRED_PACKAGES['wordnet']):
+            self.lemmatize = wordnet_lemmatize
+            if preload:
+                nltk.corpus.wordnet.ensure_loaded()
+        else:
+            resources = resources or load_bundled_resources(resources_path)
+            lemmas = resources['lemmas']
+            # Words outside the table are left as they are
+            self.lemmatize = lru_cache(maxsize=65536)(lambda token: lemmas.get(token, token))
+
+        # word_tokenize needs the punkt_tab sentence splitter; without it the
+        # word tokenizer it wraps runs on sentences split at end punctuation
+        if has_resource(REQUIRED_PACKAGES['punkt_tab']):
+            self.tokenize = word_tokenize
+        else:
+            self.tokenize = simple_word_tokenize
+
+        self.matcher = None
 
     def preprocess_text(self, text):
         # Convert to lowercase
@@ -27,7 +105,7 @@ class SymptomExtractor:
 
         # Tokenize
         try:
-            tokens = word_tokenize(text)
+            tokens = self.tokenize(text)
         except Exception as e:
             print(f"Error in tokenization: {e}")
             tokens = text.split()  # Fallback to simple splitting
@@ -38,37 +116,37 @@ class SymptomExtractor:
                  and token not in self.stop_words]
 
         # Lemmatize
-        tokens = [self.lemmatizer.lemmatize(token) for token in tokens]
+        tokens = [self.lemmatize(token) for token in tokens]
 
         return tokens
 
+    def get_matcher(self, symptom_index):
+        # The matcher is compiled once and only rebuilt when the vocabulary changes
+        if self.matcher is None or self.matcher.vocabulary != tuple(symptom_index):
+            with METRICS.span("matcher_build"):
+                self.matcher = SymptomMatcher(symptom_index, self.preprocess_text)
+        return self.matcher
+
     def extract_symptoms(self, text, symptom_index):
+        start = time.perf_counter()
         tokens = self.preprocess_text(text)
+        matcher = self.get_matcher(symptom_index)
 
-        # Convert symptom index keys to lowercase for matching
-        symptom_lookup = {symptom.lower(): symptom for symptom in symptom_index}
-
-        # Extract symptoms using fuzzy matching
-        extracted_symptoms = set()
-
-        # First try exact matches
-        text_lower = text.lower()
-        for symptom_lower, original_symptom in symptom_lookup.items():
-            if symptom_lower in text_lower:
-                extracted_symptoms.add(original_symptom)
-
-        # Then try token-based matching
-        remaining_tokens = " ".join(tokens)
-        for symptom_lower, original_symptom in symptom_lookup.items():
-            symptom_tokens = self.preprocess_text(symptom_lower)
-            if all(token in remaining_tokens for token in symptom_tokens):
-                extracted_symptoms.add(original_symptom)
+        # Exact name matches and token-based matches in one pass each
+        extracted_symptoms = matcher.match_exact(text)
+        tier = "exact" if extracted_symptoms else "token"
+        extracted_symptoms |= matcher.match_tokens(tokens)
 
         # Finally try fuzzy matching for unmatched tokens
         if not extracted_symptoms:
-            for token in tokens:
-                matches = get_close_matches(token, symptom_lookup.keys(), n=1, cutoff=0.8)
-                if matches:
-                    extracted_symptoms.add(symptom_lookup[matches[0]])
+            tier = "fuzzy"
+            with METRICS.span("fuzzy_fallback"):
+                for token in tokens:
+                    matches = matcher.fuzzy.lookup(token, n=1, cutoff=0.8)
+                    if matches:
+                        extracted_symptoms.add(matcher.lookup[matches[0][0]])
 
-        return list(extracted_symptoms)
\ No newline at end of file
+        # One timing per message, labelled with the first tier that matched
+        if METRICS.enabled:
+            EXTRACT_SECONDS[tier if extracted_symptoms else "none"].observe(time.perf_counter() - start)
+        return list(extracted_symptoms)
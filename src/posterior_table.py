@@ -0,0 +1,170 @@
+import json
+import os
+import threading
+import numpy as np
+
+# Precomputed ensemble results for symptom sets, stored as an open-addressing
+# hash table in a single .npy file that is memory-mapped at serve time. A key
+# is the symptom bitmask split into three 64-bit words (180 symptoms), an
+# all-zero key marks an empty slot, and collisions probe the next slot. The
+# table is only valid for the model version it was built from, recorded in a
+# JSON sidecar next to it.
+
+KEY_WORDS = 3
+MASK64 = (1 << 64) - 1
+# Odd multipliers for the multiplicative hash of each key word
+HASH_MULTIPLIERS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9)
+
+
+def split_mask(mask):
+    return tuple((mask >> (64 * i)) & MASK64 for i in range(KEY_WORDS))
+
+
+def hash_slot(words, bits):
+    h = 0
+    for word, multiplier in zip(words, HASH_MULTIPLIERS):
+        h ^= (word * multiplier) & MASK64
+    return h >> (64 - bits)
+
+
+def hash_slots(keys, bits):
+    # Vectorised hash_slot over an (n, KEY_WORDS) uint64 array; uint64
+    # multiplication wraps around exactly like the & MASK64 above
+    h = np.zeros(len(keys), dtype=np.uint64)
+    for i, multiplier in enumerate(HASH_MULTIPLIERS):
+        h ^= keys[:, i] * np.uint64(multiplier)
+    return (h >> np.uint64(64 - bits)).astype(np.int64)
+
+
+class PosteriorTable:
+    def __init__(self, table, metadata):
+        self.table = table
+        self.keys = table['key']
+        self.metadata = metadata
+        self.version = metadata['version']
+        self.top_k = metadata['top_k']
+        self.class_names = metadata['classes']
+        self.bits = metadata['bits']
+        self.slot_mask = (1 << self.bits) - 1
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def build(cls, masks, diseases, confidences, class_names, version, top_k, load_factor=0.5):
+        # masks: symptom bitmasks (ints); diseases/confidences: the ranked
+        # results for each, as returned by DiseasePredictor.predict_batch
+        n = len(masks)
+        bits = max(4, int(np.ceil(np.log2(max(n, 1) / load_factor))))
+        dtype = np.dtype([
+            ('key', np.uint64, KEY_WORDS),
+            ('classes', np.uint16, top_k),
+            ('confidences', np.float64, top_k)
+        ])
+        table = np.zeros(1 << bits, dtype=dtype)
+
+        keys = np.array([split_mask(mask) for mask in masks], dtype=np.uint64).reshape(n, KEY_WORDS)
+        class_ids = {name: i for i, name in enumerate(class_names)}
+        classes = np.zeros((n, top_k), dtype=np.uint16)
+        scores = np.zeros((n, top_k))
+        for row, (names, values) in enumerate(zip(diseases, confidences)):
+            classes[row, :len(names)] = [class_ids[name] for name in names]
+            scores[row, :len(values)] = values
+
+        # Linear probing, all keys at once: every round, the first pending key
+        # claiming each free slot takes it and the rest move to the next slot
+        pending = np.arange(n)
+        slots = hash_slots(keys, bits)
+        while len(pending):
+            free = ~table['key'][slots].any(axis=1)
+            claimed, first = np.unique(slots[free], return_index=True)
+            winners = pending[free][first]
+            table['key'][claimed] = keys[winners]
+            table['classes'][claimed] = classes[winners]
+            table['confidences'][claimed] = scores[winners]
+            placed = np.zeros(len(pending), dtype=bool)
+            placed[np.flatnonzero(free)[first]] = True
+            pending = pending[~placed]
+            slots = (slots[~placed] + 1) & ((1 << bits) - 1)
+
+        metadata = {
+            'version': version,
+            'top_k': top_k,
+            'classes': list(class_names),
+            'bits': bits,
+            'entries': n
+        }
+        return cls(table, metadata)
+
+    def save(self, path):
+        # The .npy file and its sidecar are each replaced atomically
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, self.table)
+        os.replace(tmp_path, path)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.metadata, f)
+        os.replace(tmp_path, metadata_path(path))
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        with open(metadata_path(path), encoding="utf-8") as f:
+            metadata = json.load(f)
+        return cls(np.load(path, mmap_mode=mmap_mode), metadata)
+
+    @classmethod
+    def load_if_current(cls, path, version):
+        # The table at path if it exists and was built for this model version
+        if not os.path.exists(path) or not os.path.exists(metadata_path(path)):
+            return None
+        table = cls.load(path)
+        if table.version != version:
+            print(f"Ignoring posterior table {path} built for another model version")
+            return None
+        return table
+
+    def lookup(self, mask, top_k=None):
+        # (diseases, confidences) for the symptom set, or None if not stored.
+        # The empty set would look like an empty slot and is never stored.
+        if not mask:
+            with self.lock:
+                self.misses += 1
+            return None
+        words = split_mask(mask)
+        slot = hash_slot(words, self.bits)
+        words = list(words)
+        keys = self.keys
+        while True:
+            stored = keys[slot].tolist()
+            if stored == words:
+                break
+            if not any(stored):
+                with self.lock:
+                    self.misses += 1
+                return None
+            slot = (slot + 1) & self.slot_mask
+        with self.lock:
+            self.hits += 1
+        k = self.top_k if top_k is None else top_k
+        entry = self.table[slot]
+        return [self.class_names[i] for i in entry['classes'][:k].tolist()], entry['confidences'][:k].tolist()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': self.metadata['entries'],
+                'slots': len(self.table),
+                'load_factor': self.metadata['entries'] / len(self.table),
+                'bytes': self.table.nbytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+def metadata_path(path):
+    return f"{path}.json"
@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Bounded cache of ranked predictions shared by every session and thread.
+# Keys are (model version, symptom bitmask, top_k): the bitmask has bit i set
+# for symptom column i, so the same symptoms in any order or with duplicates
+# share one entry, and entries of another model version can never be hit.
+
+
+class PredictionCache:
+    def __init__(self, max_entries=100000, ttl=None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.version = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, version, mask, top_k):
+        key = (version, mask, top_k)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires, diseases, confidences = entry
+            if expires is not None and expires <= self.clock():
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        # Callers get their own lists to modify
+        return list(diseases), list(confidences)
+
+    def put(self, version, mask, top_k, diseases, confidences):
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            if version != self.version:
+                # A new model is serving: drop everything cached for the old one
+                self.clear_locked()
+                self.version = version
+            self.entries[(version, mask, top_k)] = (expires, tuple(diseases), tuple(confidences))
+            self.entries.move_to_end((version, mask, top_k))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        with self.lock:
+            self.clear_locked()
+
+    def clear_locked(self):
+        if self.entries:
+            self.invalidations += 1
+        self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations
+            }
@@ -1,13 +1,5 @@
+from recommendations import default_catalog
 
-PRESCRIPTIONS = {
-    "Asthma": ["Salbutamol Inhaler", "Montelukast Tablet"],
-    "Pneumonia": ["Amoxicillin", "Paracetamol"],
-    "Tuberculosis": ["Isoniazid", "Rifampicin", "Pyrazinamide", "Ethambutol"],
-    "Hypertension": ["Amlodipine", "Losartan"],
-    "Migraine": ["Paracetamol", "Sumatriptan"],
-    "Flu": ["Oseltamivir", "Paracetamol"],
-    "Diabetes": ["Metformin", "Glimepiride"],
-    "Cold": ["Paracetamol", "Cetirizine"],
-    "Malaria": ["Chloroquine", "Artemether-Lumefantrine"],
-    "COVID-19": ["Paracetamol", "Vitamin C", "Zinc"]
-}
+# Medications per disease, kept in data/recommendations.json with the
+# diagnostic tests; see recommendations.RecommendationCatalog
+PRESCRIPTIONS = {disease: list(items) for disease, items in default_catalog().disease_items['medications'].items()}
@@ -0,0 +1,70 @@
+import json
+import os
+from functools import lru_cache
+
+RECOMMENDATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "recommendations.json")
+
+# Medications and diagnostic tests per disease, read once from
+# data/recommendations.json ({kind: {disease: [items]}}) into per-disease
+# tuples, deduplicated once at load. "Items shared by at least two of the
+# predicted diseases" only looks at the items of the predicted diseases:
+# each item gets a bitset over the positions of the query's diseases and is
+# kept if its popcount is high enough. The bitsets are per query rather than
+# over the whole catalog, so their cost doesn't grow with the number of
+# diseases.
+
+
+class RecommendationCatalog:
+    def __init__(self, catalog):
+        self.kinds = list(catalog)
+        self.diseases = sorted({disease for entries in catalog.values() for disease in entries})
+        # Listed order, without repeats
+        self.disease_items = {
+            kind: {disease: tuple(dict.fromkeys(items)) for disease, items in entries.items()}
+            for kind, entries in catalog.items()
+        }
+
+    @classmethod
+    def load(cls, path=RECOMMENDATIONS_PATH):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def items(self, kind, disease):
+        return self.disease_items[kind].get(disease, ())
+
+    def common(self, kind, diseases, min_diseases=2):
+        # Items recommended for at least min_diseases of the given diseases,
+        # in the order they first appear going down the list
+        disease_items = self.disease_items[kind]
+        bits = {}
+        for i, disease in enumerate(dict.fromkeys(diseases)):
+            for item in disease_items.get(disease, ()):
+                bits[item] = bits.get(item, 0) | 1 << i
+        return [item for item, mask in bits.items() if mask.bit_count() >= min_diseases]
+
+    def validate(self, class_names):
+        # Catalog diseases the predictor can't predict (likely misspelt), and
+        # per kind the predictable diseases that have no entry
+        class_names = set(class_names)
+        return {
+            'unknown': [disease for disease in self.diseases if disease not in class_names],
+            'missing': {
+                kind: sorted(class_names - set(entries)) for kind, entries in self.disease_items.items()
+            }
+        }
+
+    def check(self, class_names):
+        # validate(), printing what is missing and raising on unknown diseases
+        problems = self.validate(class_names)
+        for kind, missing in problems['missing'].items():
+            if missing:
+                print(f"No {kind} listed for {len(missing)} diseases, e.g. {missing[:5]}")
+        if problems['unknown']:
+            raise ValueError(f"Recommendations for diseases the model doesn't know: {problems['unknown'][:10]}")
+        return problems
+
+
+@lru_cache(maxsize=None)
+def default_catalog():
+    # The bundled catalog, loaded on first use and shared by the process
+    return RecommendationCatalog.load()
@@ -0,0 +1,130 @@
+import numpy as np
+
+# Suggests the symptoms worth asking about next, so a chat reaches the three
+# symptoms a prediction needs in fewer turns. Everything a query needs is
+# tabulated once from the training rows: per-disease symptom probabilities
+# for information gain, and symptom co-occurrence counts. A query is then a
+# few small array operations.
+
+
+class SymptomSuggester:
+    def __init__(self, tables, symptoms, diseases, n_candidates=5):
+        # tables from suggester_tables(), e.g. mapped from a ModelHost
+        self.symptoms = list(symptoms)
+        self.symptom_ids = {symptom: i for i, symptom in enumerate(self.symptoms)}
+        self.diseases = list(diseases)
+        self.n_candidates = n_candidates
+        self.conditional = tables['conditional']
+        self.log_conditional = tables['log_conditional']
+        self.log_prior = tables['log_prior']
+        self.cooccurrence = tables['cooccurrence']
+        self.frequency = np.diag(self.cooccurrence).copy()
+
+    @classmethod
+    def from_rows(cls, X, y, symptoms, diseases, smoothing=1.0, n_candidates=5):
+        return cls(suggester_tables(X, y, len(diseases), smoothing), symptoms, diseases, n_candidates)
+
+    @classmethod
+    def from_predictor(cls, predictor, **options):
+        # Built from the rows the predictor was trained on (or its sample of
+        # them), or from the tables a ModelHost published with its models
+        symptoms = sorted(predictor.symptom_index, key=predictor.symptom_index.get)
+        if predictor.suggester_tables is not None and 'smoothing' not in options:
+            return cls(predictor.suggester_tables, symptoms, predictor.encoder.classes_, **options)
+        return cls.from_rows(predictor.training_X, predictor.training_y, symptoms, predictor.encoder.classes_, **options)
+
+    def candidates(self, confirmed_ids, disease_probabilities=None):
+        # The top candidate diseases and their renormalised probabilities,
+        # either given (e.g. from the ensemble) or from the tables
+        if disease_probabilities:
+            ids = np.array([self.diseases.index(d) for d in disease_probabilities])
+            p = np.array(list(disease_probabilities.values()), dtype=np.float64)
+        else:
+            log_posterior = self.log_prior + self.log_conditional[confirmed_ids].sum(axis=0)
+            ids = np.argsort(log_posterior)[::-1][:self.n_candidates]
+            p = np.exp(log_posterior[ids] - log_posterior[ids].max())
+        return ids, p / p.sum()
+
+    def information_gain(self, confirmed_ids, disease_probabilities=None):
+        # Expected drop in entropy over the candidate diseases from learning
+        # whether each symptom is present
+        ids, p = self.candidates(confirmed_ids, disease_probabilities)
+        present = self.conditional[:, ids]
+        p_present = present @ p
+        posterior_present = present * p / p_present[:, None]
+        posterior_absent = (1 - present) * p / (1 - p_present)[:, None]
+        return entropy(p) - p_present * entropy(posterior_present) - (1 - p_present) * entropy(posterior_absent)
+
+    def cooccurrence_score(self, confirmed_ids):
+        # Mean P(symptom | confirmed symptom), or plain frequency with none
+        if not len(confirmed_ids):
+            return self.frequency.astype(np.float64)
+        return (self.cooccurrence[confirmed_ids] / np.maximum(self.frequency[confirmed_ids], 1)[:, None]).mean(axis=0)
+
+    def suggest(self, confirmed, k=3, method="information_gain", disease_probabilities=None):
+        confirmed_ids = np.array([self.symptom_ids[s] for s in confirmed if s in self.symptom_ids], dtype=np.int64)
+        if method == "information_gain":
+            scores = self.information_gain(confirmed_ids, disease_probabilities)
+        elif method == "cooccurrence":
+            scores = self.cooccurrence_score(confirmed_ids)
+        else:
+            raise ValueError(f"Unknown suggestion method: {method}")
+        scores = scores.copy()
+        scores[confirmed_ids] = -np.inf
+        k = min(k, len(self.symptoms) - len(confirmed_ids))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((top, -scores[top]))]
+        return [self.symptoms[i] for i in top]
+
+
+class FollowingSuggester:
+    # Suggests with a SymptomSuggester for whichever predictor get_predictor()
+    # returns now, e.g. a ModelRegistry's default version, built again when
+    # that predictor changes
+    def __init__(self, get_predictor, **options):
+        self.get_predictor = get_predictor
+        self.options = options
+        self.current = (None, None)
+
+    def suggest(self, confirmed, **kwargs):
+        predictor = self.get_predictor()
+        owner, suggester = self.current
+        if owner is not predictor:
+            suggester = SymptomSuggester.from_predictor(predictor, **self.options)
+            self.current = (predictor, suggester)
+        return suggester.suggest(confirmed, **kwargs)
+
+
+def disease_posterior(diseases, confidences):
+    # A prediction's {disease: confidence} for suggest(), or None when it has
+    # nothing to weigh the diseases by
+    if not diseases or sum(confidences) <= 0:
+        return None
+    return dict(zip(diseases, confidences))
+
+
+def suggester_tables(X, y, n_diseases, smoothing=1.0):
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y)
+    # P(symptom | disease) with Laplace smoothing, symptoms x diseases
+    onehot = np.zeros((len(y), n_diseases))
+    onehot[np.arange(len(y)), y] = 1
+    class_counts = onehot.sum(axis=0)
+    conditional = (X.T @ onehot + smoothing) / (class_counts + 2 * smoothing)
+    return {
+        'conditional': conditional,
+        'log_conditional': np.log(conditional),
+        'log_prior': np.log((class_counts + smoothing) / (len(y) + smoothing * n_diseases)),
+        # How often each pair of symptoms appears together, and each alone
+        # on the diagonal
+        'cooccurrence': X.T @ X
+    }
+
+
+def entropy(p):
+    # Entropy in bits of each row (or of a single distribution)
+    p = np.asarray(p)
+    logs = np.log2(np.where(p > 0, p, 1))
+    return -(p * logs).sum(axis=-1)
@@ -0,0 +1,165 @@
+from collections import Counter, deque
+from difflib import SequenceMatcher
+import numpy as np
+
+# Symptom matching compiled once from the symptom vocabulary. The exact tier
+# finds every symptom name contained in the message and the token tier finds
+# every symptom whose lemmatized tokens all appear in the preprocessed
+# message, each with a single pass of an Aho-Corasick automaton instead of a
+# substring scan per symptom. The fuzzy tier uses FuzzyIndex in place of
+# difflib.get_close_matches over the whole vocabulary.
+
+
+class AhoCorasick:
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        # Empty patterns are contained in every text
+        self.always = [i for i, pattern in enumerate(self.patterns) if not pattern]
+
+        for pattern_id, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(pattern_id)
+
+        # Breadth-first pass to set failure links and inherit their outputs.
+        # Children of the root keep failing back to the root.
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find(self, text):
+        # Ids of every pattern that occurs somewhere in text
+        found = set(self.always)
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class SymptomMatcher:
+    def __init__(self, symptom_index, preprocess_text):
+        self.vocabulary = tuple(symptom_index)
+
+        # Lowercase names for matching, mapped back to the original spelling
+        self.lookup = {symptom.lower(): symptom for symptom in self.vocabulary}
+        self.names = list(self.lookup)
+        self.exact = AhoCorasick(self.names)
+
+        # Each symptom's distinct lemmatized tokens, and the symptoms that use
+        # each token
+        name_tokens = [preprocess_text(name) for name in self.names]
+        tokens = sorted({token for symptom_tokens in name_tokens for token in symptom_tokens})
+        token_ids = {token: i for i, token in enumerate(tokens)}
+        self.required = []
+        self.symptoms_by_token = [[] for _ in tokens]
+        self.tokenless = []
+        for symptom_id, symptom_tokens in enumerate(name_tokens):
+            symptom_tokens = {token_ids[token] for token in symptom_tokens}
+            self.required.append(len(symptom_tokens))
+            if not symptom_tokens:
+                self.tokenless.append(symptom_id)
+            for token_id in symptom_tokens:
+                self.symptoms_by_token[token_id].append(symptom_id)
+        self.tokens = AhoCorasick(tokens)
+        self.fuzzy = FuzzyIndex(self.names)
+
+    def match(self, text, tokens):
+        return self.match_exact(text) | self.match_tokens(tokens)
+
+    def match_exact(self, text):
+        return {self.lookup[self.names[i]] for i in self.exact.find(text.lower())}
+
+    def match_tokens(self, tokens):
+        # A symptom matches once every one of its tokens occurs in the
+        # space-joined message tokens
+        counts = {}
+        for token_id in self.tokens.find(" ".join(tokens)):
+            for symptom_id in self.symptoms_by_token[token_id]:
+                counts[symptom_id] = counts.get(symptom_id, 0) + 1
+        matched = {self.names[i] for i, count in counts.items() if count == self.required[i]}
+        matched.update(self.names[i] for i in self.tokenless)
+        return {self.lookup[name] for name in matched}
+
+
+class FuzzyIndex:
+    # Approximate lookup with the same results as difflib.get_close_matches.
+    # difflib only scores a candidate after two cheap upper bounds pass the
+    # cutoff: one from the two lengths and one from the shared character
+    # counts. Names are bucketed by length and their character counts kept
+    # in a matrix, so both bounds are checked for a whole bucket at once and
+    # the full SequenceMatcher ratio only runs on the few survivors.
+    def __init__(self, names):
+        self.names = list(names)
+        alphabet = sorted({char for name in self.names for char in name})
+        self.char_ids = {char: i for i, char in enumerate(alphabet)}
+
+        self.char_counts = np.zeros((len(self.names), len(alphabet)), dtype=np.int32)
+        for row, name in enumerate(self.names):
+            for char, count in Counter(name).items():
+                self.char_counts[row, self.char_ids[char]] = count
+
+        self.lengths = np.array([len(name) for name in self.names], dtype=np.int64)
+        self.buckets = {}
+        for row, name in enumerate(self.names):
+            self.buckets.setdefault(len(name), []).append(row)
+        self.buckets = {length: np.array(rows) for length, rows in self.buckets.items()}
+
+    def lookup(self, word, n=1, cutoff=0.8):
+        # Best matches as (name, score) pairs, highest score first.
+        # Upper bound from the lengths alone (difflib's real_quick_ratio):
+        rows = [
+            bucket for length, bucket in self.buckets.items()
+            if _ratio(min(len(word), length), len(word) + length) >= cutoff
+        ]
+        if not rows:
+            return []
+        rows = np.concatenate(rows)
+
+        # Upper bound from shared characters (difflib's quick_ratio):
+        word_counts = np.zeros(self.char_counts.shape[1], dtype=np.int32)
+        for char, count in Counter(word).items():
+            if char in self.char_ids:
+                word_counts[self.char_ids[char]] = count
+        shared = np.minimum(self.char_counts[rows], word_counts).sum(axis=1)
+        rows = rows[2.0 * shared / (self.lengths[rows] + len(word)) >= cutoff]
+
+        results = []
+        matcher = SequenceMatcher()
+        matcher.set_seq2(word)
+        for row in rows:
+            matcher.set_seq1(self.names[row])
+            score = matcher.ratio()
+            if score >= cutoff:
+                results.append((score, self.names[row]))
+        results.sort(reverse=True)
+        return [(name, score) for score, name in results[:n]]
+
+
+def _ratio(matches, length):
+    # difflib's own formula, so the bounds compare exactly like difflib's
+    return 2.0 * matches / length if length else 1.0
@@ -1,6 +1,4 @@
-import pandas as pd
-import numpy as np
+from features import read_symptom_columns
 
-# Load dataset
-data = pd.read_csv("data/Training.csv")
-AVAILABLE_SYMPTOMS = data.columns[:-1].tolist()
+# Only the header is needed for the symptom names
+AVAILABLE_SYMPTOMS = read_symptom_columns("data/Training.csv")
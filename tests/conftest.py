@@ -0,0 +1,36 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from features import load_training_data
+from model import DiseasePredictor
+
+TRAINING_DATA_PATH = os.path.join(ROOT, "data", "Training.csv")
+TESTING_DATA_PATH = os.path.join(ROOT, "data", "Testing.csv")
+
+
+@pytest.fixture(scope="session")
+def predictor():
+    # Trained once from data/ rather than loaded from models/, which isn't
+    # committed and may hold a bundle trained on other data. No cache or
+    # posterior table, so every call reaches the models.
+    predictor = DiseasePredictor()
+    predictor.train(TRAINING_DATA_PATH)
+    return predictor
+
+
+@pytest.fixture(scope="session")
+def testing_rows(predictor):
+    X, _, _ = load_training_data(TESTING_DATA_PATH, predictor.symptom_columns)
+    return X
+
+
+def random_cases(predictor, n, seed=0, min_size=0, max_size=8):
+    rng = np.random.default_rng(seed)
+    symptoms = list(predictor.symptom_index)
+    sizes = rng.integers(min_size, max_size + 1, size=n)
+    return [list(rng.choice(symptoms, size=size, replace=False)) for size in sizes]
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from conftest import random_cases
+
+PARITY_TOLERANCE = 1e-9
+
+
+@pytest.fixture(scope="module")
+def compiled(predictor):
+    compiled = predictor.compile()
+    predictor.compiled = None
+    return compiled
+
+
+def max_differences(expected, actual):
+    return {name: np.abs(expected[name] - actual[name]).max() for name in expected}
+
+
+@pytest.mark.parametrize("rows", ["testing", "random"])
+def test_matches_sklearn_on_batches(predictor, compiled, testing_rows, rows):
+    if rows == "testing":
+        X = testing_rows
+    else:
+        X = predictor.symptom_matrix(random_cases(predictor, 1000))
+    expected = predictor.predict_proba_matrix(X)
+    for name, difference in max_differences(expected, compiled.predict_proba_matrix(X)).items():
+        assert difference <= PARITY_TOLERANCE, name
+
+
+def test_matches_sklearn_on_single_rows(predictor, compiled, testing_rows):
+    # Batches of up to SMALL_BATCH rows take the per-row kernels
+    X = np.vstack([testing_rows[:50], predictor.symptom_matrix(random_cases(predictor, 50, seed=1))])
+    expected = predictor.predict_proba_matrix(X)
+    for i in range(len(X)):
+        row = {name: proba[i:i + 1] for name, proba in expected.items()}
+        for name, difference in max_differences(row, compiled.predict_proba_matrix(X[i:i + 1])).items():
+            assert difference <= PARITY_TOLERANCE, (name, i)
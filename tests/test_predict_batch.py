@@ -0,0 +1,16 @@
+from conftest import random_cases
+
+
+def symptom_lists(predictor, X):
+    names = sorted(predictor.symptom_index, key=predictor.symptom_index.get)
+    return [[names[j] for j in row.nonzero()[0]] for row in X]
+
+
+def test_matches_predict_on_testing_rows(predictor, testing_rows):
+    cases = symptom_lists(predictor, testing_rows)
+    assert predictor.predict_batch(cases) == [predictor.predict(case) for case in cases]
+
+
+def test_matches_predict_with_empty_cases(predictor):
+    cases = random_cases(predictor, 200, min_size=0, max_size=6)
+    assert predictor.predict_batch(cases) == [predictor.predict(case) for case in cases]